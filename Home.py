@@ -1,8 +1,20 @@
-import streamlit as st
-import pandas as pd
-import sys
 import os
 
+import streamlit as st
+
+PAGES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "pages")
+
+
+def discover_pages():
+    """
+    Returns (path, label) of every page script in page order, read from the file names without importing them.
+    """
+    pages = []
+    for file_name in sorted(os.listdir(PAGES_DIR)):
+        if file_name.endswith(".py") and "_" in file_name:
+            label = os.path.splitext(file_name)[0].split("_", 1)[1].replace("_", " ")
+            pages.append((f"pages/{file_name}", label))
+    return pages
 
 
 st.write("# 🤖 Bamboo App")
@@ -15,12 +27,5 @@ st.write("I got features to answer your prompts, summarize documents, and compar
 
 st.write("🚀Select a functionality to get going!")
 
-pages=os.listdir("pages")
-
-for i in pages:
-    if ".py" in i:
-        file_url=f"pages/{i}"
-        label=i.split("_")[1]
-        label=label.replace("_"," ")
-        label=label.replace(".py"," ")
-        st.page_link(file_url,label=label,icon="🔗")
+for file_url, label in discover_pages():
+    st.page_link(file_url, label=label, icon="🔗")
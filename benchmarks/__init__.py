@@ -0,0 +1,4 @@
+"""
+Offline benchmarks of the Bamboo hot paths, run against a local stand-in for the Snowpark session.
+Run them from the repository root with `python -m benchmarks.run`.
+"""
@@ -0,0 +1,132 @@
+import random
+from collections import namedtuple
+
+SyntheticDocument = namedtuple('SyntheticDocument', ['file_name', 'pdf', 'paragraphs', 'pages'])
+
+VOCABULARY = """
+act amendment appropriation authority bill budget chapter commission committee compliance congress contract
+county court credit definition department director district duty education election eligibility emergency
+employee energy enforcement exemption federal fee fiscal fund grant health housing income infrastructure
+insurance jurisdiction labor law liability license local medicaid member municipal notice obligation office
+officer penalty permit program property provision public purpose record regulation report requirement
+resolution revenue safety school secretary section service state statute subsection tax term transportation
+treasury trust veteran water agency assessment benefit capital claim coverage disclosure district filing
+""".split()
+
+LINES_PER_PAGE = 48
+CHARS_PER_LINE = 90
+
+
+def synthetic_sentence(rng):
+    """
+    Returns a sentence of vocabulary words, occasionally citing a bill or section identifier.
+    """
+    words = rng.choices(VOCABULARY, k=rng.randint(8, 20))
+    if rng.random() < 0.3:
+        words.insert(rng.randrange(len(words)), rng.choice([
+            f"H.R. {rng.randint(1, 9999)}", f"S.B. {rng.randint(1, 999)}", f"section {rng.randint(1, 99)}.{rng.randint(1, 9)}"]))
+    return " ".join(words).capitalize() + "."
+
+
+def synthetic_paragraphs(rng, count):
+    """
+    Returns count paragraphs of three to seven sentences.
+    """
+    return [" ".join(synthetic_sentence(rng) for _ in range(rng.randint(3, 7))) for _ in range(count)]
+
+
+def revise(paragraphs, rng, edit_ratio=0.2):
+    """
+    Returns a revision of the paragraphs with about edit_ratio of them edited, removed or added, as a new
+    version of a bill would be.
+    """
+    revised = []
+    for paragraph in paragraphs:
+        roll = rng.random()
+        if roll < edit_ratio / 2:
+            sentences = paragraph.split(". ")
+            sentences[rng.randrange(len(sentences))] = synthetic_sentence(rng).rstrip(".")
+            revised.append(". ".join(sentences))
+        elif roll < edit_ratio * 3 / 4:
+            continue
+        else:
+            revised.append(paragraph)
+        if rng.random() < edit_ratio / 4:
+            revised.extend(synthetic_paragraphs(rng, 1))
+    return revised
+
+
+def wrap(paragraphs, width=CHARS_PER_LINE):
+    """
+    Wraps paragraphs into lines of at most width characters, with a blank line between paragraphs.
+    """
+    lines = []
+    for paragraph in paragraphs:
+        line = ""
+        for word in paragraph.split():
+            if line and len(line) + len(word) + 1 > width:
+                lines.append(line)
+                line = word
+            else:
+                line = f"{line} {word}" if line else word
+        lines.extend([line, ""])
+    return lines
+
+
+def _escape(text):
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def build_pdf(pages):
+    """
+    Returns the bytes of a PDF with one page of Helvetica text per list of lines.
+    """
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None,
+               "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for lines in pages:
+        content = "BT /F1 10 Tf 14 TL 50 750 Td " + " ".join(f"({_escape(line)}) Tj T*" for line in lines) + " ET"
+        objects.append(f"<< /Length {len(content)} >>\nstream\n{content}\nendstream")
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+                       f"/Resources << /Font << /F1 3 0 R >> >> /Contents {len(objects)} 0 R >>")
+        kids.append(f"{len(objects)} 0 R")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(kids)} >>"
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n{body}\nendobj\n".encode("latin-1")
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode("latin-1")
+    out += "".join(f"{offset:010d} 00000 n \n" for offset in offsets).encode("latin-1")
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode("latin-1")
+    return bytes(out)
+
+
+def synthetic_document(file_name, paragraphs):
+    """
+    Lays the paragraphs out into pages and returns them as a SyntheticDocument.
+    """
+    lines = wrap(paragraphs)
+    pages = [lines[start:start + LINES_PER_PAGE] for start in range(0, len(lines), LINES_PER_PAGE)]
+    return SyntheticDocument(file_name, build_pdf(pages), paragraphs, len(pages))
+
+
+def synthetic_corpus(documents, pages_per_document=8, seed=7):
+    """
+    Returns a deterministic corpus of synthetic bills of about pages_per_document pages each.
+    """
+    rng = random.Random(seed)
+    # A paragraph of five sentences wraps into about eight lines.
+    paragraphs_per_document = max(1, pages_per_document * LINES_PER_PAGE // 9)
+    return [synthetic_document(f"bill_{number:05d}.pdf", synthetic_paragraphs(rng, paragraphs_per_document))
+            for number in range(documents)]
+
+
+def stage_corpus(session, stage_path_url, corpus):
+    """
+    Uploads every document of the corpus to a stage.
+    """
+    for document in corpus:
+        session.put_stage_file(stage_path_url, document.file_name, document.pdf)
@@ -0,0 +1,316 @@
+import hashlib
+import io
+import json
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+WORD_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+def stub_embedding(text, dim=768):
+    """
+    Returns a deterministic unit-length embedding of text: a signed bag of hashed words, so texts sharing
+    words are similar the way real embeddings of them would be.
+    """
+    vector = np.zeros(dim, dtype=np.float32)
+    for word in WORD_PATTERN.findall((text or '').casefold()):
+        digest = int.from_bytes(hashlib.blake2b(word.encode('utf-8'), digest_size=8).digest(), 'little')
+        vector[digest % dim] += 1.0 if digest >> 63 else -1.0
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def stub_summary(text, max_words=60):
+    """
+    Returns the first max_words words of text, standing in for Cortex SUMMARIZE.
+    """
+    return " ".join((text or '').split()[:max_words])
+
+
+def stub_completion(model, prompt, max_words=120):
+    """
+    Returns the last max_words words of the prompt, standing in for Cortex COMPLETE.
+    """
+    return f"[{model}] " + " ".join((prompt or '').split()[-max_words:])
+
+
+def cosine_similarity(vector1, vector2):
+    vector1 = np.asarray(json.loads(vector1) if isinstance(vector1, str) else vector1, dtype=np.float32)
+    vector2 = np.asarray(json.loads(vector2) if isinstance(vector2, str) else vector2, dtype=np.float32)
+    norms = np.linalg.norm(vector1) * np.linalg.norm(vector2)
+    return float(vector1 @ vector2 / norms) if norms else 0.0
+
+
+class FakeRow:
+    def __init__(self, fields, values):
+        """
+        A result row addressable like a Snowpark Row: by position, by column name or as an attribute.
+        """
+        self._fields = fields
+        self._values = values
+
+    def _index(self, name):
+        if name in self._fields:
+            return self._fields.index(name)
+        folded = [field.casefold() for field in self._fields]
+        if name.casefold() in folded:
+            return folded.index(name.casefold())
+        raise KeyError(name)
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return self._values[self._index(key)]
+        return self._values[key]
+
+    def __getattr__(self, name):
+        try:
+            return self._values[self._index(name)]
+        except KeyError:
+            raise AttributeError(name) from None
+
+    def __iter__(self):
+        return iter(self._values)
+
+    def __len__(self):
+        return len(self._values)
+
+    def __repr__(self):
+        return "Row(" + ", ".join(f"{field}={value!r}" for field, value in zip(self._fields, self._values)) + ")"
+
+    def as_dict(self):
+        return dict(zip(self._fields, self._values))
+
+
+class FakeAsyncJob:
+    def __init__(self, future):
+        """
+        Wraps a background query like a Snowpark AsyncJob.
+        """
+        self._future = future
+
+    def is_done(self):
+        return self._future.done()
+
+    def result(self):
+        return self._future.result()
+
+
+class FakeQuery:
+    def __init__(self, session, query, params=None):
+        self.session = session
+        self.query = query
+        self.params = params
+
+    def collect(self):
+        fields, rows = self.session.execute(self.query, self.params)
+        return [FakeRow(fields, row) for row in rows]
+
+    def collect_nowait(self):
+        return FakeAsyncJob(self.session.executor.submit(self.collect))
+
+    def to_local_iterator(self):
+        return iter(self.collect())
+
+    def to_pandas(self):
+        fields, rows = self.session.execute(self.query, self.params)
+        return pd.DataFrame(rows, columns=fields)
+
+
+class FakeWriter:
+    def __init__(self, session, df):
+        self.session = session
+        self.df = df
+        self._mode = "errorifexists"
+
+    def mode(self, save_mode):
+        self._mode = save_mode
+        return self
+
+    def save_as_table(self, table_name, **kwargs):
+        if self._mode == "overwrite":
+            self.session.execute(f"DELETE FROM {table_name}")
+        self.session.insert_frame(table_name, self.df)
+
+
+class FakeDataFrame:
+    def __init__(self, session, df):
+        self.session = session
+        self.df = df
+
+    @property
+    def write(self):
+        return FakeWriter(self.session, self.df)
+
+    def to_pandas(self):
+        return self.df.copy()
+
+    def collect(self):
+        return [FakeRow(list(self.df.columns), list(row)) for row in self.df.itertuples(index=False)]
+
+
+class FakeFileOperation:
+    def __init__(self, session):
+        self.session = session
+
+    def get_stream(self, stage_location, **kwargs):
+        stage, name = stage_location.rsplit("/", 1)
+        with self.session.lock:
+            return io.BytesIO(self.session.stages[stage.upper()][name][0])
+
+    def put(self, local_file_name, stage_location, auto_compress=True, overwrite=False, **kwargs):
+        with open(local_file_name, "rb") as file:
+            data = file.read()
+        self.session.put_stage_file(stage_location, local_file_name.replace("\\", "/").rsplit("/", 1)[-1], data)
+        return []
+
+
+class FakeSession:
+    # Snowflake SQL constructs rewritten into their SQLite equivalents, in order.
+    REWRITES = [
+        (re.compile(r'SNOWFLAKE\.CORTEX\.', re.I), ''),
+        (re.compile(r'TABLE\(\s*FLATTEN\(\s*input\s*=>\s*PARSE_JSON\(\?\)\s*\)\s*\)', re.I), 'json_each(?)'),
+        (re.compile(r'\bt\.index\b', re.I), 't.key'),
+        (re.compile(r'\bvalue\[(\d+)\]', re.I), r"json_extract(value, '$[\1]')"),
+        (re.compile(r'::\w+(\([^)]*\))?'), ''),
+        (re.compile(r'PARSE_JSON\(\?\)', re.I), '?'),
+        (re.compile(r'LISTAGG\(([^)]*)\)\s*WITHIN GROUP\s*\(\s*ORDER BY [^)]*\)', re.I), r'GROUP_CONCAT(\1)'),
+        (re.compile(r'EQUAL_NULL\(([^,]+),\s*([^)]+)\)', re.I), r'(\1 IS \2)'),
+        (re.compile(r'CURRENT_TIMESTAMP\(\)', re.I), 'CURRENT_TIMESTAMP'),
+    ]
+    LIST_PATTERN = re.compile(r'^\s*list\s+(@\S+)\s*$', re.I)
+    COPY_PATTERN = re.compile(r"^\s*COPY INTO\s+(\S+)\s+FROM\s+(@\S+)\s+FILES\s*=\s*\('([^']+)'\)", re.I)
+
+    def __init__(self, database_name='BAMBOO', schema_name='BILLS', query_latency=0.0, cortex_latency=None,
+                 async_workers=8):
+        """
+        Initializes an in-memory stand-in for a Snowpark session: tables live in SQLite, stages in memory, and
+        Cortex EMBED_TEXT_768, SUMMARIZE and COMPLETE are deterministic stubs.
+        query_latency seconds are added to every statement as the network round trip, and cortex_latency maps a
+        Cortex function name to the seconds added to each of its calls. Statements run one at a time.
+        """
+        self.database_name = database_name
+        self.schema_name = schema_name
+        self.query_latency = query_latency
+        self.cortex_latency = cortex_latency or {}
+        self.query_count = 0
+        self.stages = {}
+        self.file = FakeFileOperation(self)
+        self.executor = ThreadPoolExecutor(max_workers=async_workers)
+        self.lock = threading.RLock()
+
+        self._prefix = re.compile(rf'\b{re.escape(database_name)}\.{re.escape(schema_name)}\.', re.I)
+        self._connection = sqlite3.connect(":memory:", check_same_thread=False)
+        self._register_functions()
+
+    def _register_functions(self):
+        def cortex(name, function):
+            def call(*args):
+                latency = self.cortex_latency.get(name, 0.0)
+                if latency:
+                    time.sleep(latency)
+                return function(*args)
+            return call
+
+        self._connection.create_function(
+            "EMBED_TEXT_768", 2, cortex("EMBED_TEXT_768", lambda model, text: json.dumps(stub_embedding(text).tolist())))
+        self._connection.create_function("SUMMARIZE", 1, cortex("SUMMARIZE", stub_summary))
+        self._connection.create_function("COMPLETE", 2, cortex("COMPLETE", stub_completion))
+        self._connection.create_function("VECTOR_COSINE_SIMILARITY", 2, cosine_similarity)
+        self._connection.create_function("FLOOR", 1, lambda value: None if value is None else int(np.floor(value)))
+
+    def sql(self, query, params=None):
+        return FakeQuery(self, query, params)
+
+    def create_dataframe(self, data, schema=None):
+        return FakeDataFrame(self, data if isinstance(data, pd.DataFrame) else pd.DataFrame(data, columns=schema))
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+
+    def create_table(self, table_name, columns):
+        """
+        Creates a table with the given column names; quoted names keep their case as in Snowflake.
+        """
+        self.execute(f"CREATE TABLE IF NOT EXISTS {table_name} ({', '.join(columns)})")
+
+    def table_rows(self, table_name):
+        """
+        Returns the number of rows in a table.
+        """
+        return self.execute(f"SELECT COUNT(*) FROM {table_name}")[1][0][0]
+
+    def put_stage_file(self, stage_location, name, data):
+        """
+        Uploads the bytes of a file to a stage, as PUT does.
+        """
+        stage = stage_location.rstrip("/").upper()
+        md5 = hashlib.md5(data).hexdigest()
+        with self.lock:
+            self.stages.setdefault(stage, {})[name] = (data, md5, datetime.now().strftime("%a, %d %b %Y %H:%M:%S GMT"))
+
+    def translate(self, query):
+        """
+        Rewrites the Snowflake SQL used by the apps into SQLite.
+        """
+        query = self._prefix.sub('', query)
+        for pattern, replacement in self.REWRITES:
+            query = pattern.sub(replacement, query)
+        return query
+
+    def execute(self, query, params=None):
+        """
+        Runs a statement and returns (column names, rows). Unquoted column names are upper-cased as in Snowflake.
+        """
+        if self.query_latency:
+            time.sleep(self.query_latency)
+        with self.lock:
+            self.query_count += 1
+            listing = self.LIST_PATTERN.match(query)
+            if listing:
+                return self._list_stage(listing.group(1))
+            copy = self.COPY_PATTERN.match(query)
+            if copy:
+                return self._copy_into(*copy.groups())
+
+            cursor = self._connection.execute(self.translate(query), list(params or []))
+            rows = cursor.fetchall()
+            self._connection.commit()
+            if cursor.description is None:
+                return [], []
+            fields = [name if f'"{name}"' in query else name.upper() for name, *_ in cursor.description]
+            return fields, rows
+
+    def insert_frame(self, table_name, df):
+        """
+        Appends the rows of a DataFrame to a table by column name.
+        """
+        if df.empty:
+            return
+        columns = ", ".join(f'"{column}"' for column in df.columns)
+        values = ", ".join("?" for _ in df.columns)
+        rows = df.astype(object).where(df.notna(), None).values.tolist()
+        with self.lock:
+            self.query_count += 1
+            self._connection.executemany(
+                f"INSERT INTO {self.translate(table_name)} ({columns}) VALUES ({values})", rows)
+            self._connection.commit()
+
+    def _list_stage(self, stage_location):
+        stage = stage_location.rstrip("/").upper()
+        stage_name = stage_location.rstrip("/").rsplit(".", 1)[-1]
+        rows = [(f"{stage_name}/{name}", len(data), md5, last_modified)
+                for name, (data, md5, last_modified) in sorted(self.stages.get(stage, {}).items())]
+        return ["name", "size", "md5", "last_modified"], rows
+
+    def _copy_into(self, table_name, stage_location, file_name):
+        stage = self.stages[stage_location.rstrip("/").upper()]
+        data = stage.pop(file_name)[0]
+        self.insert_frame(table_name, pd.read_parquet(io.BytesIO(data)))
+        return ["file", "status"], [(file_name, "LOADED")]
@@ -0,0 +1,128 @@
+import json
+import os
+import platform
+import subprocess
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+
+def measure(operation, items, setup=None):
+    """
+    Calls operation on every item and returns the latency of each call in seconds.
+    setup is called on each item before its call, outside the measured time.
+    """
+    latencies = []
+    for item in items:
+        if setup is not None:
+            setup(item)
+        started_at = time.perf_counter()
+        operation(item)
+        latencies.append(time.perf_counter() - started_at)
+    return latencies
+
+
+def summarize_latencies(name, documents, latencies, units, unit, **extra):
+    """
+    Returns the result record of a benchmark: latency percentiles in milliseconds and throughput in units per
+    second of measured time. extra holds further metrics, e.g. the number of statements sent.
+    """
+    latencies = np.asarray(latencies, dtype=np.float64)
+    p50, p90, p99 = np.percentile(latencies, [50, 90, 99]) * 1000
+    return {
+        'name': name,
+        'documents': documents,
+        'count': int(len(latencies)),
+        'mean_ms': float(latencies.mean() * 1000),
+        'p50_ms': float(p50),
+        'p90_ms': float(p90),
+        'p99_ms': float(p99),
+        'throughput': float(units / latencies.sum()) if latencies.sum() else 0.0,
+        'unit': unit,
+        **extra,
+    }
+
+
+def git_commit():
+    """
+    Returns the commit the benchmarks run on, or None outside a git checkout.
+    """
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_record(params, results):
+    """
+    Wraps the results of one run with when, where and on which commit it ran.
+    """
+    return {
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'params': params,
+        'results': results,
+    }
+
+
+def save_run(path, record):
+    """
+    Appends a run to the JSON lines history at path.
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "a") as f:
+        f.write(json.dumps(record) + "\n")
+
+
+def load_baseline(path, params, commit=None):
+    """
+    Returns the latest stored run with the same params, or the latest run on the given commit.
+    """
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        runs = [json.loads(line) for line in f if line.strip()]
+    if commit is not None:
+        runs = [run for run in runs if run['commit'] == commit]
+    else:
+        runs = [run for run in runs if run['params'] == params]
+    return runs[-1] if runs else None
+
+
+def format_results(results):
+    """
+    Formats results as a fixed width table.
+    """
+    lines = [f"{'benchmark':<32}{'docs':>6}{'n':>6}{'mean ms':>11}{'p50 ms':>11}{'p90 ms':>11}{'p99 ms':>11}"
+             f"{'throughput':>16}"]
+    for result in results:
+        lines.append(f"{result['name']:<32}{result['documents']:>6}{result['count']:>6}{result['mean_ms']:>11.2f}"
+                     f"{result['p50_ms']:>11.2f}{result['p90_ms']:>11.2f}{result['p99_ms']:>11.2f}"
+                     f"{result['throughput']:>10.1f} {result['unit']}/s")
+    return "\n".join(lines)
+
+
+def compare_runs(results, baseline, threshold=0.1):
+    """
+    Compares results with a baseline run and returns (report lines, regressions). A benchmark regresses when
+    its p50 latency grows, or its throughput drops, by more than threshold.
+    """
+    previous = {(result['name'], result['documents']): result for result in baseline['results']}
+    lines = [f"Compared with {baseline['commit']} ({baseline['timestamp']}):"]
+    regressions = []
+    for result in results:
+        before = previous.get((result['name'], result['documents']))
+        if before is None:
+            continue
+        p50_change = result['p50_ms'] / before['p50_ms'] - 1 if before['p50_ms'] else 0.0
+        throughput_change = result['throughput'] / before['throughput'] - 1 if before['throughput'] else 0.0
+        regressed = p50_change > threshold or throughput_change < -threshold
+        if regressed:
+            regressions.append(result)
+        lines.append(f"{result['name']:<32}{result['documents']:>6}  p50 {p50_change:+8.1%}  "
+                     f"throughput {throughput_change:+8.1%}{'  REGRESSION' if regressed else ''}")
+    return lines, regressions
@@ -0,0 +1,427 @@
+import argparse
+import importlib.util
+import io
+import os
+import json
+import random
+import subprocess
+import sys
+import time
+
+from benchmarks.corpus import revise, stage_corpus, synthetic_corpus
+from benchmarks.fake_session import FakeSession
+from benchmarks.harness import (compare_runs, format_results, load_baseline, measure, run_record, save_run,
+                                summarize_latencies)
+from utils.config import load_config
+from utils.ingestion import SummaryIngestor, iter_chunks
+from utils.lexical_index import BM25Index
+from utils.pdf_extract import iter_pdf_pages, read_pdf
+from utils.summarizer import DocumentSummarizer
+from utils.vector_index import VectorIndex
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CORTEX_FUNCTIONS = ('EMBED_TEXT_768', 'SUMMARIZE', 'COMPLETE')
+STARTUP_SCRIPTS = [('Home', 'Home.py'), ('Document Search', 'pages/1_Document Search.py'),
+                   ('Document Summary', 'pages/2_Document Summary.py'),
+                   ('Document Difference', 'pages/3_Document Difference.py')]
+# Ingestion-only dependencies that the app's own code may not import before it ingests something. Snowpark
+# loads pandas, pyarrow and pytz itself, so whether they are in sys.modules says nothing about the app: the
+# guard records the import statements the app's own modules run during start-up instead.
+LAZY_MODULES = ('langchain', 'PyPDF2', 'pandas', 'pyarrow', 'pytz')
+COLD_IMPORT = '''
+import builtins, importlib.util, json, sys, time
+root, lazy_modules = sys.argv[2], set(sys.argv[3:])
+eager_imports = set()
+builtin_import = builtins.__import__
+
+def tracking_import(name, globals=None, locals=None, fromlist=(), level=0):
+    module = name.partition(".")[0]
+    if level == 0 and module in lazy_modules and (globals or {}).get("__file__", "").startswith(root):
+        eager_imports.add(module)
+    return builtin_import(name, globals, locals, fromlist, level)
+
+builtins.__import__ = tracking_import
+started_at = time.perf_counter()
+spec = importlib.util.spec_from_file_location("startup_script", sys.argv[1])
+spec.loader.exec_module(importlib.util.module_from_spec(spec))
+print(json.dumps({"seconds": time.perf_counter() - started_at, "loaded": sorted(eager_imports)}))
+'''
+
+
+def load_page(file_name, module_name):
+    """
+    Imports a Streamlit page as a module without running it.
+    """
+    spec = importlib.util.spec_from_file_location(module_name, os.path.join(ROOT, 'pages', file_name))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def cold_import(path):
+    """
+    Executes a script without running its main() in a fresh interpreter, and returns (seconds, lazy modules
+    that the app's own code imported).
+    """
+    completed = subprocess.run([sys.executable, "-c", COLD_IMPORT, path, ROOT + os.sep, *LAZY_MODULES], cwd=ROOT,
+                               capture_output=True, text=True, check=True)
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    return result['seconds'], result['loaded']
+
+
+def table(config, name):
+    """
+    Returns the fully qualified name of a table in the configured database and schema.
+    """
+    db_schema = config['db_schema']
+    return f"{db_schema['database_name']}.{db_schema['schema_name']}.{name}"
+
+
+def create_tables(session, config):
+    """
+    Creates the tables of setup/setup.py that the benchmarked paths read and write.
+    """
+    db_schema, rag, summary, compare = (config['db_schema'], config['rag_app'], config['summary_app'],
+                                        config['compare_app'])
+    chunk_columns = ['"chunks"', '"file_path"', '"file_name"', '"date"', '"time"', '"chunk_index"']
+    summary_columns = ['"file_name"', 'SUMMARIZED_CHUNK', '"chunks"', '"chunk_index"']
+    tables = {
+        db_schema.get('manifest_table', 'STAGE_MANIFEST'):
+            ['"consumer"', '"file_name"', '"md5"', '"size"', '"last_modified"'],
+        db_schema.get('pages_table', 'PDF_PAGES'):
+            ['"file_path"', '"file_name"', '"page_number"', '"start_offset"', '"text"', '"date"', '"time"'],
+        rag['chunk_table_name']: chunk_columns,
+        rag['vector_store_table']: ['"file_name"', '"chunks"', 'VECTOR_EMBEDINGS', '"chunk_index"'],
+        rag.get('tags_table', 'DOCUMENT_TAGS'): ['"file_name"', '"tag"'],
+        summary['chunked_table']: chunk_columns,
+        summary['summary_table']: summary_columns,
+        summary.get('levels_table', 'SUMMARY_LEVELS'): ['"file_name"', '"level"', '"group_index"', '"summary"'],
+        compare['chunked_table']: chunk_columns,
+        compare['summary_table']: summary_columns,
+    }
+    for name, columns in tables.items():
+        session.create_table(table(config, name), columns)
+
+
+def new_session(options, config, corpus):
+    """
+    Returns a FakeSession with the app tables created and the corpus uploaded to every app's stage.
+    """
+    db_schema = config['db_schema']
+    session = FakeSession(
+        db_schema['database_name'],
+        db_schema['schema_name'],
+        query_latency=options.query_latency_ms / 1000,
+        cortex_latency={name: options.cortex_latency_ms / 1000 for name in CORTEX_FUNCTIONS}
+    )
+    create_tables(session, config)
+    for app in ('rag_app', 'summary_app', 'compare_app'):
+        stage_corpus(session, f"@{table(config, config[app]['stage_path'])}", corpus)
+    return session
+
+
+def search_app(pages, session, config, **kwargs):
+    """
+    Returns a RAGSearchApp configured as the Document Search page configures it.
+    """
+    db_schema, rag = config['db_schema'], config['rag_app']
+    return pages['search'].RAGSearchApp(
+        session,
+        slide_window_hist=rag['slide_window_hist'],
+        model_name=rag['model_name'],
+        stage_path=rag['stage_path'],
+        database_name=db_schema['database_name'],
+        schema_name=db_schema['schema_name'],
+        chunk_table_name=rag['chunk_table_name'],
+        vector_store_table=rag['vector_store_table'],
+        embed_model_name=rag['embed_model_name'],
+        download_workers=rag.get('ingest_download_workers', 4),
+        parse_workers=rag.get('ingest_parse_workers'),
+        write_batch_size=rag.get('ingest_write_batch_size', 20),
+        bulk_flush_rows=rag.get('ingest_bulk_flush_rows', 50000),
+        manifest_table=db_schema.get('manifest_table', 'STAGE_MANIFEST'),
+        top_k=rag.get('top_k', 1),
+        use_mmr=rag.get('use_mmr', False),
+        mmr_diversity=rag.get('mmr_diversity', 0.3),
+        mmr_fetch_k=rag.get('mmr_fetch_k', 20),
+        context_token_budget=rag.get('context_token_budget'),
+        chunk_size=rag.get('chunk_size', 10000),
+        chunk_overlap=rag.get('chunk_overlap', 500),
+        chunk_unit=rag.get('chunk_unit', 'chars'),
+        lexical_candidates=rag.get('lexical_candidates', 200),
+        tags_table=rag.get('tags_table', 'DOCUMENT_TAGS'),
+        **kwargs
+    )
+
+
+def synthetic_questions(corpus, count, seed):
+    """
+    Returns count distinct questions made of words drawn from the corpus.
+    """
+    rng = random.Random(seed)
+    questions = set()
+    while len(questions) < count:
+        words = rng.choice(rng.choice(corpus).paragraphs).split()
+        questions.add("What does the bill say about " + " ".join(rng.sample(words, min(6, len(words)))) + "?")
+    return sorted(questions)
+
+
+def bench_read_pdf(pages, corpus, options, config):
+    session = new_session(options, config, corpus)
+    stage_path_url = f"@{table(config, config['rag_app']['stage_path'])}"
+    latencies = measure(lambda document: read_pdf(session, f"{stage_path_url}/{document.file_name}"),
+                        corpus * options.repeats)
+    return [summarize_latencies('read_pdf', len(corpus), latencies,
+                                sum(document.pages for document in corpus) * options.repeats, 'pages')]
+
+
+def bench_chunking(pages, corpus, options, config):
+    rag = config['rag_app']
+    chunk_size, chunk_overlap = rag.get('chunk_size', 10000), rag.get('chunk_overlap', 500)
+    documents = [list(iter_pdf_pages(io.BytesIO(document.pdf))) for document in corpus]
+    megabytes = sum(len(page.text) for document_pages in documents for page in document_pages) / 1e6
+    variants = [('chunking', lambda document_pages: list(
+        iter_chunks(document_pages, chunk_size, chunk_overlap, rag.get('chunk_unit', 'chars'))))]
+    try:
+        from langchain.text_splitter import RecursiveCharacterTextSplitter
+    except ImportError:
+        pass
+    else:
+        # The splitter the app used before TextSplitter, kept as a reference when langchain is installed.
+        text_splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap,
+                                                       length_function=len)
+        variants.append(('chunking_langchain', lambda document_pages: text_splitter.split_text(
+            "".join(page.text for page in document_pages))))
+
+    results = []
+    for name, operation in variants:
+        latencies = measure(operation, documents * options.repeats)
+        results.append(summarize_latencies(name, len(corpus), latencies, megabytes * options.repeats, 'MB'))
+    return results
+
+
+def bench_load_pdf_and_vectorize(pages, corpus, options, config):
+    latencies = []
+    for _ in range(options.repeats):
+        session = new_session(options, config, corpus)
+        app = search_app(pages, session, config, vector_index=VectorIndex(), lexical_index=BM25Index())
+        statements = session.query_count
+        latencies.extend(measure(lambda app: app.load_pdf_and_vectorize(), [app]))
+        statements = session.query_count - statements
+        session.close()
+    return [summarize_latencies('load_pdf_and_vectorize', len(corpus), latencies, len(corpus) * options.repeats,
+                                'files', statements=statements)]
+
+
+def bench_get_similar_chunks(pages, corpus, options, config):
+    rag = config['rag_app']
+    session = new_session(options, config, corpus)
+    search_app(pages, session, config).load_pdf_and_vectorize()
+    questions = synthetic_questions(corpus, options.queries, options.seed)
+
+    lexical_index = None
+    if rag.get('use_lexical_prefilter'):
+        lexical_index = BM25Index.load_from_table(session, table(config, rag['chunk_table_name']))
+    variants = [
+        ('get_similar_chunks', dict(
+            vector_index=VectorIndex.load_from_table(session, table(config, rag['vector_store_table']),
+                                                     n_probe=rag.get('vector_index_probes', 8)),
+            lexical_index=lexical_index)),
+        ('get_similar_chunks_sql', dict(lexical_index=lexical_index)),
+    ]
+    results = []
+    for name, kwargs in variants:
+        app = search_app(pages, session, config, **kwargs)
+        latencies = measure(app.get_similar_chunks, questions)
+        results.append(summarize_latencies(name, len(corpus), latencies, len(questions), 'queries'))
+    session.close()
+    return results
+
+
+def bench_summarize(pages, corpus, options, config):
+    db_schema, summary = config['db_schema'], config['summary_app']
+    session = new_session(options, config, corpus)
+    SummaryIngestor(
+        session,
+        stage_path=summary['stage_path'],
+        database_name=db_schema['database_name'],
+        schema_name=db_schema['schema_name'],
+        chunked_table=summary['chunked_table'],
+        summary_table=summary['summary_table'],
+        manifest_table=db_schema.get('manifest_table', 'STAGE_MANIFEST'),
+        levels_table=summary.get('levels_table', 'SUMMARY_LEVELS'),
+        pages_table=db_schema.get('pages_table', 'PDF_PAGES'),
+        chunk_size=summary.get('chunk_size', 30000),
+        chunk_overlap=summary.get('chunk_overlap', 1000),
+        chunk_unit=summary.get('chunk_unit', 'chars')
+    ).sync()
+    summarizer = DocumentSummarizer(
+        session,
+        database_name=db_schema['database_name'],
+        schema_name=db_schema['schema_name'],
+        chunked_table=summary['chunked_table'],
+        summary_table=summary['summary_table']
+    )
+
+    def forget_summary(document):
+        session.sql(f'DELETE FROM {table(config, summary["summary_table"])} WHERE "file_name" = ?',
+                    params=[document.file_name.replace('.pdf', '')]).collect()
+
+    latencies = measure(lambda document: summarizer.summarize(document.file_name), corpus * options.repeats,
+                        setup=forget_summary)
+    session.close()
+    return [summarize_latencies('summarize', len(corpus), latencies, len(corpus) * options.repeats, 'files')]
+
+
+def bench_get_answer_reka(pages, corpus, options, config):
+    db_schema, compare = config['db_schema'], config['compare_app']
+    session = new_session(options, config, corpus)
+    app = pages['difference'].DocumentDifferenceApp(
+        session,
+        stage_path=compare['stage_path'],
+        database_name=db_schema['database_name'],
+        schema_name=db_schema['schema_name'],
+        chunked_table=compare['chunked_table'],
+        summary_table=compare['summary_table'],
+        manifest_table=db_schema.get('manifest_table', 'STAGE_MANIFEST'),
+        model_name=compare.get('model_name', 'reka-flash'),
+        diff_similarity_threshold=compare.get('diff_similarity_threshold', 0.4),
+        max_prompt_chars=compare.get('max_prompt_chars', 24000)
+    )
+    rng = random.Random(options.seed)
+    pairs = [("\n\n".join(document.paragraphs), "\n\n".join(revise(document.paragraphs, rng)), document.file_name)
+             for document in corpus]
+    latencies = measure(lambda pair: app.get_answer_reka(pair[0], pair[1], pair[2], f"revised_{pair[2]}"),
+                        pairs * options.repeats)
+    session.close()
+    return [summarize_latencies('get_answer_reka', len(corpus), latencies, len(pairs) * options.repeats, 'pairs')]
+
+
+def bench_import_time(pages, options):
+    """
+    Measures the cold start of every script in a fresh interpreter, and the per-rerun cost of executing it
+    again once its imports are cached, as Streamlit does on every interaction.
+    """
+    results = []
+    for name, script in STARTUP_SCRIPTS:
+        path = os.path.join(ROOT, script)
+        latencies = []
+        eager_imports = set()
+        for _ in range(options.repeats):
+            seconds, loaded = cold_import(path)
+            latencies.append(seconds)
+            eager_imports.update(loaded)
+        results.append(summarize_latencies(f"cold_start:{name}", 0, latencies, options.repeats, 'starts',
+                                           eager_imports=sorted(eager_imports)))
+
+        with open(path, encoding='utf-8') as f:
+            code = compile(f.read(), path, 'exec')
+        exec(code, {'__name__': 'startup_script', '__file__': path})
+        latencies = []
+        for _ in range(options.repeats * 10):
+            started_at = time.perf_counter()
+            exec(code, {'__name__': 'startup_script', '__file__': path})
+            latencies.append(time.perf_counter() - started_at)
+        results.append(summarize_latencies(f"rerun:{name}", 0, latencies, len(latencies), 'reruns'))
+    return results
+
+
+# Benchmarks that do not depend on the corpus run once, before the corpus sizes.
+STARTUP_BENCHMARKS = {
+    'import_time': bench_import_time,
+}
+
+BENCHMARKS = {
+    'read_pdf': bench_read_pdf,
+    'chunking': bench_chunking,
+    'load_pdf_and_vectorize': bench_load_pdf_and_vectorize,
+    'get_similar_chunks': bench_get_similar_chunks,
+    'summarize': bench_summarize,
+    'get_answer_reka': bench_get_answer_reka,
+}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Benchmarks the app's hot paths on synthetic PDF corpora against a local stand-in for "
+                    "Snowflake, and compares the results with earlier runs.")
+    parser.add_argument('--documents', default='5,20,80',
+                        help="comma separated corpus sizes, in documents (default: %(default)s)")
+    parser.add_argument('--pages', type=int, default=8, help="pages per document (default: %(default)s)")
+    parser.add_argument('--repeats', type=int, default=3, help="passes over each corpus (default: %(default)s)")
+    parser.add_argument('--queries', type=int, default=50,
+                        help="questions per get_similar_chunks run (default: %(default)s)")
+    parser.add_argument('--query-latency-ms', type=float, default=0.0,
+                        help="round trip added to every statement (default: %(default)s)")
+    parser.add_argument('--cortex-latency-ms', type=float, default=0.0,
+                        help="latency added to every Cortex function call (default: %(default)s)")
+    parser.add_argument('--seed', type=int, default=7, help="seed of the synthetic corpus (default: %(default)s)")
+    parser.add_argument('--only', default=",".join([*STARTUP_BENCHMARKS, *BENCHMARKS]),
+                        help="comma separated benchmarks to run (default: all)")
+    parser.add_argument('--config', default=os.path.join(ROOT, 'config_file.json'),
+                        help="app configuration to benchmark (default: %(default)s)")
+    parser.add_argument('--results', default=os.path.join(ROOT, 'benchmarks', 'results', 'history.jsonl'),
+                        help="JSON lines file the runs are appended to (default: %(default)s)")
+    parser.add_argument('--no-save', action='store_true', help="do not store this run")
+    parser.add_argument('--baseline', help="commit to compare with (default: the last run with the same options)")
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help="relative p50 or throughput change reported as a regression (default: %(default)s)")
+    parser.add_argument('--fail-on-regression', action='store_true',
+                        help="exit with status 1 when a benchmark regresses")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    options = parse_args(argv)
+    config = load_config(options.config)
+    names = [name.strip() for name in options.only.split(",") if name.strip()]
+    unknown = set(names) - set(BENCHMARKS) - set(STARTUP_BENCHMARKS)
+    if unknown:
+        raise SystemExit(f"Unknown benchmarks: {', '.join(sorted(unknown))}")
+
+    pages = {
+        'search': load_page('1_Document Search.py', 'document_search_page'),
+        'difference': load_page('3_Document Difference.py', 'document_difference_page'),
+    }
+
+    results = []
+    for name in names:
+        if name in STARTUP_BENCHMARKS:
+            latest = STARTUP_BENCHMARKS[name](pages, options)
+            print("\n".join(format_results(latest).splitlines()[1:]), flush=True)
+            results.extend(latest)
+
+    for documents in [int(size) for size in options.documents.split(",")]:
+        corpus = synthetic_corpus(documents, options.pages, options.seed)
+        for name in names:
+            if name not in BENCHMARKS:
+                continue
+            latest = BENCHMARKS[name](pages, corpus, options, config)
+            print("\n".join(format_results(latest).splitlines()[1:]), flush=True)
+            results.extend(latest)
+
+    print()
+    print(format_results(results))
+
+    params = {key: value for key, value in vars(options).items()
+              if key not in ('results', 'no_save', 'baseline', 'threshold', 'fail_on_regression', 'config')}
+    baseline = load_baseline(options.results, params, options.baseline)
+    regressions = []
+    if baseline is not None:
+        lines, regressions = compare_runs(results, baseline, options.threshold)
+        print()
+        print("\n".join(lines))
+
+    eager = [result for result in results if result.get('eager_imports')]
+    for result in eager:
+        print(f"{result['name']} imports {', '.join(result['eager_imports'])} before ingesting anything")
+    regressions.extend(eager)
+
+    if not options.no_save:
+        save_run(options.results, run_record(params, results))
+    if regressions and options.fail_on_regression:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
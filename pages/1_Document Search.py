@@ -1,24 +1,48 @@
 import streamlit as st
-from snowflake.snowpark import Session
-from snowflake.snowpark.context import get_active_session
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-import PyPDF2
-import io
-import pandas as pd
-from datetime import datetime
-import pytz
-from dotenv import load_dotenv
-import os
 import json
+import time
+from utils.manifest import placeholders
+from utils.completion import CompletionStream, CortexBackend, get_completion_backend
+from utils.config import load_config
+from utils.embedding import QueryEmbedder, vector_literal
+from utils.ingestion import RAGIngestor
+from utils.ingestion_worker import JOB_RAG_SYNC, get_ingestion_worker
+from utils.pdf_extract import read_pdf
+from utils.semantic_cache import SemanticCache
+from utils.session import get_session_pool
+from utils.tracing import traced_request, tracer
+from utils.lexical_index import BM25Index
+from utils.retrieval import Passage, SearchFilter, mmr, pack_context
+from utils.vector_index import VectorIndex, to_vector
+
+# Document and tag filter options are also refreshed by each finished sync; the TTL catches syncs run elsewhere.
+FILTER_OPTIONS_TTL_SECONDS = 300
 
 
 class RAGSearchApp:
     def __init__(self, session, slide_window_hist=3, model_name='llama3.1-70b', 
                  stage_path='pdf_store', database_name='BAMBOO', schema_name='BILLS', 
                  chunk_table_name='CHUNKED_PDF_RAG', vector_store_table='VECTOR_STORE_RAG', 
-                 embed_model_name='e5-base-v2'):
+                 embed_model_name='e5-base-v2', vector_index=None,
+                 download_workers=4, parse_workers=None, write_batch_size=20, bulk_flush_rows=50000,
+                 manifest_table='STAGE_MANIFEST', answer_cache=None, answer_cache_table=None,
+                 query_embedder=None, completion_backend=None, top_k=1, use_mmr=False, mmr_diversity=0.3,
+                 mmr_fetch_k=20, context_token_budget=None, chunk_size=10000, chunk_overlap=500,
+                 lexical_index=None, lexical_candidates=200, tags_table='DOCUMENT_TAGS', chunk_unit='chars'):
         """
         Initializes the RAGSearchApp with the session, sliding window history, and model name.
+        When a VectorIndex is given, similarity search runs in-process and Snowflake is only used to embed the question.
+        download_workers, parse_workers and write_batch_size size the ingestion pipeline, and chunks are bulk
+        loaded every bulk_flush_rows rows.
+        manifest_table records the staged md5/size/last_modified of every ingested file.
+        answer_cache is an optional SemanticCache consulted before retrieval and completion.
+        query_embedder memoizes question embeddings; a private one is created when none is shared.
+        completion_backend streams answers; it defaults to Cortex COMPLETE on this session.
+        top_k passages are retrieved per question (diversified with MMR over mmr_fetch_k candidates when use_mmr
+        is set) and packed into context_token_budget tokens. chunk_size and chunk_overlap size ingested chunks,
+        in chunk_unit ('chars' or 'tokens').
+        When a BM25Index is given, vector scoring is restricted to its lexical_candidates best keyword matches.
+        tags_table holds the document tags searches can be filtered on.
         """
         self.session = session
         self.slide_window_hist = slide_window_hist
@@ -30,23 +54,46 @@ class RAGSearchApp:
         self.chunk_table_name = chunk_table_name
         self.vector_store_table = vector_store_table
         self.embed_model_name = embed_model_name
+        self.vector_index = vector_index
+        self.answer_cache = answer_cache
+        self.query_embedder = query_embedder or QueryEmbedder(embed_model_name)
+        self.completion_backend = completion_backend or CortexBackend(session)
+        self.top_k = top_k
+        self.use_mmr = use_mmr
+        self.mmr_diversity = mmr_diversity
+        self.mmr_fetch_k = mmr_fetch_k
+        self.context_token_budget = context_token_budget
+        self.lexical_index = lexical_index
+        self.lexical_candidates = lexical_candidates
+        self.tags_table = tags_table
+        self.ingestor = RAGIngestor(
+            session,
+            stage_path=stage_path,
+            database_name=database_name,
+            schema_name=schema_name,
+            chunk_table_name=chunk_table_name,
+            vector_store_table=vector_store_table,
+            embed_model_name=embed_model_name,
+            manifest_table=manifest_table,
+            vector_index=vector_index,
+            download_workers=download_workers,
+            parse_workers=parse_workers,
+            write_batch_size=write_batch_size,
+            bulk_flush_rows=bulk_flush_rows,
+            answer_cache=answer_cache,
+            answer_cache_table=answer_cache_table,
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap,
+            chunk_unit=chunk_unit,
+            lexical_index=lexical_index,
+            tags_table=tags_table
+        )
 
     def read_pdf(self, file_url):
         """
         Reads a PDF file from the given file URL and extracts text.
         """
-        with self.session.file.get_stream(file_url) as file:
-            buffer = io.BytesIO(file.read())
-
-        reader = PyPDF2.PdfReader(buffer)
-        text = ""
-        for page in reader.pages:
-            try:
-                text += page.extract_text().replace('\n', ' ').replace('\0', ' ')
-            except:
-                text = "Unable to Extract"
-
-        return text
+        return read_pdf(self.session, file_url)
 
     def split_text(self,text):
         """
@@ -61,54 +108,14 @@ class RAGSearchApp:
         """
         return text + ".pdf"
 
+    @tracer.traced()
     def load_pdf_and_vectorize(self):
         """
         Loads PDFs and vectorizes them for search.
         """
+        self.ingestor.sync()
 
-        doc_names = self.session.sql(f"list {self.stage_path_url}").collect()
-        doc_df = pd.DataFrame(doc_names)
-
-        doc_list = doc_df['name'].apply(self.split_text).to_list()
-
-        doc_list_chunked = self.session.sql(
-            f'SELECT DISTINCT "file_name" from "{self.database_name}"."{self.schema_name}"."{self.chunk_table_name}"').to_pandas()
-        doc_list_chunked['file_name'] = doc_list_chunked['file_name'].apply(self.append_text)
-        doc_list_chunked = doc_list_chunked['file_name'].to_list()
-        dif_list = [x for x in doc_list if x not in doc_list_chunked]
-
-        for file_name in dif_list:
-            file_url = f'{self.stage_path_url}/{file_name}'
-            text = self.read_pdf(file_url)
-
-            text_splitter = RecursiveCharacterTextSplitter(
-                chunk_size=10000,  # Adjust this as you see fit
-                chunk_overlap=500,  # This lets text have some form of overlap. Useful for keeping chunks contextual
-                length_function=len
-            )
-
-            chunks = text_splitter.split_text(text)
-            df = pd.DataFrame(chunks, columns=['chunks'])
-            df['file_path'] = file_url
-            df['file_name'] = file_url.split("/")[1].replace('.pdf', '')
-
-            chicago_timezone = pytz.timezone("America/Chicago")
-            # Get the current time in Chicago
-            chicago_time = datetime.now(chicago_timezone)
-            df['date'] = chicago_time.strftime("%Y-%m-%d")
-            df['time'] = chicago_time.strftime("%I:%M:%S %p")
-
-            tbl_write = self.session.create_dataframe(df)
-            tbl_write.write.mode("append").save_as_table(f"{self.database_name}.{self.schema_name}.{self.chunk_table_name}")
-
-            file_name_without_pdf = file_name.replace('.pdf', '')
-
-            temp_sql = self.session.sql(
-                f'''select "file_name","chunks",SNOWFLAKE.CORTEX.EMBED_TEXT_768('{self.embed_model_name}', "chunks") as vector_embedings 
-                from {self.database_name}.{self.schema_name}.{self.chunk_table_name} where "file_name"='{file_name_without_pdf}' ''').to_pandas()
-            tbl_write = self.session.create_dataframe(temp_sql)
-            tbl_write.write.mode("append").save_as_table(f"{self.database_name}.{self.schema_name}.{self.vector_store_table}")
-
+    @tracer.traced()
     def summarize_question_with_history(self, chat_history, question):
         """
         Summarizes the question with the chat history to provide context.
@@ -133,52 +140,220 @@ class RAGSearchApp:
 
         return summary.replace("'", "")
 
-    def get_similar_chunks(self, question):
+    @tracer.traced()
+    def embed_question(self, question):
+        """
+        Embeds the question with the configured Cortex embedding model, reusing memoized embeddings.
+        """
+        return self.query_embedder.embed(self.session, question)
+
+    def embed_questions(self, questions):
+        """
+        Embeds many questions with one Cortex query per batch, e.g. for offline evaluation.
+        """
+        return self.query_embedder.embed_many(self.session, questions)
+
+    def get_doc_list(self, generation=0):
+        """
+        Returns the names of the ingested documents, cached until the next sync (generation) or the TTL.
+        """
+        return load_doc_list(self.session, f"{self.database_name}.{self.schema_name}.{self.chunk_table_name}",
+                             generation)
+
+    def get_tags(self, generation=0):
         """
-        Retrieves similar chunks from the vector store based on the question.
+        Returns every tag in use, cached until tags are added, the next sync (generation) or the TTL.
         """
-        cmd = f"""
-        with results as
-        (SELECT "file_name",
-           VECTOR_COSINE_SIMILARITY("VECTOR_EMBEDINGS"::VECTOR(FLOAT, 768),
-                    SNOWFLAKE.CORTEX.EMBED_TEXT_768('{self.embed_model_name}', ?)) as similarity,
-           "chunks"
-        from {self.database_name}.{self.schema_name}.{self.vector_store_table}
-        order by similarity desc
-        limit 1)
-        select "chunks", "file_name" from results 
+        return load_tags(self.session, f"{self.database_name}.{self.schema_name}.{self.tags_table}", generation)
+
+    def add_tags(self, file_name, tags):
+        """
+        Tags a document, ignoring tags it already has.
+        """
+        tags = sorted({tag.strip() for tag in tags if tag.strip()})
+        if not tags:
+            return
+        self.session.sql(f'''
+            INSERT INTO {self.database_name}.{self.schema_name}.{self.tags_table} ("file_name", "tag")
+            SELECT ?, value::VARCHAR FROM TABLE(FLATTEN(input => PARSE_JSON(?)))
+            WHERE value::VARCHAR NOT IN (
+                SELECT "tag" FROM {self.database_name}.{self.schema_name}.{self.tags_table} WHERE "file_name" = ?
+            )
+        ''', params=[file_name, json.dumps(tags), file_name]).collect()
+        load_tags.clear()
+
+    def resolve_filter(self, filters):
+        """
+        Returns the set of document names matching every condition of a SearchFilter, or None when it is empty.
+        """
+        if filters is None or not any(filters):
+            return None
+
+        conditions, params = [], []
+        if filters.file_names:
+            conditions.append(f'"file_name" IN ({placeholders(filters.file_names)})')
+            params.extend(filters.file_names)
+        # "date" is the ingestion date as YYYY-MM-DD, so it compares as a string.
+        if filters.date_from:
+            conditions.append('"date" >= ?')
+            params.append(str(filters.date_from))
+        if filters.date_to:
+            conditions.append('"date" <= ?')
+            params.append(str(filters.date_to))
+        if filters.tags:
+            conditions.append(f'''"file_name" IN (
+                SELECT "file_name" FROM {self.database_name}.{self.schema_name}.{self.tags_table}
+                WHERE "tag" IN ({placeholders(filters.tags)}))''')
+            params.extend(filters.tags)
+
+        rows = self.session.sql(f'''
+            SELECT DISTINCT "file_name" FROM {self.database_name}.{self.schema_name}.{self.chunk_table_name}
+            WHERE {' AND '.join(conditions)}
+        ''', params=params).collect()
+        return {row['file_name'] for row in rows}
+
+    @tracer.traced()
+    def retrieve(self, question, query_vector=None, filters=None):
+        """
+        Returns the top_k passages most similar to the question, re-ranked with MMR when enabled.
+        Only documents matching the SearchFilter are searched.
+        """
+        file_names = self.resolve_filter(filters)
+        if file_names is not None and not file_names:
+            return []
+
+        if query_vector is None:
+            query_vector = self.embed_question(question)
+        fetch_k = max(self.top_k, self.mmr_fetch_k) if self.use_mmr else self.top_k
+        restrict_to = self.lexical_prefilter(question, fetch_k, file_names)
+
+        if self.vector_index is not None and len(self.vector_index):
+            matches = self.vector_index.search(query_vector, k=fetch_k, return_vectors=True, restrict_to=restrict_to,
+                                               file_names=file_names)
+            passages = [Passage(*match) for match in matches]
+        else:
+            params = [vector_literal(query_vector)]
+            candidates = ""
+            if restrict_to is not None:
+                candidates = """
+                JOIN (SELECT value[0]::VARCHAR AS "key_file", value[1]::NUMBER AS "key_index"
+                      FROM TABLE(FLATTEN(input => PARSE_JSON(?)))) k
+                ON v."file_name" = k."key_file" AND v."chunk_index" = k."key_index"
+                """
+                params.append(json.dumps([[file_name, int(chunk_index)] for file_name, chunk_index in restrict_to]))
+
+            # The tables are clustered by "file_name", so a document filter prunes micro-partitions.
+            where = ""
+            if file_names is not None:
+                where = f'WHERE v."file_name" IN ({placeholders(file_names)})'
+                params.extend(sorted(file_names))
+
+            # Chunk embeddings are only fetched when MMR needs them.
+            cmd = f"""
+            SELECT v."file_name", v."chunks"{', v.VECTOR_EMBEDINGS' if self.use_mmr else ''},
+               VECTOR_COSINE_SIMILARITY(v.VECTOR_EMBEDINGS, PARSE_JSON(?)::ARRAY::VECTOR(FLOAT, 768)) as similarity
+            from {self.database_name}.{self.schema_name}.{self.vector_store_table} v
+            {candidates}
+            {where}
+            order by similarity desc
+            limit {int(fetch_k)}
+            """
+            rows = self.session.sql(cmd, params=params).collect()
+            passages = [Passage(row['SIMILARITY'], row['file_name'], row['chunks'],
+                                to_vector(row['VECTOR_EMBEDINGS']) if self.use_mmr else None)
+                        for row in rows]
+
+        if self.use_mmr:
+            return mmr(query_vector, passages, self.top_k, self.mmr_diversity)
+        return passages[:self.top_k]
+
+    def lexical_prefilter(self, question, min_candidates, file_names=None):
+        """
+        Returns the (file_name, chunk_index) keys of the chunks best matching the question's keywords, or None
+        to score every chunk when there is no lexical index, the keyword signal is too weak, or the index could
+        not key some chunks, which a prefilter would then hide.
+        file_names limits the matches to the given documents.
         """
-        df_chunks = self.session.sql(cmd, params=[question]).to_pandas()
+        if self.lexical_index is None or self.lexical_index.unkeyed:
+            return None
+        matches = self.lexical_index.search(question, k=self.lexical_candidates)
+        if file_names is not None:
+            matches = [match for match in matches if match[1] in file_names]
+        if len(matches) < min_candidates:
+            return None
+        return [(file_name, chunk_index) for _, file_name, chunk_index in matches]
+
+    @tracer.traced()
+    def get_similar_chunks(self, question, query_vector=None, filters=None):
+        """
+        Retrieves similar chunks from the vector store based on the question, packed into the context token budget.
+        Returns the context and the reference file names, most relevant first.
+        """
+        passages = pack_context(self.retrieve(question, query_vector, filters), self.context_token_budget)
+        if not passages:
+            return "", None
 
-        context = df_chunks['chunks'][0].replace("'", "")
-        file_name = df_chunks['file_name'][0]
+        context = "\n\n".join(passage.text for passage in passages).replace("'", "")
+        file_name = ", ".join(dict.fromkeys(passage.file_name for passage in passages))
 
         return context, file_name
 
-    def complete(self, myquestion):
+    def complete(self, myquestion, filters=None):
         """
         Completes the query using the language model and returns the response and file name.
         """
-        prompt, file_name = self.create_prompt(myquestion)
-        cmd = "select snowflake.cortex.complete(?, ?) as response"
-        list_response = self.session.sql(cmd, params=[self.model_name, prompt]).collect()
-        return list_response[0]['RESPONSE'], file_name
+        stream, file_name = self.complete_stream(myquestion, filters)
+        return "".join(stream), file_name
 
-    def create_prompt(self, myquestion):
+    @tracer.traced()
+    def complete_stream(self, myquestion, filters=None):
         """
-        Creates the prompt for the language model based on the question and chat history.
+        Retrieves the context and returns a CompletionStream of the answer together with the reference file name.
+        The stream measures time to first token from the moment the question was received.
+        Semantically equivalent questions are answered from the answer cache when one is configured;
+        filtered searches bypass it, since cached answers were drawn from the whole store.
+        """
+        started_at = time.perf_counter()
+        chat_history, search_question = self.get_search_question(myquestion)
+        use_cache = self.answer_cache is not None and (filters is None or not any(filters))
+
+        query_vector = None
+        if use_cache:
+            query_vector = self.embed_question(search_question)
+            cached = self.answer_cache.lookup(query_vector, search_question)
+            if cached is not None:
+                response, file_name = cached
+                return CompletionStream(iter([response]), started_at=started_at), file_name
+
+        prompt, file_name = self.create_prompt(myquestion, chat_history, search_question, query_vector, filters)
+
+        def store_answer(response):
+            self.answer_cache.store(search_question, query_vector, response, file_name, session=self.session)
+
+        on_complete = store_answer if use_cache else None
+
+        tokens = self.completion_backend.stream(self.model_name, prompt)
+        return CompletionStream(tokens, on_complete, started_at), file_name
+
+    def get_search_question(self, myquestion):
+        """
+        Returns the chat history and the question to search with, extended with the chat history when enabled.
         """
         chat_history = ""
         if st.session_state.use_chat_history:
             st_session = StreamlitSession(self.slide_window_hist)
             chat_history = st_session.get_chat_history()
             if chat_history:
-                question_summary = self.summarize_question_with_history(chat_history, myquestion)
-                prompt_context, file_name = self.get_similar_chunks(question_summary)
-            else:
-                prompt_context, file_name = self.get_similar_chunks(myquestion)
-        else:
-            prompt_context, file_name = self.get_similar_chunks(myquestion)
+                return chat_history, self.summarize_question_with_history(chat_history, myquestion)
+        return chat_history, myquestion
+
+    def create_prompt(self, myquestion, chat_history=None, search_question=None, query_vector=None, filters=None):
+        """
+        Creates the prompt for the language model based on the question and chat history.
+        """
+        if search_question is None:
+            chat_history, search_question = self.get_search_question(myquestion)
+        prompt_context, file_name = self.get_similar_chunks(search_question, query_vector, filters)
 
         prompt_template = """
         You are an expert chat assistant that extracts information from the CONTEXT provided
@@ -208,6 +383,24 @@ class RAGSearchApp:
         return prompt, file_name
 
 
+@st.cache_data(ttl=FILTER_OPTIONS_TTL_SECONDS, show_spinner=False)
+def load_doc_list(_session, table_name, generation=0):
+    """
+    Returns the distinct document names of a chunk table. generation is only part of the cache key.
+    """
+    rows = _session.sql(f'SELECT DISTINCT "file_name" FROM {table_name} ORDER BY 1').collect()
+    return [row['file_name'] for row in rows]
+
+
+@st.cache_data(ttl=FILTER_OPTIONS_TTL_SECONDS, show_spinner=False)
+def load_tags(_session, table_name, generation=0):
+    """
+    Returns the distinct tags of a tags table. generation is only part of the cache key.
+    """
+    rows = _session.sql(f'SELECT DISTINCT "tag" FROM {table_name} ORDER BY 1').collect()
+    return [row['tag'] for row in rows]
+
+
 class StreamlitSession:
     def __init__(self, slide_window):
         """
@@ -244,50 +437,77 @@ class StreamlitSession:
         return chat_history
 
 
-def main():
+@st.cache_resource(show_spinner="Loading vector index...")
+def get_vector_index(_session, table_name, n_probe=8):
     """
-    Main function to run the Streamlit app.
+    Loads the vector store into an in-process ANN index, shared across reruns and users.
     """
+    return VectorIndex.load_from_table(_session, table_name, n_probe=n_probe)
 
-    try:
 
-        # Define the path to the .env file
-        env_path = os.path.join(os.path.dirname(__file__), '..', '.env')
+@st.cache_resource(show_spinner=False)
+def get_answer_cache(_session, table_name=None, similarity_threshold=0.95, ttl_seconds=86400, max_entries=1000):
+    """
+    Returns the semantic answer cache shared across reruns and users, loaded from table_name when persisted.
+    """
+    session_pool = get_session_pool() if table_name else None
+    return SemanticCache(similarity_threshold=similarity_threshold, ttl_seconds=ttl_seconds,
+                         max_entries=max_entries, session_pool=session_pool, table_name=table_name).load(_session)
 
-        if os.path.exists(env_path):
-            # Load the .env file
-            load_dotenv(dotenv_path=env_path)
-        
-            connection_parameters = {
-        "user": os.getenv("user"),
-        "password": os.getenv("password"),
-        "account": os.getenv("account"),
-        "role": os.getenv("role"),
-        "warehouse": os.getenv("warehouse"),
-        "database": os.getenv("database"),
-        "schema": os.getenv("schema"),
-    }
-            session = Session.builder.configs(connection_parameters).create()
-        else:
 
-            connection_parameters = {
-        "user": st.secrets.db_credentials.SNOWFLAKE_USER,
-        "password": st.secrets.db_credentials.SNOWFLAKE_PASSWORD,
-        "account": st.secrets.db_credentials.SNOWFLAKE_ACCOUNT,
-        "role": st.secrets.db_credentials.SNOWFLAKE_ROLE,
-        "warehouse": st.secrets.db_credentials.SNOWFLAKE_WAREHOUSE,
-        "database": st.secrets.db_credentials.SNOWFLAKE_DATABASE,
-        "schema":st.secrets.db_credentials.SNOWFLAKE_SCHEMA,
-    }
-            
-            session = Session.builder.configs(connection_parameters).create()
-    except:
-        session = get_active_session()
-
-    
-
-    with open('config_file.json', 'r') as f:
-        config = json.load(f)
+@st.cache_resource(show_spinner="Loading keyword index...")
+def get_lexical_index(_session, table_name):
+    """
+    Loads the chunk table into an in-process BM25 index, shared across reruns and users.
+    """
+    return BM25Index.load_from_table(_session, table_name)
+
+
+@st.cache_resource(show_spinner=False)
+def get_query_embedder(model_name, max_entries=1024):
+    """
+    Returns the question embedding memo shared across reruns and users.
+    """
+    return QueryEmbedder(model_name, max_entries=max_entries)
+
+
+def render_search_filters(rag_object, generation=0):
+    """
+    Renders the document, ingestion date and tag filters in the sidebar and returns them as a SearchFilter.
+    generation counts the finished RAG syncs, so the listed documents and tags refresh after each one.
+    """
+    with st.sidebar:
+        st.subheader("Search filters")
+        doc_list = rag_object.get_doc_list(generation)
+        file_names = st.multiselect("Documents", doc_list)
+        dates = st.date_input("Ingested between", value=())
+        tags = st.multiselect("Tags", rag_object.get_tags(generation))
+
+        with st.expander("Tag a document"):
+            tag_doc = st.selectbox("Document", doc_list, index=None)
+            new_tags = st.text_input("Tags (comma separated)")
+            if st.button("Add tags") and tag_doc:
+                rag_object.add_tags(tag_doc, new_tags.split(","))
+                st.rerun()
+
+    date_from = dates[0] if len(dates) > 0 else None
+    date_to = dates[1] if len(dates) > 1 else None
+    return SearchFilter(file_names or None, date_from, date_to, tags or None)
+
+
+def main():
+    """
+    Main function to run the Streamlit app.
+    """
+    with traced_request("Document Search"), get_session_pool().session() as session:
+        run_app(session)
+
+
+def run_app(session):
+    """
+    Renders the page using a session borrowed from the shared pool.
+    """
+    config = load_config()
 
     rag_app_config = config['rag_app']
     db_schema=config['db_schema']
@@ -300,6 +520,35 @@ def main():
     vector_store_table = rag_app_config['vector_store_table']
     embed_model_name = rag_app_config['embed_model_name']
 
+    cache_config = rag_app_config.get('answer_cache', {})
+    worker = get_ingestion_worker()
+    if (rag_app_config.get('use_local_vector_index', False) or rag_app_config.get('use_lexical_prefilter', False)
+            or cache_config.get('enabled', False)):
+        # Syncs run by the headless worker are applied to the in-process indexes loaded below.
+        worker.watch_outside_syncs(session)
+
+    vector_index = None
+    if rag_app_config.get('use_local_vector_index', False):
+        vector_index = get_vector_index(
+            session, f"{database_name}.{schema_name}.{vector_store_table}",
+            n_probe=rag_app_config.get('vector_index_probes', 8))
+
+    lexical_index = None
+    if rag_app_config.get('use_lexical_prefilter', False):
+        lexical_index = get_lexical_index(session, f"{database_name}.{schema_name}.{chunk_table_name}")
+
+    answer_cache = None
+    answer_cache_table = None
+    if cache_config.get('enabled', False):
+        if cache_config.get('persist', False):
+            answer_cache_table = cache_config.get('table', 'ANSWER_CACHE')
+        answer_cache = get_answer_cache(
+            session,
+            f"{database_name}.{schema_name}.{answer_cache_table}" if answer_cache_table else None,
+            similarity_threshold=cache_config.get('similarity_threshold', 0.95),
+            ttl_seconds=cache_config.get('ttl_seconds', 86400),
+            max_entries=cache_config.get('max_entries', 1000))
+
     rag_object = RAGSearchApp(
         session=session,
         slide_window_hist=slide_window_hist,
@@ -309,10 +558,40 @@ def main():
         schema_name=schema_name,
         chunk_table_name=chunk_table_name,
         vector_store_table=vector_store_table,
-        embed_model_name=embed_model_name
+        embed_model_name=embed_model_name,
+        vector_index=vector_index,
+        download_workers=rag_app_config.get('ingest_download_workers', 4),
+        parse_workers=rag_app_config.get('ingest_parse_workers'),
+        write_batch_size=rag_app_config.get('ingest_write_batch_size', 20),
+        bulk_flush_rows=rag_app_config.get('ingest_bulk_flush_rows', 50000),
+        manifest_table=db_schema.get('manifest_table', 'STAGE_MANIFEST'),
+        answer_cache=answer_cache,
+        answer_cache_table=answer_cache_table,
+        query_embedder=get_query_embedder(embed_model_name, rag_app_config.get('query_embedding_cache_size', 1024)),
+        completion_backend=get_completion_backend(rag_app_config.get('completion_backend', 'cortex'), session,
+                                                  **rag_app_config.get('completion_backend_options', {})),
+        top_k=rag_app_config.get('top_k', 1),
+        use_mmr=rag_app_config.get('use_mmr', False),
+        mmr_diversity=rag_app_config.get('mmr_diversity', 0.3),
+        mmr_fetch_k=rag_app_config.get('mmr_fetch_k', 20),
+        context_token_budget=rag_app_config.get('context_token_budget'),
+        chunk_size=rag_app_config.get('chunk_size', 10000),
+        chunk_overlap=rag_app_config.get('chunk_overlap', 500),
+        chunk_unit=rag_app_config.get('chunk_unit', 'chars'),
+        lexical_index=lexical_index,
+        lexical_candidates=rag_app_config.get('lexical_candidates', 200),
+        tags_table=rag_app_config.get('tags_table', 'DOCUMENT_TAGS')
     )
 
-    rag_object.load_pdf_and_vectorize()
+    # New and changed documents are ingested by the background worker; questions are answered
+    # from whatever is already indexed.
+    if vector_index is not None:
+        worker.attach_vector_index(vector_index)
+    if lexical_index is not None:
+        worker.attach_lexical_index(lexical_index)
+    if answer_cache is not None:
+        worker.attach_answer_cache(answer_cache)
+    worker.submit(JOB_RAG_SYNC, throttle=True, session=session)
 
     st_session = StreamlitSession(rag_object.slide_window_hist)
     st_session.init_session_state()
@@ -322,6 +601,7 @@ def main():
 
     if session:
         st_session.init_messages()
+        filters = render_search_filters(rag_object, worker.generation(JOB_RAG_SYNC))
 
         for message in st.session_state.messages:
             with st.chat_message(message["role"]):
@@ -334,13 +614,12 @@ def main():
             with st.chat_message("assistant"):
                 question = question.replace("'", "")
                 with st.spinner("Bamboo AI thinking..."):
-                    response, file_name = rag_object.complete(question)
-                    res_text = response.replace("'", "")
-                    st.write("Reference Document: ", file_name)
-                    st.write(res_text)
+                    stream, file_name = rag_object.complete_stream(question, filters)
+                st.write("Reference Document: ", file_name)
+                res_text = st.write_stream(token.replace("'", "") for token in stream)
+                st.caption(f"Time to first token: {stream.ttft:.2f}s")
 
             st.session_state.messages.append({"role": "assistant", "content": f"Reference Doc: {file_name}\n{res_text}"})
-        session.close()
     else:
         st.error("Failed to connect to Snowflake.")
 
@@ -1,20 +1,18 @@
 import streamlit as st
-from snowflake.snowpark import Session
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-import PyPDF2
-import io
-import pandas as pd
-from datetime import datetime
-import pytz
-from dotenv import load_dotenv
-import os
-import json
-from snowflake.snowpark.context import get_active_session
+from utils.config import load_config
+from utils.ingestion import SummaryIngestor
+from utils.ingestion_worker import JOB_SUMMARY_LOAD, get_ingestion_worker, rerun_while_pending, wait_for_jobs
+from utils.pdf_extract import read_pdf
+from utils.session import get_session_pool
+from utils.summarizer import DocumentSummarizer
+from utils.tracing import traced_request
 
 class SummaryApp:
     def __init__(self, session, stage_path='pdf_store', database_name='BAMBOO', 
                  schema_name='BILLS', chunked_table='CHUNKED_PDF_SUM', 
-                 summary_table='SUMMARIZED_CONTENT'):
+                 summary_table='SUMMARIZED_CONTENT', manifest_table='STAGE_MANIFEST',
+                 summary_concurrency=8, summary_max_retries=2, levels_table='SUMMARY_LEVELS',
+                 summary_token_budget=4000):
         """
         Initializes the SummaryApp with a Snowflake session and configuration parameters.
         """
@@ -25,51 +23,27 @@ class SummaryApp:
         self.schema_name = schema_name
         self.chunked_table = chunked_table
         self.summary_table = summary_table
+        self.ingestor = SummaryIngestor(session, stage_path=stage_path, database_name=database_name,
+                                        schema_name=schema_name, chunked_table=chunked_table,
+                                        summary_table=summary_table, manifest_table=manifest_table,
+                                        levels_table=levels_table)
+        self.summarizer = DocumentSummarizer(session, database_name=database_name, schema_name=schema_name,
+                                             chunked_table=chunked_table, summary_table=summary_table,
+                                             max_concurrency=summary_concurrency, max_retries=summary_max_retries,
+                                             levels_table=levels_table, token_budget=summary_token_budget)
 
     def read_pdf(self, file_url):
         """
         Reads a PDF file from the given file URL and extracts text.
         """
-        with self.session.file.get_stream(file_url) as file:
-            buffer = io.BytesIO(file.read())
-
-        reader = PyPDF2.PdfReader(buffer)
-        text = ""
-        for page in reader.pages:
-            try:
-                text += page.extract_text().replace('\n', ' ').replace('\0', ' ')
-            except:
-                text = "Unable to Extract"
-
-        return text
+        return read_pdf(self.session, file_url)
 
     def process_load(self, file_url):
         """
-        Processes and loads the PDF text into the database if not already present.
-        """
-        file_selected = file_url.replace(f'{self.stage_path}/', '').replace('.pdf', '')
-        
-        file_list_summarized = self.session.sql(f"""
-            SELECT DISTINCT "file_name" 
-            FROM {self.database_name}.{self.schema_name}.{self.chunked_table}
-        """).to_pandas()['file_name'].tolist()
-
-        if file_selected not in file_list_summarized:
-            text = self.read_pdf(file_url)
-            text_splitter = RecursiveCharacterTextSplitter(
-                chunk_size=30000, 
-                chunk_overlap=1000, 
-                length_function=len
-            )
-            chunks = text_splitter.split_text(text)
-            df = pd.DataFrame(chunks, columns=['chunks'])
-            df['file_path'] = file_url
-            df['file_name'] = file_selected
-            df['date'] = datetime.now(pytz.timezone("America/Chicago")).strftime("%Y-%m-%d")
-            df['time'] = datetime.now(pytz.timezone("America/Chicago")).strftime("%I:%M:%S %p")
-
-            tbl_write = self.session.create_dataframe(df)
-            tbl_write.write.mode("append").save_as_table(f"{self.database_name}.{self.schema_name}.{self.chunked_table}")
+        Processes and loads the PDF text into the database if it is new or changed on the stage.
+        Rows of re-uploaded or deleted PDFs are removed from the chunk and summary tables.
+        """
+        self.ingestor.process_load(file_url.replace(f'{self.stage_path}/', ''))
 
     def split_text(self, text):
         """
@@ -81,37 +55,25 @@ class SummaryApp:
         """
         Summarizes the chunks of the specified PDF file.
         """
-        file_selected = file_name.replace('.pdf', '')
-        file_list_summarized = self.session.sql(f"""
-            SELECT DISTINCT "file_name" 
-            FROM {self.database_name}.{self.schema_name}.{self.summary_table}
-        """).to_pandas()['file_name'].tolist()
-
-        if file_selected in file_list_summarized:
-            summary_df = self.session.sql(f"""
-                SELECT "file_name", LISTAGG(summarized_chunk, '|') as summary 
-                FROM {self.database_name}.{self.schema_name}.{self.summary_table} 
-                WHERE "file_name" = '{file_selected}' 
-                GROUP BY "file_name"
-            """).to_pandas()
-        else:
-            insert_sql = self.session.sql(f"""
-                SELECT "file_name", SNOWFLAKE.CORTEX.SUMMARIZE("chunks") as summarized_chunk, "chunks" 
-                FROM {self.database_name}.{self.schema_name}.{self.chunked_table} 
-                WHERE "file_name" = '{file_selected}'
-            """).to_pandas()
-            tbl_write = self.session.create_dataframe(insert_sql)
-            
-            tbl_write.write.mode("append").save_as_table(f"{self.database_name}.{self.schema_name}.{self.summary_table}")
-
-            summary_df = self.session.sql(f"""
-                SELECT "file_name", LISTAGG(summarized_chunk, '|') as summary 
-                FROM {self.database_name}.{self.schema_name}.{self.summary_table} 
-                WHERE "file_name" = '{file_selected}' 
-                GROUP BY "file_name"
-            """).to_pandas()
-
-        return summary_df
+        return self.summarizer.summarize(file_name)
+
+    def summarize_stream(self, file_name):
+        """
+        Summarizes the missing chunks of the specified PDF file concurrently, yielding (chunk_index, summary) as they land.
+        """
+        return self.summarizer.summarize_concurrently(file_name)
+
+    def summarize_hierarchical(self, file_name):
+        """
+        Summarizes the specified PDF file into a single overview by recursively merging chunk summaries.
+        """
+        return self.summarizer.summarize_hierarchically(file_name)
+
+    def get_chunk_summaries(self, file_name):
+        """
+        Returns the chunk summaries of the specified PDF file in document order.
+        """
+        return self.summarizer.get_chunk_summaries(file_name.replace('.pdf', ''))
 
     @staticmethod
     def format_paragraphs(input_string, delimiter):
@@ -124,57 +86,25 @@ class SummaryApp:
 
     def get_doc_list(self):
         """
-        Retrieves the list of document names from the storage.
+        Returns {document name: md5} of the documents on the stage.
         """
-        doc_names = self.session.sql(f"list {self.stage_path_url}").collect()
-        doc_df = pd.DataFrame(doc_names)
-        doc_list = doc_df['name'].apply(self.split_text)
-        return doc_list
+        return {file_name: fingerprint[0] for file_name, fingerprint in self.ingestor.manifest.list_stage().items()}
 
 
 def main():
     """
     Main function to run the Streamlit app.
     """
-    
-
-    try:
-
-        # Define the path to the .env file
-        env_path = os.path.join(os.path.dirname(__file__), '..', '.env')
-
-        if os.path.exists(env_path):
-            # Load the .env file
-            load_dotenv(dotenv_path=env_path)
-        
-            connection_parameters = {
-        "user": os.getenv("user"),
-        "password": os.getenv("password"),
-        "account": os.getenv("account"),
-        "role": os.getenv("role"),
-        "warehouse": os.getenv("warehouse"),
-        "database": os.getenv("database"),
-        "schema": os.getenv("schema"),
-    }
-            session = Session.builder.configs(connection_parameters).create()
-        else:
+    with traced_request("Document Summary"), get_session_pool().session() as session:
+        run_app(session)
+    rerun_while_pending(get_ingestion_worker())
 
-            connection_parameters = {
-        "user": st.secrets.db_credentials.SNOWFLAKE_USER,
-        "password": st.secrets.db_credentials.SNOWFLAKE_PASSWORD,
-        "account": st.secrets.db_credentials.SNOWFLAKE_ACCOUNT,
-        "role": st.secrets.db_credentials.SNOWFLAKE_ROLE,
-        "warehouse": st.secrets.db_credentials.SNOWFLAKE_WAREHOUSE,
-        "database": st.secrets.db_credentials.SNOWFLAKE_DATABASE,
-        "schema":st.secrets.db_credentials.SNOWFLAKE_SCHEMA,
-    }
-            
-            session = Session.builder.configs(connection_parameters).create()
-    except:
-        session = get_active_session()
-
-    with open('config_file.json', 'r') as f:
-        config = json.load(f)
+
+def run_app(session):
+    """
+    Renders the page using a session borrowed from the shared pool.
+    """
+    config = load_config()
 
     summary_app_config = config['summary_app']
     db_schema=config['db_schema']
@@ -190,7 +120,12 @@ def main():
         database_name=database_name,
         schema_name=schema_name,
         chunked_table=chunked_table,
-        summary_table=summary_table
+        summary_table=summary_table,
+        manifest_table=db_schema.get('manifest_table', 'STAGE_MANIFEST'),
+        summary_concurrency=summary_app_config.get('summary_concurrency', 8),
+        summary_max_retries=summary_app_config.get('summary_max_retries', 2),
+        levels_table=summary_app_config.get('levels_table', 'SUMMARY_LEVELS'),
+        summary_token_budget=summary_app_config.get('summary_token_budget', 4000)
     )
 
     doc_list = summary_app.get_doc_list()
@@ -208,13 +143,29 @@ def main():
     option = st.selectbox('What Document Would you like to Summarize?', doc_list, index=None)
 
     if option:
-        file_path = f"{summary_app.stage_path}/{option}"
-        
-        summary_app.process_load(file_path)
         st.write('You selected 📝:', option)
-        summary_df = summary_app.summarize(option)
-        formatted_summary = summary_app.format_paragraphs(summary_df['SUMMARY'][0], '|')
-        st.write(formatted_summary)
+        if not wait_for_jobs(get_ingestion_worker(), JOB_SUMMARY_LOAD, [option], "Reading the document...",
+                             versions=doc_list, session=session):
+            return
+
+        summary_placeholder = st.empty()
+        if summary_app_config.get('concurrent_summaries', False):
+            # Render chunk summaries in document order as soon as each one lands.
+            partial_summaries = {}
+            for chunk_index, chunk_summary in summary_app.summarize_stream(option):
+                partial_summaries[chunk_index] = chunk_summary
+                summary_placeholder.write(summary_app.format_paragraphs(
+                    '|'.join(partial_summaries[i] for i in sorted(partial_summaries)), '|'))
+
+        if summary_app_config.get('hierarchical_summary', False):
+            # One overview stays within the size limits however long the document is.
+            summary_placeholder.write(summary_app.summarize_hierarchical(option))
+            with st.expander("Section summaries"):
+                st.write("\n\n".join(part.strip() for part in summary_app.get_chunk_summaries(option)))
+        else:
+            summary_df = summary_app.summarize(option)
+            formatted_summary = summary_app.format_paragraphs(summary_df['SUMMARY'][0], '|')
+            summary_placeholder.write(formatted_summary)
 
 
 if __name__ == "__main__":
@@ -1,24 +1,28 @@
 import streamlit as st
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-import PyPDF2
-import io
-import pandas as pd
-from snowflake.snowpark import Session
-from datetime import datetime
-import pytz
-import re
-from dotenv import load_dotenv
-import os
-import json
-from snowflake.snowpark.context import get_active_session
+from utils.comparison_cache import ComparisonCache, comparison_key
+from utils.config import load_config
+from utils.diff_engine import DiffEngine, split_sections
+from utils.ingestion import SummaryIngestor
+from utils.ingestion_worker import JOB_SUMMARY_PREPARE, get_ingestion_worker, rerun_while_pending, wait_for_jobs
+from utils.pdf_extract import read_pdf
+from utils.session import get_session_pool
+from utils.summarizer import DocumentSummarizer
+from utils.tracing import traced_request, tracer
+
+# Bump whenever the comparison prompt or the diff changes, so cached comparisons are not reused.
+PROMPT_VERSION = 'diff-v1'
 
 
 class DocumentDifferenceApp:
     def __init__(self, session, stage_path='pdf_store', database_name='BAMBOO', 
                  schema_name='BILLS', chunked_table='CHUNKED_PDF_SUM', 
-                 summary_table='SUMMARIZED_CONTENT'):
+                 summary_table='SUMMARIZED_CONTENT', manifest_table='STAGE_MANIFEST',
+                 model_name='reka-flash', diff_similarity_threshold=0.4, max_prompt_chars=24000,
+                 comparison_cache=None):
         """
         Initializes the DocumentDifferenceApp with a Snowflake session and configuration parameters.
+        Sections whose MinHash similarity reaches diff_similarity_threshold are compared as edits of each other.
+        comparison_cache reuses comparisons of document pairs whose content has not changed.
         """
         self.session = session
         self.stage_path_url = f"@{database_name}.{schema_name}.{stage_path}"
@@ -27,50 +31,28 @@ class DocumentDifferenceApp:
         self.schema_name = schema_name
         self.chunked_table = chunked_table
         self.summary_table = summary_table
+        self.model_name = model_name
+        self.max_prompt_chars = max_prompt_chars
+        self.diff_engine = DiffEngine(similarity_threshold=diff_similarity_threshold)
+        self.comparison_cache = comparison_cache
+        self.ingestor = SummaryIngestor(session, stage_path=stage_path, database_name=database_name,
+                                        schema_name=schema_name, chunked_table=chunked_table,
+                                        summary_table=summary_table, manifest_table=manifest_table)
+        self.summarizer = DocumentSummarizer(session, database_name=database_name, schema_name=schema_name,
+                                             chunked_table=chunked_table, summary_table=summary_table)
 
     def read_pdf(self, file_url):
         """
         Reads a PDF file from the given file URL and extracts text.
         """
-        with self.session.file.get_stream(file_url) as file:
-            buffer = io.BytesIO(file.read())
-
-        reader = PyPDF2.PdfReader(buffer)
-        text = ""
-        for page in reader.pages:
-            try:
-                text += page.extract_text().replace('\n', ' ').replace('\0', ' ')
-            except:
-                text = "Unable to Extract"
-
-        return text
+        return read_pdf(self.session, file_url)
 
     def process_load(self, file_url):
         """
-        Processes and loads the PDF text into the database if not already present.
+        Processes and loads the PDF text into the database if it is new or changed on the stage.
+        Rows of re-uploaded or deleted PDFs are removed from the chunk and summary tables.
         """
-        file_selected = file_url.replace(f'{self.stage_path}/', '').replace('.pdf', '')
-        file_list_summarized = self.session.sql(f"""
-            SELECT DISTINCT "file_name" 
-            FROM {self.database_name}.{self.schema_name}.{self.chunked_table}
-        """).to_pandas()['file_name'].tolist()
-
-        if file_selected not in file_list_summarized:
-            text = self.read_pdf(file_url)
-            text_splitter = RecursiveCharacterTextSplitter(
-                chunk_size=30000, 
-                chunk_overlap=1000, 
-                length_function=len
-            )
-            chunks = text_splitter.split_text(text)
-            df = pd.DataFrame(chunks, columns=['chunks'])
-            df['file_path'] = file_url
-            df['file_name'] = file_selected
-            df['date'] = datetime.now(pytz.timezone("America/Chicago")).strftime("%Y-%m-%d")
-            df['time'] = datetime.now(pytz.timezone("America/Chicago")).strftime("%I:%M:%S %p")
-
-            tbl_write = self.session.create_dataframe(df)
-            tbl_write.write.mode("append").save_as_table(f"{self.database_name}.{self.schema_name}.{self.chunked_table}")
+        self.ingestor.process_load(file_url.replace(f'{self.stage_path}/', ''))
 
     def split_text(self, text):
         """
@@ -78,40 +60,20 @@ class DocumentDifferenceApp:
         """
         return text.split("pdf_store/")[1]
 
+    def prepare_documents(self, worker, file_names, versions=None):
+        """
+        Loads and summarizes the documents concurrently in the ingestion worker, each on its own session.
+        Returns True once every document is ready at its staged md5 in versions; until then shows progress and
+        schedules a rerun.
+        """
+        return wait_for_jobs(worker, JOB_SUMMARY_PREPARE, file_names, "Reading the documents...", versions=versions,
+                             session=self.session)
+
     def summarize(self, file_name):
         """
         Summarizes the chunks of the specified PDF file.
         """
-        file_selected = file_name.replace('.pdf', '')
-        file_list_summarized = self.session.sql(f"""
-            SELECT DISTINCT "file_name" 
-            FROM {self.database_name}.{self.schema_name}.{self.summary_table}
-        """).to_pandas()['file_name'].tolist()
-
-        if file_selected in file_list_summarized:
-            summary_df = self.session.sql(f"""
-                SELECT "file_name", LISTAGG(summarized_chunk, '|') as summary 
-                FROM {self.database_name}.{self.schema_name}.{self.summary_table} 
-                WHERE "file_name" = '{file_selected}' 
-                GROUP BY "file_name"
-            """).to_pandas()
-        else:
-            insert_sql = self.session.sql(f"""
-                SELECT "file_name", SNOWFLAKE.CORTEX.SUMMARIZE("chunks") as summarized_chunk, "chunks" 
-                FROM {self.database_name}.{self.schema_name}.{self.chunked_table} 
-                WHERE "file_name" = '{file_selected}'
-            """).to_pandas()
-            tbl_write = self.session.create_dataframe(insert_sql)
-            tbl_write.write.mode("append").save_as_table(f"{self.database_name}.{self.schema_name}.{self.summary_table}")
-
-            summary_df = self.session.sql(f"""
-                SELECT "file_name", LISTAGG(summarized_chunk, '|') as summary 
-                FROM {self.database_name}.{self.schema_name}.{self.summary_table} 
-                WHERE "file_name" = '{file_selected}' 
-                GROUP BY "file_name"
-            """).to_pandas()
-
-        return summary_df
+        return self.summarizer.summarize(file_name)
 
     @staticmethod
     def format_paragraphs(input_string, delimiter):
@@ -122,88 +84,131 @@ class DocumentDifferenceApp:
         formatted_string = "\n\n".join(part.strip() for part in parts)
         return formatted_string
 
+    def comparison_documents(self, option1, option2):
+        """
+        Returns the (file_name, md5) of both documents as loaded into the chunk table, and the prompt version to
+        cache under. The md5 is None unless the loaded version is still the one on the stage, since summaries of
+        an older upload must neither be cached nor served under the new one.
+        """
+        staged = self.ingestor.manifest.list_stage()
+        loaded = self.ingestor.manifest.load()
+
+        def current_md5(file_name):
+            md5 = loaded[file_name][0] if file_name in loaded else None
+            return md5 if file_name in staged and staged[file_name][0] == md5 else None
+
+        document1 = (option1, current_md5(option1))
+        document2 = (option2, current_md5(option2))
+        prompt_version = f"{PROMPT_VERSION}:{self.diff_engine.similarity_threshold}:{self.max_prompt_chars}"
+        return document1, document2, prompt_version
+
+    def get_cached_comparison(self, option1, option2):
+        """
+        Returns the cached comparison of the documents' current content, or None.
+        """
+        if self.comparison_cache is None:
+            return None
+        document1, document2, prompt_version = self.comparison_documents(option1, option2)
+        if None in (document1[1], document2[1]):
+            return None
+        return self.comparison_cache.get(comparison_key(document1, document2, self.model_name, prompt_version),
+                                         session=self.session)
+
+    @tracer.traced()
+    def compare(self, option1, option2):
+        """
+        Returns the differences between two prepared documents and caches them under the documents' content.
+        """
+        summary_df_1 = self.summarize(option1)
+        summary_df_2 = self.summarize(option2)
+        formatted_summary_1 = self.format_paragraphs(summary_df_1['SUMMARY'][0], '|')
+        formatted_summary_2 = self.format_paragraphs(summary_df_2['SUMMARY'][0], '|')
+        response = self.get_answer_reka(formatted_summary_1, formatted_summary_2, option1, option2)
+
+        if self.comparison_cache is not None:
+            document1, document2, prompt_version = self.comparison_documents(option1, option2)
+            if None not in (document1[1], document2[1]):
+                key = comparison_key(document1, document2, self.model_name, prompt_version)
+                self.comparison_cache.put(key, document1, document2, self.model_name, prompt_version, response,
+                                          session=self.session)
+        return response
+
+    @tracer.traced()
     def get_answer_reka(self, summary1, summary2, option1, option2):
         """
         Compares two summaries and returns the differences using REKA.
+        Only the sections that changed between the documents are sent, split across as many prompts as needed.
         """
-        summary1 = re.sub(r'[^a-zA-Z0-9\s]', '', summary1)
-        summary2 = re.sub(r'[^a-zA-Z0-9\s]', '', summary2)
-
-        if summary1 == summary2:
+        diff = self.diff_engine.diff(split_sections(summary1), split_sections(summary2))
+        if not (diff.modified or diff.removed or diff.added):
             return "Both the Documents are Same"
-        else:
-            instructions = f"""
-            You are given 2 Documents in {option1} and {option2} respectively.        
-            {option1}: <Question> {summary1} </Question>.
-            {option2}: <context> {summary2} </context>.
 
-            Find and Highlight the key differences in both the Documents.
-            """
+        jobs = [
+            self.session.sql("SELECT SNOWFLAKE.CORTEX.COMPLETE(?, ?) as response",
+                             params=[self.model_name, prompt]).collect_nowait()
+            for prompt in self.build_diff_prompts(diff, option1, option2)
+        ]
+        return "\n\n".join(job.result()[0]['RESPONSE'] for job in jobs)
 
-            response_df = self.session.sql(f"""
-                SELECT SNOWFLAKE.CORTEX.COMPLETE('reka-flash', '{instructions}') as response
-            """).to_pandas()
-
-            return response_df['RESPONSE'][0]
+    def build_diff_prompts(self, diff, option1, option2):
+        """
+        Packs the changed sections of a DocumentDiff into prompts of at most max_prompt_chars characters.
+        """
+        sections = [f"Changed section.\n{option1}: {old}\n{option2}: {new}" for old, new, _ in diff.modified]
+        sections += [f"Only in {option1}: {section}" for section in diff.removed]
+        sections += [f"Only in {option2}: {section}" for section in diff.added]
+
+        batches, batch, size = [], [], 0
+        for section in sections:
+            if batch and size + len(section) > self.max_prompt_chars:
+                batches.append(batch)
+                batch, size = [], 0
+            batch.append(section)
+            size += len(section)
+        batches.append(batch)
+
+        instructions = """
+        You are given the sections that differ between 2 Documents, {option1} and {option2}.
+        {unchanged} sections are identical in both Documents and are not shown.
+        <differences>
+        {differences}
+        </differences>
+
+        Find and Highlight the key differences in both the Documents.
+        """
+        return [instructions.format(option1=option1, option2=option2, unchanged=diff.unchanged,
+                                    differences="\n\n".join(batch))
+                for batch in batches]
 
     def get_doc_list(self):
         """
-        Retrieves the list of document names from the storage.
+        Returns {document name: md5} of the documents on the stage.
         """
-        doc_names = self.session.sql(f"list {self.stage_path_url}").collect()
-        doc_df = pd.DataFrame(doc_names)
-        doc_list = doc_df['name'].apply(self.split_text)
-        return doc_list
+        return {file_name: fingerprint[0] for file_name, fingerprint in self.ingestor.manifest.list_stage().items()}
+
+@st.cache_resource(show_spinner=False)
+def get_comparison_cache(table_name=None, max_entries=256):
+    """
+    Returns the comparison cache shared across reruns and users, backed by table_name when given.
+    """
+    return ComparisonCache(max_entries=max_entries, session_pool=get_session_pool() if table_name else None,
+                           table_name=table_name)
+
 
 def main():
     """
     Main function to run the Streamlit app.
     """
-    # Define the path to the .env file
-    env_path = os.path.join(os.path.dirname(__file__), '..', '.env')
-
-    # Load the .env file
-    load_dotenv(dotenv_path=env_path)
-
-    
-
-    try:
-
-        # Define the path to the .env file
-        env_path = os.path.join(os.path.dirname(__file__), '..', '.env')
-
-        if os.path.exists(env_path):
-            # Load the .env file
-            load_dotenv(dotenv_path=env_path)
-        
-            connection_parameters = {
-        "user": os.getenv("user"),
-        "password": os.getenv("password"),
-        "account": os.getenv("account"),
-        "role": os.getenv("role"),
-        "warehouse": os.getenv("warehouse"),
-        "database": os.getenv("database"),
-        "schema": os.getenv("schema"),
-    }
-            session = Session.builder.configs(connection_parameters).create()
-        else:
-
-            connection_parameters = {
-        "user": st.secrets.db_credentials.SNOWFLAKE_USER,
-        "password": st.secrets.db_credentials.SNOWFLAKE_PASSWORD,
-        "account": st.secrets.db_credentials.SNOWFLAKE_ACCOUNT,
-        "role": st.secrets.db_credentials.SNOWFLAKE_ROLE,
-        "warehouse": st.secrets.db_credentials.SNOWFLAKE_WAREHOUSE,
-        "database": st.secrets.db_credentials.SNOWFLAKE_DATABASE,
-        "schema":st.secrets.db_credentials.SNOWFLAKE_SCHEMA,
-    }
-            
-            session = Session.builder.configs(connection_parameters).create()
-    except:
-        session = get_active_session()
-
-    with open('config_file.json', 'r') as f:
-        config = json.load(f)
+    with traced_request("Document Difference"), get_session_pool().session() as session:
+        run_app(session)
+    rerun_while_pending(get_ingestion_worker())
+
+
+def run_app(session):
+    """
+    Renders the page using a session borrowed from the shared pool.
+    """
+    config = load_config()
 
     compare_app_config = config['compare_app']
     db_schema=config['db_schema']
@@ -219,7 +224,15 @@ def main():
         database_name=database_name,
         schema_name=schema_name,
         chunked_table=chunked_table,
-        summary_table=summary_table
+        summary_table=summary_table,
+        manifest_table=db_schema.get('manifest_table', 'STAGE_MANIFEST'),
+        model_name=compare_app_config.get('model_name', 'reka-flash'),
+        diff_similarity_threshold=compare_app_config.get('diff_similarity_threshold', 0.4),
+        max_prompt_chars=compare_app_config.get('max_prompt_chars', 24000),
+        comparison_cache=get_comparison_cache(
+            f"{database_name}.{schema_name}.{compare_app_config['comparison_cache_table']}"
+            if compare_app_config.get('comparison_cache_table') else None,
+            compare_app_config.get('comparison_cache_size', 256))
     )
 
     doc_list = compare_app.get_doc_list()
@@ -237,22 +250,15 @@ def main():
     option2 = st.selectbox('Select Document 2 to Compare', doc_list, index=None)
 
     if option1 and option2:
-        file_path_1 = f"{compare_app.stage_path}/{option1}"
-        file_path_2 = f"{compare_app.stage_path}/{option2}"
-
-        compare_app.process_load(file_path_1)
-        compare_app.process_load(file_path_2)
-
         st.write('Doc1 selected 📝: ', option1)
         st.write('Doc2 selected 📝: ', option2)
 
-        summary_df_1 = compare_app.summarize(option1)
-        summary_df_2 = compare_app.summarize(option2)
-
-        formatted_summary_1 = compare_app.format_paragraphs(summary_df_1['SUMMARY'][0], '|')
-        formatted_summary_2 = compare_app.format_paragraphs(summary_df_2['SUMMARY'][0], '|')
-
-        response = compare_app.get_answer_reka(formatted_summary_1, formatted_summary_2, option1, option2)
+        response = compare_app.get_cached_comparison(option1, option2)
+        if response is None:
+            # Both sides are loaded and summarized in parallel; only the comparison waits on both.
+            if not compare_app.prepare_documents(get_ingestion_worker(), [option1, option2], versions=doc_list):
+                return
+            response = compare_app.compare(option1, option2)
         st.write(response)
 
 if __name__ == "__main__":
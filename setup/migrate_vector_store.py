@@ -0,0 +1,89 @@
+import json
+import os
+import snowflake.connector
+
+
+def get_column_type(cursor, db_name, schema_name, table_name, column_name):
+    """
+    Returns the data type of the given column, or None if the column does not exist.
+    """
+    cursor.execute(f"""
+    SELECT DATA_TYPE FROM {db_name}.INFORMATION_SCHEMA.COLUMNS
+    WHERE TABLE_SCHEMA = %s AND TABLE_NAME = %s AND COLUMN_NAME = %s
+    """, (schema_name, table_name, column_name))
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def get_column_names(cursor, db_name, schema_name, table_name):
+    """
+    Returns the column names of the given table in their defined order.
+    """
+    cursor.execute(f"""
+    SELECT COLUMN_NAME FROM {db_name}.INFORMATION_SCHEMA.COLUMNS
+    WHERE TABLE_SCHEMA = %s AND TABLE_NAME = %s ORDER BY ORDINAL_POSITION
+    """, (schema_name, table_name))
+    return [row[0] for row in cursor.fetchall()]
+
+
+def quote(column_name):
+    """
+    Returns a column name as a quoted identifier.
+    """
+    return '"' + column_name.replace('"', '""') + '"'
+
+
+def main():
+
+    conn = snowflake.connector.connect(user=os.getenv("SNOWFLAKE_USER"),
+    password=os.getenv("SNOWFLAKE_PASSWORD"),
+    account=os.getenv("SNOWFLAKE_ACCOUNT"),
+    warehouse=os.getenv("SNOWFLAKE_WAREHOUSE"),
+    role=os.getenv("SNOWFLAKE_ROLE"))
+
+    with open('config_file.json', 'r') as f:
+        config = json.load(f)
+
+    db_schema = config['db_schema']
+    db_name = db_schema['database_name']
+    schema_name = db_schema['schema_name']
+    table_vector_store_rag = config['rag_app']['vector_store_table']
+    table_fqn = f"{db_name}.{schema_name}.{table_vector_store_rag}"
+
+    cursor = conn.cursor()
+    column_type = get_column_type(cursor, db_name, schema_name, table_vector_store_rag, "VECTOR_EMBEDINGS")
+    # Earlier versions of this script converted through this column and could stop before swapping it in.
+    native_type = get_column_type(cursor, db_name, schema_name, table_vector_store_rag, "VECTOR_EMBEDINGS_NATIVE")
+
+    if column_type is None and native_type is None:
+        raise SystemExit(f"{table_fqn} has no VECTOR_EMBEDINGS column, its embeddings cannot be migrated")
+
+    if column_type is None:
+        # The interrupted conversion had already filled the native column and dropped the old one.
+        smt = f"ALTER TABLE {table_fqn} RENAME COLUMN VECTOR_EMBEDINGS_NATIVE TO VECTOR_EMBEDINGS"
+    elif column_type == "VARIANT":
+        # Rebuild the table in one statement, so a failure leaves the original untouched.
+        columns = []
+        for name in get_column_names(cursor, db_name, schema_name, table_vector_store_rag):
+            if name == "VECTOR_EMBEDINGS":
+                columns.append("VECTOR_EMBEDINGS::VECTOR(FLOAT, 768) AS VECTOR_EMBEDINGS")
+            elif name != "VECTOR_EMBEDINGS_NATIVE":
+                columns.append(quote(name))
+        smt = f"""CREATE OR REPLACE TABLE {table_fqn} CLUSTER BY ("file_name") COPY GRANTS AS
+    SELECT {", ".join(columns)} FROM {table_fqn}"""
+    elif native_type is not None:
+        smt = f"ALTER TABLE {table_fqn} DROP COLUMN VECTOR_EMBEDINGS_NATIVE"
+    else:
+        print(f"{table_fqn}.VECTOR_EMBEDINGS is {column_type}, nothing to migrate")
+        return
+
+    print(smt)
+    cursor.execute(smt)
+
+    column_type = get_column_type(cursor, db_name, schema_name, table_vector_store_rag, "VECTOR_EMBEDINGS")
+    if column_type != "VECTOR":
+        raise SystemExit(f"{table_fqn}.VECTOR_EMBEDINGS is {column_type} after the migration, expected VECTOR")
+    print(f"{table_fqn}.VECTOR_EMBEDINGS is now VECTOR(FLOAT, 768)")
+
+if __name__ == "__main__":
+    main()
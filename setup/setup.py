@@ -26,21 +26,28 @@ def main():
     db_schema=config['db_schema']
     db_name = db_schema['database_name']
     schema_name = db_schema['schema_name']
+    manifest_table = db_schema['manifest_table']
+    pages_table = db_schema['pages_table']
+    jobs_table = config['ingestion_worker']['jobs_table']
     
     summary_app_config = config['summary_app']
     stage_path_sum = summary_app_config['stage_path']
     chunked_pdf_sum = summary_app_config['chunked_table']
     summarized_content_sum = summary_app_config['summary_table']
+    summary_levels_sum = summary_app_config['levels_table']
 
     compare_app_config = config['compare_app']
     stage_path_dif = compare_app_config['stage_path']
     chunked_pdf_dif = compare_app_config['chunked_table']
     summarized_content_dif = compare_app_config['summary_table']
+    comparison_cache_dif = compare_app_config['comparison_cache_table']
 
     rag_app_config = config['rag_app']
     table_chunked_pdf_rag = rag_app_config['chunk_table_name']
     table_vector_store_rag = rag_app_config['vector_store_table']
     stage_path_rag = rag_app_config['stage_path']
+    answer_cache_rag = rag_app_config['answer_cache']['table']
+    tags_table_rag = rag_app_config['tags_table']
 
     sql_statements=[]
 
@@ -71,7 +78,8 @@ CREATE TABLE IF NOT EXISTS {db_name}.{schema_name}.{table_chunked_pdf_rag} (
     "file_path" VARCHAR(16777216),
     "file_name" VARCHAR(16777216),
     "date" VARCHAR(16777216),
-    "time" VARCHAR(16777216)
+    "time" VARCHAR(16777216),
+    "chunk_index" NUMBER
 );
 """
     sql_statements.append(create_table_chunked_pdf_rag)
@@ -79,7 +87,8 @@ CREATE TABLE IF NOT EXISTS {db_name}.{schema_name}.{table_chunked_pdf_rag} (
 CREATE TABLE IF NOT EXISTS {db_name}.{schema_name}.{table_vector_store_rag} (
     "file_name" VARCHAR(16777216),
     "chunks" VARCHAR(16777216),
-    VECTOR_EMBEDINGS VARIANT
+    VECTOR_EMBEDINGS VECTOR(FLOAT, 768),
+    "chunk_index" NUMBER
 );
 """
     sql_statements.append(create_table_vector_store_rag)
@@ -89,7 +98,8 @@ CREATE TABLE IF NOT EXISTS {db_name}.{schema_name}.{table_vector_store_rag} (
     "file_path" VARCHAR(16777216),
     "file_name" VARCHAR(16777216),
     "date" VARCHAR(16777216),
-    "time" VARCHAR(16777216)
+    "time" VARCHAR(16777216),
+    "chunk_index" NUMBER
     );
     """
     sql_statements.append(create_table_chunked_pdf_dif)
@@ -98,7 +108,8 @@ CREATE TABLE IF NOT EXISTS {db_name}.{schema_name}.{table_vector_store_rag} (
 CREATE TABLE IF NOT EXISTS {db_name}.{schema_name}.{summarized_content_dif} (
     "file_name" VARCHAR(16777216),
     SUMMARIZED_CHUNK VARCHAR(16777216),
-    "chunks" VARCHAR(16777216)
+    "chunks" VARCHAR(16777216),
+    "chunk_index" NUMBER
 );
 """
     sql_statements.append(create_table_summarized_dif)
@@ -109,7 +120,8 @@ CREATE TABLE IF NOT EXISTS {db_name}.{schema_name}.{summarized_content_dif} (
     "file_path" VARCHAR(16777216),
     "file_name" VARCHAR(16777216),
     "date" VARCHAR(16777216),
-    "time" VARCHAR(16777216)
+    "time" VARCHAR(16777216),
+    "chunk_index" NUMBER
     );
     """
     sql_statements.append(create_table_chunked_pdf_sum)
@@ -118,16 +130,173 @@ CREATE TABLE IF NOT EXISTS {db_name}.{schema_name}.{summarized_content_dif} (
 CREATE TABLE IF NOT EXISTS {db_name}.{schema_name}.{summarized_content_sum} (
     "file_name" VARCHAR(16777216),
     SUMMARIZED_CHUNK VARCHAR(16777216),
-    "chunks" VARCHAR(16777216)
+    "chunks" VARCHAR(16777216),
+    "chunk_index" NUMBER
 );
 """
     sql_statements.append(create_table_summarized_sum)
 
-    
-    
+    create_table_manifest = f"""
+CREATE TABLE IF NOT EXISTS {db_name}.{schema_name}.{manifest_table} (
+    "consumer" VARCHAR(16777216),
+    "file_name" VARCHAR(16777216),
+    "md5" VARCHAR(16777216),
+    "size" NUMBER,
+    "last_modified" VARCHAR(16777216)
+);
+"""
+    sql_statements.append(create_table_manifest)
+
+    create_table_pages = f"""
+CREATE TABLE IF NOT EXISTS {db_name}.{schema_name}.{pages_table} (
+    "file_path" VARCHAR(16777216),
+    "file_name" VARCHAR(16777216),
+    "page_number" NUMBER,
+    "start_offset" NUMBER,
+    "text" VARCHAR(16777216),
+    "date" VARCHAR(16777216),
+    "time" VARCHAR(16777216)
+);
+"""
+    sql_statements.append(create_table_pages)
+
+    create_table_jobs = f"""
+CREATE TABLE IF NOT EXISTS {db_name}.{schema_name}.{jobs_table} (
+    "job_id" VARCHAR(16777216),
+    "job_type" VARCHAR(16777216),
+    "target" VARCHAR(16777216),
+    "status" VARCHAR(16777216),
+    "error" VARCHAR(16777216),
+    "submitted_at" TIMESTAMP_LTZ,
+    "updated_at" TIMESTAMP_LTZ
+);
+"""
+    sql_statements.append(create_table_jobs)
+
+    create_table_summary_levels = f"""
+CREATE TABLE IF NOT EXISTS {db_name}.{schema_name}.{summary_levels_sum} (
+    "file_name" VARCHAR(16777216),
+    "level" NUMBER,
+    "group_index" NUMBER,
+    "summary" VARCHAR(16777216)
+);
+"""
+    sql_statements.append(create_table_summary_levels)
+
+    create_table_answer_cache = f"""
+CREATE TABLE IF NOT EXISTS {db_name}.{schema_name}.{answer_cache_rag} (
+    "cache_key" VARCHAR(16777216),
+    "question" VARCHAR(16777216),
+    "embedding" VECTOR(FLOAT, 768),
+    "answer" VARCHAR(16777216),
+    "file_name" VARCHAR(16777216),
+    "created_at" FLOAT
+);
+"""
+    sql_statements.append(create_table_answer_cache)
+
+    create_table_tags = f"""
+CREATE TABLE IF NOT EXISTS {db_name}.{schema_name}.{tags_table_rag} (
+    "file_name" VARCHAR(16777216),
+    "tag" VARCHAR(16777216)
+);
+"""
+    sql_statements.append(create_table_tags)
+
+    create_table_comparison_cache = f"""
+CREATE TABLE IF NOT EXISTS {db_name}.{schema_name}.{comparison_cache_dif} (
+    "cache_key" VARCHAR(16777216),
+    "file_name_1" VARCHAR(16777216),
+    "md5_1" VARCHAR(16777216),
+    "file_name_2" VARCHAR(16777216),
+    "md5_2" VARCHAR(16777216),
+    "model" VARCHAR(16777216),
+    "prompt_version" VARCHAR(16777216),
+    "response" VARCHAR(16777216),
+    "created_at" TIMESTAMP_LTZ
+);
+"""
+    sql_statements.append(create_table_comparison_cache)
+
+    # Tables created before chunks were numbered get the column added in place.
+    for table_name in [table_chunked_pdf_rag, table_vector_store_rag, chunked_pdf_dif, summarized_content_dif, chunked_pdf_sum, summarized_content_sum]:
+        sql_statements.append(f'''ALTER TABLE {db_name}.{schema_name}.{table_name} ADD COLUMN IF NOT EXISTS "chunk_index" NUMBER''')
+
     for smt in sql_statements:
         print(smt)
         conn.cursor().execute(smt)
 
+    # Chunks written before "chunk_index" existed are numbered per file. Their original order was not stored,
+    # so ingestion time then chunk text gives a stable order. Each table with unnumbered rows is rebuilt,
+    # since repeated chunk texts (headers, boilerplate pages) leave no column to tell their rows apart in place.
+    for table_name in dict.fromkeys([table_chunked_pdf_rag, chunked_pdf_dif, chunked_pdf_sum]):
+        if not count_unnumbered(conn, f"{db_name}.{schema_name}.{table_name}"):
+            continue
+        smt = f'''
+CREATE OR REPLACE TABLE {db_name}.{schema_name}.{table_name} COPY GRANTS AS
+SELECT * EXCLUDE ("chunk_index"),
+       COALESCE("chunk_index",
+                ROW_NUMBER() OVER (PARTITION BY "file_name" ORDER BY "date", "time", "chunks") - 1) AS "chunk_index"
+FROM {db_name}.{schema_name}.{table_name}
+'''
+        print(smt)
+        conn.cursor().execute(smt)
+
+    # Vector store and summary rows then take the index of their chunk, so keyword prefilter keys resolve.
+    # Rows repeating a chunk text are paired with its chunks in turn, by their occurrence within the file.
+    for table_name, chunk_table in dict.fromkeys([(table_vector_store_rag, table_chunked_pdf_rag),
+                                                  (summarized_content_dif, chunked_pdf_dif),
+                                                  (summarized_content_sum, chunked_pdf_sum)]):
+        if not count_unnumbered(conn, f"{db_name}.{schema_name}.{table_name}",
+                                f"{db_name}.{schema_name}.{chunk_table}"):
+            continue
+        smt = f'''
+CREATE OR REPLACE TABLE {db_name}.{schema_name}.{table_name} COPY GRANTS AS
+SELECT v.* EXCLUDE ("chunk_index", "occurrence"), COALESCE(v."chunk_index", c."chunk_index") AS "chunk_index"
+FROM (
+    SELECT *, ROW_NUMBER() OVER (PARTITION BY "file_name", "chunks" ORDER BY "chunks") AS "occurrence"
+    FROM {db_name}.{schema_name}.{table_name}
+) v
+LEFT JOIN (
+    SELECT "file_name", "chunks", "chunk_index",
+           ROW_NUMBER() OVER (PARTITION BY "file_name", "chunks" ORDER BY "chunk_index") AS "occurrence"
+    FROM {db_name}.{schema_name}.{chunk_table}
+) c
+ON v."chunk_index" IS NULL AND v."file_name" = c."file_name" AND v."chunks" = c."chunks"
+   AND v."occurrence" = c."occurrence"
+'''
+        print(smt)
+        conn.cursor().execute(smt)
+
+    # The summary and level tables, the vector index and the keyword prefilter all rely on the key being unique.
+    for table_name in dict.fromkeys([table_chunked_pdf_rag, table_vector_store_rag, chunked_pdf_dif,
+                                     summarized_content_dif, chunked_pdf_sum, summarized_content_sum]):
+        duplicate = conn.cursor().execute(f'''
+SELECT "file_name", "chunk_index" FROM {db_name}.{schema_name}.{table_name}
+WHERE "chunk_index" IS NOT NULL GROUP BY "file_name", "chunk_index" HAVING COUNT(*) > 1 LIMIT 1
+''').fetchone()
+        if duplicate:
+            raise RuntimeError(f"{table_name} has several rows for file {duplicate[0]!r}, chunk {duplicate[1]}")
+
+    # Every search and summary filters on "file_name", so clustering on it lets Snowflake prune micro-partitions.
+    # Tables are clustered after the backfill, which rebuilds them without their clustering key.
+    for table_name in [pages_table, table_chunked_pdf_rag, table_vector_store_rag, chunked_pdf_dif, chunked_pdf_sum]:
+        smt = f'''ALTER TABLE {db_name}.{schema_name}.{table_name} CLUSTER BY ("file_name")'''
+        print(smt)
+        conn.cursor().execute(smt)
+
+
+def count_unnumbered(conn, table_name, chunk_table=None):
+    """
+    Returns how many rows of a chunk, vector store or summary table have no "chunk_index". With chunk_table,
+    only rows whose chunk is found there are counted, since no rebuild can number the others.
+    """
+    smt = f'''SELECT COUNT(*) FROM {table_name} v WHERE v."chunk_index" IS NULL'''
+    if chunk_table is not None:
+        smt += f''' AND EXISTS (
+    SELECT 1 FROM {chunk_table} c WHERE c."file_name" = v."file_name" AND c."chunks" = v."chunks")'''
+    return conn.cursor().execute(smt).fetchone()[0]
+
+
 if __name__ == "__main__":
     main()
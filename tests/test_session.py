@@ -0,0 +1,47 @@
+import threading
+import time
+
+import utils.session
+from benchmarks.fake_session import FakeSession
+from utils.config import load_config
+from utils.ingestion_worker import JOB_RAG_SYNC, STATUS_SUCCEEDED, IngestionWorker
+from utils.session import SharedSessionPool, get_session_pool
+
+
+def test_long_job_does_not_starve_page_sessions(monkeypatch):
+    config = load_config()
+    active_session = FakeSession(config['db_schema']['database_name'], config['db_schema']['schema_name'])
+    active_session.sql(f'''
+        CREATE TABLE {config['db_schema']['database_name']}.{config['db_schema']['schema_name']}.INGESTION_JOBS
+        ("job_id" TEXT, "job_type" TEXT, "target" TEXT, "status" TEXT, "error" TEXT,
+         "submitted_at" TEXT, "updated_at" TEXT)
+    ''').collect()
+    monkeypatch.setattr(utils.session, 'has_connection_parameters', lambda: False)
+    monkeypatch.setattr(utils.session, 'get_active_session', lambda: active_session)
+    get_session_pool.clear()
+    try:
+        pool = get_session_pool()
+        assert isinstance(pool, SharedSessionPool)
+
+        started, finish = threading.Event(), threading.Event()
+
+        def run_job(session, job_type, target=None):
+            started.set()
+            finish.wait(10)
+
+        worker = IngestionWorker(pool, config, max_workers=1)
+        worker.run_job = run_job
+        worker.start()
+        job_id = worker.submit(JOB_RAG_SYNC)
+        assert started.wait(5)
+
+        begin = time.monotonic()
+        with get_session_pool().session() as session:
+            session.sql("select 1").collect()
+        assert time.monotonic() - begin < 1
+
+        finish.set()
+        worker.join()
+        assert worker.status(job_id)['status'] == STATUS_SUCCEEDED
+    finally:
+        get_session_pool.clear()
@@ -0,0 +1,101 @@
+import logging
+import os
+import tempfile
+import uuid
+
+from utils.tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+
+class BulkWriter:
+    def __init__(self, session, table_name, flush_rows=50000, on_flush=None, compression='zstd', spill_dir=None):
+        """
+        Collects rows for table_name from many files as Arrow tables spilled to a local compressed
+        Parquet file, and loads them with one PUT and one COPY every flush_rows rows.
+        on_flush is called with the file names of the rows loaded by each flush.
+        """
+        self.session = session
+        self.table_name = table_name
+        self.flush_rows = flush_rows
+        self.on_flush = on_flush
+        self.compression = compression
+        self.spill_dir = spill_dir or tempfile.gettempdir()
+
+        database, schema, table = table_name.split('.')
+        self.table_stage = f"@{database}.{schema}.%{table}"
+
+        self._schema = None
+        self._writer = None
+        self._path = None
+        self._rows = 0
+        self._file_names = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # Rows are added a whole file at a time, so what is buffered is complete even when the caller failed
+        # on a later file, and is loaded rather than thrown away with the rest of the run.
+        try:
+            self.flush()
+        except Exception:
+            self._discard()
+            if exc_type is None:
+                raise
+            logger.warning("Unable to load the rows buffered for %s", self.table_name, exc_info=True)
+
+    def add(self, df):
+        """
+        Buffers the rows of a DataFrame whose columns match the table's column names. Each call should hold
+        every row of the files it covers, so a flush never loads part of a file.
+        """
+        if df.empty:
+            return
+        # Imported on first use, so importing the ingestion code does not load Arrow.
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        table = pa.Table.from_pandas(df, schema=self._schema, preserve_index=False)
+        if self._writer is None:
+            self._schema = table.schema
+            self._path = os.path.join(self.spill_dir, f"bulk_{uuid.uuid4().hex}.parquet")
+            self._writer = pq.ParquetWriter(self._path, self._schema, compression=self.compression)
+        self._writer.write_table(table)
+        self._rows += len(df)
+        if 'file_name' in df:
+            self._file_names.update(dict.fromkeys(df['file_name'].unique().tolist()))
+
+        if self._rows >= self.flush_rows:
+            self.flush()
+
+    @tracer.traced()
+    def flush(self):
+        """
+        Loads the buffered rows into the table and calls on_flush.
+        """
+        if self._writer is None:
+            return
+        self._writer.close()
+        path, file_names = self._path, list(self._file_names)
+        self._writer, self._path, self._rows, self._file_names = None, None, 0, {}
+        try:
+            self.session.file.put(path, self.table_stage, auto_compress=False, overwrite=True)
+            self.session.sql(f"""
+                COPY INTO {self.table_name} FROM {self.table_stage}
+                FILES = ('{os.path.basename(path)}')
+                FILE_FORMAT = (TYPE = PARQUET)
+                MATCH_BY_COLUMN_NAME = CASE_SENSITIVE
+                PURGE = TRUE
+            """).collect()
+        finally:
+            os.remove(path)
+
+        if self.on_flush is not None:
+            self.on_flush(file_names)
+
+    def _discard(self):
+        if self._writer is not None:
+            self._writer.close()
+            os.remove(self._path)
+        self._writer, self._path, self._rows, self._file_names = None, None, 0, {}
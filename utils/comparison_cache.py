@@ -0,0 +1,77 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from contextlib import nullcontext
+
+
+def comparison_key(document1, document2, model_name, prompt_version):
+    """
+    Returns the cache key of a comparison of two (file_name, md5) documents. The key does not depend on the
+    order of the documents, and changes whenever either document's content, the model or the prompt changes.
+    """
+    documents = sorted([list(document1), list(document2)])
+    payload = json.dumps([documents, model_name, prompt_version])
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class ComparisonCache:
+    def __init__(self, max_entries=256, session_pool=None, table_name=None):
+        """
+        Initializes a cache of document comparison results: an in-memory LRU of up to max_entries results in
+        front of an optional Snowflake table, used when session_pool and table_name are given. The table is
+        read and written on the caller's session when one is passed, and on a pooled session otherwise.
+        """
+        self.max_entries = max_entries
+        self.session_pool = session_pool
+        self.table_name = table_name
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _put(self, key, response):
+        with self._lock:
+            self._entries[key] = response
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _session(self, session):
+        return nullcontext(session) if session is not None else self.session_pool.session()
+
+    def get(self, key, session=None):
+        """
+        Returns the cached comparison for key, or None.
+        """
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+
+        if self.table_name is None:
+            return None
+        with self._session(session) as session:
+            rows = session.sql(f'SELECT "response" FROM {self.table_name} WHERE "cache_key" = ?',
+                               params=[key]).collect()
+        if not rows:
+            return None
+        self._put(key, rows[0]['response'])
+        return rows[0]['response']
+
+    def put(self, key, document1, document2, model_name, prompt_version, response, session=None):
+        """
+        Caches the comparison of two (file_name, md5) documents.
+        """
+        self._put(key, response)
+        if self.table_name is None:
+            return
+        with self._session(session) as session:
+            session.sql(f'''
+                INSERT INTO {self.table_name} ("cache_key", "file_name_1", "md5_1", "file_name_2", "md5_2",
+                                               "model", "prompt_version", "response", "created_at")
+                SELECT ?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP()
+                WHERE NOT EXISTS (SELECT 1 FROM {self.table_name} WHERE "cache_key" = ?)
+            ''', params=[key, *document1, *document2, model_name, prompt_version, response, key]).collect()
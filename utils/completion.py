@@ -0,0 +1,124 @@
+import logging
+import time
+
+from utils.tracing import tracer, unwrap_session
+
+logger = logging.getLogger(__name__)
+
+
+class CortexBackend:
+    def __init__(self, session):
+        """
+        Streams completions from Cortex COMPLETE. Without snowflake-ml-python installed, the whole response is
+        fetched with SQL and yielded as a single token.
+        """
+        self.session = session
+
+    def stream(self, model_name, prompt):
+        """
+        Yields the completion of prompt as it is generated.
+        """
+        try:
+            from snowflake.cortex import Complete
+        except ImportError:
+            cmd = "select snowflake.cortex.complete(?, ?) as response"
+            yield self.session.sql(cmd, params=[model_name, prompt]).collect()[0]['RESPONSE']
+            return
+
+        tokens = Complete(model_name, prompt, session=unwrap_session(self.session), stream=True)
+        if not tracer.enabled:
+            yield from tokens
+            return
+
+        # The span is not made active, since the stream is consumed after this call returns.
+        span = tracer.start_span("cortex.COMPLETE", 'cortex', model=model_name, stream=True)
+        span.bytes = 0
+        error = None
+        try:
+            for token in tokens:
+                span.bytes += len(token)
+                yield token
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            tracer.end_span(span, error)
+
+
+class StubBackend:
+    def __init__(self, response="This is a stub response.", token_delay=0.0, first_token_delay=0.0):
+        """
+        Yields a canned response word by word, for running the app and measuring the UI without Cortex.
+        """
+        self.response = response
+        self.token_delay = token_delay
+        self.first_token_delay = first_token_delay
+
+    def stream(self, model_name, prompt):
+        """
+        Yields the canned response, sleeping first_token_delay before the first token and token_delay between tokens.
+        """
+        time.sleep(self.first_token_delay)
+        words = self.response.split(' ')
+        for i, word in enumerate(words):
+            if i:
+                time.sleep(self.token_delay)
+            yield word if i == len(words) - 1 else word + ' '
+
+
+BACKENDS = {
+    'cortex': CortexBackend,
+    'stub': lambda session, **options: StubBackend(**options),
+}
+
+
+def get_completion_backend(name, session, **options):
+    """
+    Returns the completion backend registered under name.
+    """
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown completion backend: {name}")
+    return BACKENDS[name](session, **options)
+
+
+class CompletionStream:
+    def __init__(self, tokens, on_complete=None, started_at=None):
+        """
+        Wraps a token iterator, recording the time to first token and the total time from started_at
+        (defaults to now). on_complete is called with the full text once the stream is exhausted.
+        """
+        self.tokens = tokens
+        self.on_complete = on_complete
+        self.started_at = time.perf_counter() if started_at is None else started_at
+        self.first_token_at = None
+        self.finished_at = None
+        self.parts = []
+
+    def __iter__(self):
+        for token in self.tokens:
+            if self.first_token_at is None:
+                self.first_token_at = time.perf_counter()
+            self.parts.append(token)
+            yield token
+
+        self.finished_at = time.perf_counter()
+        if self.first_token_at is None:
+            self.first_token_at = self.finished_at
+        logger.info("Completion streamed: ttft=%.3fs total=%.3fs", self.ttft, self.total_time)
+        if self.on_complete is not None:
+            self.on_complete(self.text)
+
+    @property
+    def text(self):
+        return "".join(self.parts)
+
+    @property
+    def ttft(self):
+        """
+        Seconds from started_at to the first token, or None before it arrives.
+        """
+        return None if self.first_token_at is None else self.first_token_at - self.started_at
+
+    @property
+    def total_time(self):
+        return None if self.finished_at is None else self.finished_at - self.started_at
@@ -0,0 +1,9 @@
+import json
+
+
+def load_config(path='config_file.json'):
+    """
+    Loads the app configuration file.
+    """
+    with open(path, 'r') as f:
+        return json.load(f)
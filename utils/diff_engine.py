@@ -0,0 +1,114 @@
+import difflib
+import hashlib
+import re
+from collections import namedtuple
+
+import numpy as np
+
+DocumentDiff = namedtuple('DocumentDiff', ['unchanged', 'modified', 'removed', 'added'])
+
+def normalize_section(text):
+    """
+    Lowercases a section and reduces it to alphanumeric words, so formatting differences do not count as changes.
+    """
+    return " ".join(re.sub(r'[^a-zA-Z0-9\s]', ' ', text).lower().split())
+
+
+def split_sections(text):
+    """
+    Splits text into its non-empty paragraphs.
+    """
+    return [section.strip() for section in re.split(r'\n\s*\n', text) if section.strip()]
+
+
+def fingerprint(section):
+    """
+    Returns a stable hash of the normalized section, equal for sections that differ only in formatting.
+    """
+    return hashlib.sha1(normalize_section(section).encode('utf-8')).hexdigest()
+
+
+class MinHasher:
+    def __init__(self, num_perm=64, shingle_size=3, seed=1):
+        """
+        Estimates the Jaccard similarity of sections from num_perm min-hashes of their shingle_size-word shingles.
+        """
+        self.shingle_size = shingle_size
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(0, np.iinfo(np.uint64).max, size=num_perm, dtype=np.uint64) | np.uint64(1)
+        self._b = rng.integers(0, np.iinfo(np.uint64).max, size=num_perm, dtype=np.uint64)
+
+    def signature(self, section):
+        words = normalize_section(section).split()
+        size = min(self.shingle_size, len(words)) or 1
+        shingles = {" ".join(words[i:i + size]) for i in range(max(1, len(words) - size + 1))}
+        hashes = np.fromiter(
+            (int.from_bytes(hashlib.blake2b(shingle.encode('utf-8'), digest_size=8).digest(), 'little')
+             for shingle in shingles), dtype=np.uint64)
+        # Multiply-shift hashing: the products wrap modulo 2**64 and the high 32 bits are kept.
+        with np.errstate(over='ignore'):
+            return ((np.outer(hashes, self._a) + self._b) >> np.uint64(32)).min(axis=0)
+
+    @staticmethod
+    def similarity(signature1, signature2):
+        return float(np.mean(signature1 == signature2))
+
+
+class DiffEngine:
+    def __init__(self, similarity_threshold=0.4, num_perm=64, shingle_size=3):
+        """
+        Aligns the sections of two documents: identical sections are matched by fingerprint in document order, and
+        the remaining sections are paired as modified when their MinHash similarity reaches similarity_threshold.
+        """
+        self.similarity_threshold = similarity_threshold
+        self.minhasher = MinHasher(num_perm=num_perm, shingle_size=shingle_size)
+
+    def diff(self, sections1, sections2):
+        """
+        Returns a DocumentDiff with the number of unchanged sections, the (old, new, similarity) modified pairs,
+        and the removed and added sections.
+        """
+        hashes1 = [fingerprint(section) for section in sections1]
+        hashes2 = [fingerprint(section) for section in sections2]
+        matcher = difflib.SequenceMatcher(None, hashes1, hashes2, autojunk=False)
+
+        unchanged, modified, removed, added = 0, [], [], []
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+            if tag == 'equal':
+                unchanged += i2 - i1
+                continue
+            pairs, unmatched1, unmatched2 = self._pair(sections1[i1:i2], sections2[j1:j2])
+            modified.extend(pairs)
+            removed.extend(unmatched1)
+            added.extend(unmatched2)
+
+        return DocumentDiff(unchanged, modified, removed, added)
+
+    def _pair(self, sections1, sections2):
+        """
+        Greedily pairs the most similar sections of two unmatched runs, best pairs first.
+        """
+        if not sections1 or not sections2:
+            return [], list(sections1), list(sections2)
+
+        signatures1 = [self.minhasher.signature(section) for section in sections1]
+        signatures2 = [self.minhasher.signature(section) for section in sections2]
+        candidates = sorted(
+            ((self.minhasher.similarity(s1, s2), i, j)
+             for i, s1 in enumerate(signatures1) for j, s2 in enumerate(signatures2)),
+            reverse=True)
+
+        pairs, used1, used2 = [], set(), set()
+        for score, i, j in candidates:
+            if score < self.similarity_threshold:
+                break
+            if i in used1 or j in used2:
+                continue
+            used1.add(i)
+            used2.add(j)
+            pairs.append((i, j, score))
+
+        pairs.sort()
+        return ([(sections1[i], sections2[j], score) for i, j, score in pairs],
+                [section for i, section in enumerate(sections1) if i not in used1],
+                [section for j, section in enumerate(sections2) if j not in used2])
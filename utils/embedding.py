@@ -0,0 +1,78 @@
+import json
+import threading
+from collections import OrderedDict
+
+from utils.vector_index import to_vector
+
+
+def normalize_text(text):
+    """
+    Collapses whitespace and case so trivially different spellings of a question share one embedding.
+    """
+    return " ".join(text.split()).casefold()
+
+
+def vector_literal(vector):
+    """
+    Serializes an embedding for binding into PARSE_JSON(?)::ARRAY::VECTOR(FLOAT, 768).
+    """
+    return json.dumps([float(value) for value in vector])
+
+
+class QueryEmbedder:
+    def __init__(self, model_name='e5-base-v2', max_entries=1024, batch_size=256, dim=768):
+        """
+        Embeds query text with Cortex EMBED_TEXT_768, memoizing up to max_entries embeddings in an LRU keyed
+        on normalized text. embed_many sends up to batch_size texts per query.
+        """
+        self.model_name = model_name
+        self.max_entries = max_entries
+        self.batch_size = batch_size
+        self.dim = dim
+
+        self._lock = threading.Lock()
+        self._cache = OrderedDict()
+
+    def __len__(self):
+        return len(self._cache)
+
+    def _get(self, key):
+        with self._lock:
+            vector = self._cache.get(key)
+            if vector is not None:
+                self._cache.move_to_end(key)
+            return vector
+
+    def _put(self, key, vector):
+        with self._lock:
+            self._cache[key] = vector
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+
+    def embed(self, session, text):
+        """
+        Returns the embedding of text as a float32 array, querying Snowflake only on a cache miss.
+        """
+        return self.embed_many(session, [text])[0]
+
+    def embed_many(self, session, texts):
+        """
+        Returns the embeddings of texts in order, embedding every uncached text in one query per batch.
+        """
+        keys = [normalize_text(text) for text in texts]
+        vectors = {key: self._get(key) for key in keys}
+        missing = list(dict.fromkeys(key for key, vector in vectors.items() if vector is None))
+
+        for start in range(0, len(missing), self.batch_size):
+            batch = missing[start:start + self.batch_size]
+            rows = session.sql('''
+                SELECT t.index AS idx, SNOWFLAKE.CORTEX.EMBED_TEXT_768(?, t.value::VARCHAR) AS embedding
+                FROM TABLE(FLATTEN(input => PARSE_JSON(?))) t
+            ''', params=[self.model_name, json.dumps(batch)]).collect()
+            for row in rows:
+                key = batch[row['IDX']]
+                vectors[key] = to_vector(row['EMBEDDING'], self.dim)
+                self._put(key, vectors[key])
+
+        return [vectors[key] for key in keys]
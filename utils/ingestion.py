@@ -0,0 +1,504 @@
+import contextvars
+import io
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from datetime import datetime
+from itertools import groupby
+
+from utils.bulk_writer import BulkWriter
+from utils.manifest import StageManifest, placeholders
+from utils.pdf_extract import PageText, iter_pdf_pages
+from utils.text_splitter import TextSplitter
+from utils.tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+
+def iter_chunks(pages, chunk_size, chunk_overlap, chunk_unit='chars'):
+    """
+    Chunks a stream of PageText incrementally, so the whole document string is never assembled.
+    chunk_size and chunk_overlap are measured in chunk_unit, 'chars' or 'tokens'.
+    """
+    for chunk in TextSplitter(chunk_size, chunk_overlap, unit=chunk_unit).split_pages(pages):
+        yield chunk.text
+
+
+def extract_pages(pdf_bytes):
+    """
+    Extracts the pages of a downloaded PDF. Runs inside a worker process, so it only takes picklable arguments
+    and returns the document's pages as one list, the only way a result crosses the process boundary.
+    """
+    return list(iter_pdf_pages(io.BytesIO(pdf_bytes)))
+
+
+class IngestionPipeline:
+    def __init__(self, session, download_workers=4, parse_workers=None):
+        """
+        Initializes a three stage ingestion pipeline: stage downloads on a thread pool, PDF page extraction
+        on a process pool, and each file's pages handed to the caller to write to Snowflake as soon as it is parsed.
+        parse_workers defaults to the number of CPU cores.
+        """
+        self.session = session
+        self.download_workers = download_workers
+        self.parse_workers = parse_workers or os.cpu_count() or 1
+        self.failures = {}
+
+    def download(self, file_url):
+        """
+        Downloads a staged file and returns its bytes.
+        """
+        with self.session.file.get_stream(file_url) as file:
+            return file.read()
+
+    def fail(self, file_url, error):
+        """
+        Logs a file that could not be downloaded or parsed and keeps its error in failures.
+        """
+        logger.warning("Skipping %s, it could not be downloaded or parsed", file_url, exc_info=error)
+        self.failures[file_url] = error
+
+    def run(self, file_urls):
+        """
+        Yields (file_url, pages) per file, in completion order.
+        A file that fails to download or parse is left out and its error kept in failures, so one corrupt PDF
+        does not stop the rest of the run.
+        Only download_workers + parse_workers files are in flight at a time, so memory holds a few documents'
+        bytes and pages however many files are synced, never the whole run.
+        """
+        self.failures = {}
+        file_urls = list(file_urls)
+        if not file_urls:
+            return
+        if len(file_urls) == 1:
+            # A single file is not worth starting worker processes for.
+            try:
+                pages = extract_pages(self.download(file_urls[0]))
+            except Exception as e:
+                self.fail(file_urls[0], e)
+            else:
+                yield file_urls[0], pages
+            return
+
+        # Spawned workers do not inherit the Streamlit server's threads and open connections.
+        mp_context = multiprocessing.get_context("spawn")
+        with ThreadPoolExecutor(max_workers=self.download_workers) as downloads, \
+                ProcessPoolExecutor(max_workers=self.parse_workers, mp_context=mp_context) as parsers:
+            download_futures = {}
+            parse_futures = {}
+            queued = iter(file_urls)
+            pending = set()
+
+            def submit_downloads():
+                while len(pending) < self.download_workers + self.parse_workers:
+                    file_url = next(queued, None)
+                    if file_url is None:
+                        return
+                    # Downloads run in the caller's tracing context, so their spans nest under the sync.
+                    future = downloads.submit(contextvars.copy_context().run, self.download, file_url)
+                    download_futures[future] = file_url
+                    pending.add(future)
+
+            submit_downloads()
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                pending.difference_update(done)
+                parsed = []
+                for future in done:
+                    if future in download_futures:
+                        file_url = download_futures.pop(future)
+                        try:
+                            parse_future = parsers.submit(extract_pages, future.result())
+                        except Exception as e:
+                            self.fail(file_url, e)
+                            continue
+                        parse_futures[parse_future] = file_url
+                        pending.add(parse_future)
+                    else:
+                        file_url = parse_futures.pop(future)
+                        try:
+                            parsed.append((file_url, future.result()))
+                        except Exception as e:
+                            self.fail(file_url, e)
+
+                submit_downloads()
+                yield from parsed
+
+
+def ingestion_timestamp():
+    """
+    Returns the (date, time) strings stamped on ingested chunks, in Chicago time.
+    """
+    import pytz
+
+    chicago_time = datetime.now(pytz.timezone("America/Chicago"))
+    return chicago_time.strftime("%Y-%m-%d"), chicago_time.strftime("%I:%M:%S %p")
+
+
+class PageStore:
+    # Serializes syncs of the page table across the ingestors running in this process.
+    _lock = threading.Lock()
+
+    def __init__(self, session, stage_path='pdf_store', database_name='BAMBOO', schema_name='BILLS',
+                 pages_table='PDF_PAGES', manifest_table='STAGE_MANIFEST',
+                 download_workers=4, parse_workers=None, bulk_flush_rows=50000):
+        """
+        Keeps the page-level text of every staged PDF in the pages table, so each PDF is downloaded and parsed
+        once and every chunk table is derived from the stored text.
+        Pages are bulk loaded every bulk_flush_rows rows.
+        """
+        self.session = session
+        self.stage_path_url = f"@{database_name}.{schema_name}.{stage_path}"
+        self.pages_table = f"{database_name}.{schema_name}.{pages_table}"
+        self.download_workers = download_workers
+        self.parse_workers = parse_workers
+        self.bulk_flush_rows = bulk_flush_rows
+        self.manifest = StageManifest(session, self.stage_path_url, stage_path,
+                                      f"{database_name}.{schema_name}.{manifest_table}", self.pages_table)
+
+    @tracer.traced()
+    def sync(self, file_names=None):
+        """
+        Removes the pages of changed or deleted PDFs and extracts new and changed ones, only those in
+        file_names when given. Returns {file_name: error} of the PDFs that could not be read; they are left out
+        of the manifest, so the next sync retries them.
+        """
+        with self._lock:
+            changes = self.manifest.diff()
+            stale = changes['update'] | changes['delete']
+            if stale:
+                self.manifest.delete_rows(self.pages_table, stale)
+                self.manifest.forget(stale)
+
+            pending = changes['add'] | changes['update']
+            if file_names is not None:
+                pending &= set(file_names)
+            file_urls = [f'{self.stage_path_url}/{file_name}' for file_name in sorted(pending)]
+
+            pipeline = IngestionPipeline(
+                self.session,
+                download_workers=self.download_workers,
+                parse_workers=self.parse_workers
+            )
+            staged = changes['staged']
+            with BulkWriter(self.session, self.pages_table, flush_rows=self.bulk_flush_rows,
+                            on_flush=lambda names: self.manifest.record([f"{name}.pdf" for name in names], staged)) as writer:
+                for file_url, pages in pipeline.run(file_urls):
+                    if not pages:
+                        # Files without pages never reach a flush, so they are recorded right away.
+                        self.manifest.record([file_url.split("/")[1]], staged)
+                        continue
+                    writer.add(self.page_frame([(file_url, pages)]))
+            return {file_url.split("/")[1]: error for file_url, error in pipeline.failures.items()}
+
+    @staticmethod
+    def page_frame(batch):
+        """
+        Returns the page rows of a batch of (file_url, pages) as a DataFrame.
+        """
+        import pandas as pd
+
+        rows = [(file_url, file_url.split("/")[1].replace('.pdf', ''), page.page_number, page.start, page.text)
+                for file_url, pages in batch for page in pages]
+        df = pd.DataFrame(rows, columns=['file_path', 'file_name', 'page_number', 'start_offset', 'text'])
+        df['date'], df['time'] = ingestion_timestamp()
+        return df
+
+    def iter_pages(self, file_names):
+        """
+        Yields (file_name, pages) for each of the given PDFs, where pages lazily yields its PageText in page
+        order from one streamed query, so only the rows being chunked are held in memory. A file's pages must
+        be consumed before the next file is yielded.
+        """
+        names = [name.replace('.pdf', '') for name in file_names]
+        if not names:
+            return
+        rows = self.session.sql(f'''
+            SELECT "file_name", "page_number", "text", "start_offset" FROM {self.pages_table}
+            WHERE "file_name" IN ({placeholders(names)})
+            ORDER BY "file_name", "page_number"
+        ''', params=names).to_local_iterator()
+        seen = set()
+        for name, file_rows in groupby(rows, key=lambda row: row['file_name']):
+            seen.add(name)
+            yield name, (PageText(row['page_number'], row['text'] or '', row['start_offset']) for row in file_rows)
+        # Files without stored pages have no rows.
+        for name in names:
+            if name not in seen:
+                yield name, iter(())
+
+
+class RAGIngestor:
+    def __init__(self, session, stage_path='pdf_store', database_name='BAMBOO', schema_name='BILLS',
+                 chunk_table_name='CHUNKED_PDF_RAG', vector_store_table='VECTOR_STORE_RAG',
+                 embed_model_name='e5-base-v2', manifest_table='STAGE_MANIFEST', vector_index=None,
+                 download_workers=4, parse_workers=None, write_batch_size=20,
+                 answer_cache=None, answer_cache_table=None, chunk_size=10000, chunk_overlap=500,
+                 lexical_index=None, tags_table=None, pages_table='PDF_PAGES', bulk_flush_rows=50000,
+                 chunk_unit='chars'):
+        """
+        Keeps the RAG chunk table, vector store and (optionally) an in-process VectorIndex and BM25Index in sync
+        with the stage, chunking the page text shared in pages_table. Tags in tags_table are dropped with their
+        deleted PDFs.
+        Cached answers that cite a changed or deleted PDF are dropped from answer_cache and answer_cache_table.
+        Chunks are bulk loaded every bulk_flush_rows rows, and embedded after each load.
+        chunk_size and chunk_overlap are measured in chunk_unit, 'chars' or 'tokens'.
+        """
+        self.session = session
+        self.stage_path_url = f"@{database_name}.{schema_name}.{stage_path}"
+        self.database_name = database_name
+        self.schema_name = schema_name
+        self.chunk_table_name = chunk_table_name
+        self.vector_store_table = vector_store_table
+        self.embed_model_name = embed_model_name
+        self.vector_index = vector_index
+        self.lexical_index = lexical_index
+        self.tags_table = tags_table
+        self.write_batch_size = write_batch_size
+        self.answer_cache = answer_cache
+        self.answer_cache_table = answer_cache_table
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.chunk_unit = chunk_unit
+        self.bulk_flush_rows = bulk_flush_rows
+        self.page_store = PageStore(session, stage_path=stage_path, database_name=database_name,
+                                    schema_name=schema_name, pages_table=pages_table, manifest_table=manifest_table,
+                                    download_workers=download_workers, parse_workers=parse_workers,
+                                    bulk_flush_rows=bulk_flush_rows)
+        self.manifest = StageManifest(session, self.stage_path_url, stage_path,
+                                      f"{database_name}.{schema_name}.{manifest_table}",
+                                      f"{database_name}.{schema_name}.{chunk_table_name}")
+
+    def forget_files(self, file_names):
+        """
+        Drops the given PDFs from the in-process indexes and answer cache.
+        """
+        names = [file_name.replace('.pdf', '') for file_name in file_names]
+        if self.vector_index is not None:
+            self.vector_index.remove_files(names)
+        if self.lexical_index is not None:
+            for name in names:
+                self.lexical_index.remove_file(name)
+        if self.answer_cache is not None:
+            for name in names:
+                self.answer_cache.invalidate_file(name)
+
+    @tracer.traced()
+    def refresh_indexes(self, known):
+        """
+        Applies syncs run by other processes, such as the headless ingestion worker, to the in-process indexes
+        and answer cache. known is the manifest ({file_name: fingerprint}) the indexes reflect; every file
+        recorded differently since is reloaded from the vector store. Returns the manifest as now recorded.
+        """
+        recorded = self.manifest.load()
+        changed = sorted(name for name in known.keys() | recorded.keys() if known.get(name) != recorded.get(name))
+        if changed:
+            self.forget_files(changed)
+            self.index_files([name.replace('.pdf', '') for name in changed if name in recorded])
+        return recorded
+
+    @tracer.traced()
+    def sync(self):
+        """
+        Removes rows of changed or deleted PDFs, then chunks and embeds new and changed ones.
+        Returns the names of the PDFs found changed, added or deleted on the stage.
+        """
+        changes = self.manifest.diff()
+
+        stale = changes['update'] | changes['delete']
+        if stale:
+            self.manifest.delete_rows(f"{self.database_name}.{self.schema_name}.{self.chunk_table_name}", stale)
+            self.manifest.delete_rows(f"{self.database_name}.{self.schema_name}.{self.vector_store_table}", stale)
+            self.forget_files(stale)
+            if self.answer_cache_table is not None:
+                self.delete_cached_answers(stale)
+            if self.tags_table is not None:
+                self.manifest.delete_rows(f"{self.database_name}.{self.schema_name}.{self.tags_table}", changes['delete'])
+            self.manifest.forget(changes['delete'])
+
+        dif_list = sorted(changes['add'] | changes['update'])
+        # PDFs that could not be read have no pages; they stay out of the manifest and are retried next sync.
+        failed = self.page_store.sync(dif_list)
+        dif_list = [file_name for file_name in dif_list if file_name not in failed]
+
+        staged = changes['staged']
+
+        def on_flush(names):
+            self.embed_files(names)
+            self.manifest.record([f"{name}.pdf" for name in names], staged)
+
+        with BulkWriter(self.session, f"{self.database_name}.{self.schema_name}.{self.chunk_table_name}",
+                        flush_rows=self.bulk_flush_rows, on_flush=on_flush) as writer:
+            for start in range(0, len(dif_list), self.write_batch_size):
+                for name, pages in self.page_store.iter_pages(dif_list[start:start + self.write_batch_size]):
+                    # The overlap keeps chunks contextual across their boundaries. A file's chunks are added
+                    # together, so a flush never loads part of a file.
+                    chunks = list(iter_chunks(pages, self.chunk_size, self.chunk_overlap, self.chunk_unit))
+                    if not chunks:
+                        # Files without chunks never reach a flush, so they are recorded right away.
+                        self.manifest.record([f"{name}.pdf"], staged)
+                        continue
+                    writer.add(self.chunk_frame([(f'{self.stage_path_url}/{name}.pdf', chunks)]))
+        return changes['add'] | changes['update'] | changes['delete']
+
+    def delete_cached_answers(self, file_names):
+        """
+        Deletes persisted answers citing any of the given PDFs; an answer may cite several files separated by ', '.
+        """
+        file_names = [name.replace('.pdf', '') for name in file_names]
+        self.session.sql(f'''
+            DELETE FROM {self.database_name}.{self.schema_name}.{self.answer_cache_table}
+            WHERE ARRAYS_OVERLAP(SPLIT("file_name", ', '), ARRAY_CONSTRUCT({placeholders(file_names)}))
+        ''', params=file_names).collect()
+
+    @staticmethod
+    def chunk_frame(batch):
+        """
+        Returns the chunk rows of a batch of (file_url, chunks) as a DataFrame.
+        """
+        import pandas as pd
+
+        frames = []
+        for file_url, chunks in batch:
+            df = pd.DataFrame(chunks, columns=['chunks'])
+            df['file_path'] = file_url
+            df['file_name'] = file_url.split("/")[1].replace('.pdf', '')
+            df['chunk_index'] = range(len(df))
+            frames.append(df)
+        df = pd.concat(frames, ignore_index=True)
+        df['date'], df['time'] = ingestion_timestamp()
+        return df
+
+    @tracer.traced()
+    def embed_files(self, file_names):
+        """
+        Embeds the loaded chunks of the given files into the vector store with one statement, and adds them
+        to the in-process indexes.
+        """
+        if not file_names:
+            return
+
+        # EMBED_TEXT_768 returns VECTOR(FLOAT, 768), so the native column is written without a cast.
+        self.session.sql(
+            f'''insert into {self.database_name}.{self.schema_name}.{self.vector_store_table} ("file_name", "chunks", VECTOR_EMBEDINGS, "chunk_index")
+            select "file_name", "chunks", SNOWFLAKE.CORTEX.EMBED_TEXT_768(?, "chunks"), "chunk_index"
+            from {self.database_name}.{self.schema_name}.{self.chunk_table_name} where "file_name" in ({placeholders(file_names)})''',
+            params=[self.embed_model_name] + file_names).collect()
+        self.index_files(file_names)
+
+    def index_files(self, file_names):
+        """
+        Adds the embedded chunks of the given files to the in-process indexes.
+        """
+        if not file_names or self.vector_index is None and self.lexical_index is None:
+            return
+        rows = self.session.sql(
+            f'''select "file_name", "chunks", VECTOR_EMBEDINGS, "chunk_index"
+            from {self.database_name}.{self.schema_name}.{self.vector_store_table} where "file_name" in ({placeholders(file_names)})''',
+            params=file_names).collect()
+        if self.vector_index is not None:
+            self.vector_index.add([row['file_name'] for row in rows], [row['chunks'] for row in rows],
+                                  [row['VECTOR_EMBEDINGS'] for row in rows], [row['chunk_index'] for row in rows])
+        if self.lexical_index is not None:
+            self.lexical_index.add([row['file_name'] for row in rows], [row['chunk_index'] for row in rows],
+                                   [row['chunks'] for row in rows])
+
+
+class SummaryIngestor:
+    def __init__(self, session, stage_path='pdf_store', database_name='BAMBOO', schema_name='BILLS',
+                 chunked_table='CHUNKED_PDF_SUM', summary_table='SUMMARIZED_CONTENT',
+                 manifest_table='STAGE_MANIFEST', levels_table='SUMMARY_LEVELS', pages_table='PDF_PAGES',
+                 chunk_size=30000, chunk_overlap=1000, bulk_flush_rows=50000, chunk_unit='chars'):
+        """
+        Keeps the summary chunk table in sync with the stage, one file at a time or for the whole stage,
+        chunking the page text shared in pages_table. Chunks are bulk loaded every bulk_flush_rows rows.
+        chunk_size and chunk_overlap are measured in chunk_unit, 'chars' or 'tokens'.
+        """
+        self.session = session
+        self.stage_path_url = f"@{database_name}.{schema_name}.{stage_path}"
+        self.database_name = database_name
+        self.schema_name = schema_name
+        self.chunked_table = chunked_table
+        self.summary_table = summary_table
+        self.levels_table = levels_table
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.chunk_unit = chunk_unit
+        self.bulk_flush_rows = bulk_flush_rows
+        self.page_store = PageStore(session, stage_path=stage_path, database_name=database_name,
+                                    schema_name=schema_name, pages_table=pages_table, manifest_table=manifest_table,
+                                    bulk_flush_rows=bulk_flush_rows)
+        self.manifest = StageManifest(session, self.stage_path_url, stage_path,
+                                      f"{database_name}.{schema_name}.{manifest_table}",
+                                      f"{database_name}.{schema_name}.{chunked_table}")
+
+    def remove_stale(self, changes):
+        """
+        Deletes chunk, summary and summary level rows of re-uploaded or deleted PDFs.
+        """
+        stale = changes['update'] | changes['delete']
+        if stale:
+            self.manifest.delete_rows(f"{self.database_name}.{self.schema_name}.{self.chunked_table}", stale)
+            self.manifest.delete_rows(f"{self.database_name}.{self.schema_name}.{self.summary_table}", stale)
+            self.manifest.delete_rows(f"{self.database_name}.{self.schema_name}.{self.levels_table}", stale)
+            self.manifest.forget(changes['delete'])
+
+    def bulk_writer(self, staged):
+        """
+        Returns a BulkWriter over the summary chunk table that records the loaded files in the manifest.
+        """
+        return BulkWriter(self.session, f"{self.database_name}.{self.schema_name}.{self.chunked_table}",
+                          flush_rows=self.bulk_flush_rows,
+                          on_flush=lambda names: self.manifest.record([f"{name}.pdf" for name in names], staged))
+
+    def load_file(self, file_name, staged, writer):
+        """
+        Chunks the stored pages of a PDF into the given BulkWriter.
+        """
+        file_url = f'{self.stage_path_url}/{file_name}'
+        chunks = [chunk for _, pages in self.page_store.iter_pages([file_name])
+                  for chunk in iter_chunks(pages, self.chunk_size, self.chunk_overlap, self.chunk_unit)]
+        if not chunks:
+            # Files without chunks never reach a flush, so they are recorded right away.
+            self.manifest.record([file_name], staged)
+            return
+
+        import pandas as pd
+
+        df = pd.DataFrame(chunks, columns=['chunks'])
+        df['file_path'] = file_url
+        df['file_name'] = file_name.replace('.pdf', '')
+        df['chunk_index'] = range(len(df))
+        df['date'], df['time'] = ingestion_timestamp()
+        writer.add(df)
+
+    @tracer.traced()
+    def process_load(self, file_name):
+        """
+        Loads one staged PDF if it is new or changed on the stage.
+        Only this PDF's stale rows are removed: jobs on other PDFs may be loading theirs concurrently.
+        """
+        changes = self.manifest.diff()
+        self.remove_stale({change: changes[change] & {file_name} for change in ('update', 'delete')})
+        if file_name in changes['add'] | changes['update']:
+            failed = self.page_store.sync([file_name])
+            if file_name in failed:
+                raise ValueError(f"Unable to read {file_name}: {failed[file_name]}")
+            with self.bulk_writer(changes['staged']) as writer:
+                self.load_file(file_name, changes['staged'], writer)
+
+    @tracer.traced()
+    def sync(self):
+        """
+        Loads every new or changed staged PDF.
+        """
+        changes = self.manifest.diff()
+        self.remove_stale(changes)
+        pending = sorted(changes['add'] | changes['update'])
+        failed = self.page_store.sync(pending)
+        pending = [file_name for file_name in pending if file_name not in failed]
+        with self.bulk_writer(changes['staged']) as writer:
+            for file_name in pending:
+                self.load_file(file_name, changes['staged'], writer)
@@ -0,0 +1,400 @@
+import queue
+import threading
+import time
+import traceback
+import uuid
+from collections import Counter, deque
+from contextlib import nullcontext
+
+import streamlit as st
+
+from utils.ingestion import RAGIngestor, SummaryIngestor
+from utils.config import load_config
+from utils.session import create_session_pool, get_session_pool
+from utils.summarizer import DocumentSummarizer
+from utils.tracing import get_tracer, tracer
+
+JOB_RAG_SYNC = 'rag_sync'
+JOB_SUMMARY_LOAD = 'summary_load'
+JOB_SUMMARY_SYNC = 'summary_sync'
+JOB_SUMMARY_PREPARE = 'summary_prepare'
+
+STATUS_QUEUED = 'QUEUED'
+STATUS_RUNNING = 'RUNNING'
+STATUS_SUCCEEDED = 'SUCCEEDED'
+STATUS_FAILED = 'FAILED'
+
+PENDING_JOBS_KEY = 'ingestion_jobs_pending'
+
+
+class IngestionWorker:
+    def __init__(self, session_pool, config, min_sync_interval=None, max_workers=None, job_history=None):
+        """
+        Initializes a long-lived ingestion worker: max_workers daemon threads draining a job queue, with every
+        job's progress mirrored to the jobs status table.
+        Pages submit jobs and poll status() instead of running ingestion on the render path.
+        Each job borrows a session from session_pool for its duration. Jobs on different documents run
+        concurrently; a sync never overlaps another job on the same tables.
+        Only the job_history most recently finished jobs are kept for status().
+        """
+        self.session_pool = session_pool
+        self.config = config
+        worker_config = config.get('ingestion_worker', {})
+        db_schema = config['db_schema']
+        self.database_name = db_schema['database_name']
+        self.schema_name = db_schema['schema_name']
+        self.jobs_table = f"{self.database_name}.{self.schema_name}.{worker_config.get('jobs_table', 'INGESTION_JOBS')}"
+        if min_sync_interval is None:
+            min_sync_interval = worker_config.get('sync_interval_seconds', 60)
+        self.min_sync_interval = min_sync_interval
+        if max_workers is None:
+            max_workers = worker_config.get('max_workers', 2)
+        self.max_workers = max_workers
+        if job_history is None:
+            job_history = worker_config.get('job_history', 1000)
+        self.job_history = job_history
+        self.vector_index = None
+        self.answer_cache = None
+        self.lexical_index = None
+        self._rag_manifest = None
+
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._jobs = {}
+        self._finished = deque()
+        self._pending = {}
+        self._last_finished = {}
+        self._generations = Counter()
+        self._threads = []
+        self._running = []
+        self._slots = threading.Condition()
+
+    def start(self):
+        """
+        Starts the worker threads that are not already running.
+        """
+        with self._lock:
+            self._threads = [thread for thread in self._threads if thread.is_alive()]
+            while len(self._threads) < self.max_workers:
+                thread = threading.Thread(target=self._run, name=f"ingestion-worker-{len(self._threads)}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+        return self
+
+    def attach_vector_index(self, vector_index):
+        """
+        Keeps the given in-process VectorIndex up to date with every RAG sync.
+        """
+        self.vector_index = vector_index
+
+    def attach_lexical_index(self, lexical_index):
+        """
+        Keeps the given in-process BM25Index up to date with every RAG sync.
+        """
+        self.lexical_index = lexical_index
+
+    def attach_answer_cache(self, answer_cache):
+        """
+        Drops cached answers that cite documents changed or deleted by a RAG sync.
+        """
+        self.answer_cache = answer_cache
+
+    def watch_outside_syncs(self, session):
+        """
+        Starts tracking the RAG manifest, so every RAG sync first applies the syncs other processes ran since,
+        such as the headless worker's, to the attached indexes and answer cache. Call it before loading them,
+        so nothing recorded in between is missed; later calls do nothing.
+        """
+        with self._lock:
+            if self._rag_manifest is not None:
+                return
+        manifest = self.rag_ingestor(session).manifest.load()
+        with self._lock:
+            if self._rag_manifest is None:
+                self._rag_manifest = manifest
+
+    def submit(self, job_type, target=None, throttle=False, session=None):
+        """
+        Queues a job and returns its id. A job identical to one still queued or running is not queued twice.
+        With throttle=True, a job that finished less than min_sync_interval seconds ago is not repeated and None is returned.
+        The job's status row is written on session when given, e.g. the page's own, and on a pooled one otherwise.
+        """
+        key = (job_type, target)
+        with self._lock:
+            if key in self._pending:
+                return self._pending[key]
+            finished = self._last_finished.get(key)
+            if throttle and finished is not None and time.monotonic() - finished < self.min_sync_interval:
+                return None
+
+            job_id = uuid.uuid4().hex
+            job = {'job_id': job_id, 'job_type': job_type, 'target': target, 'status': STATUS_QUEUED, 'error': None}
+            self._jobs[job_id] = job
+            self._pending[key] = job_id
+
+        # The row is inserted before the job is queued, so a worker's later updates always find it.
+        self._record_status(job_id, job, STATUS_QUEUED, session=session)
+        self._queue.put(job_id)
+        return job_id
+
+    def join(self):
+        """
+        Blocks until every queued job has finished.
+        """
+        self._queue.join()
+
+    def generation(self, job_type):
+        """
+        Returns how many jobs of job_type have succeeded, so readers can cache what those jobs write until
+        the next one finishes.
+        """
+        with self._lock:
+            return self._generations[job_type]
+
+    def status(self, job_id):
+        """
+        Returns the status record of a job, or None for an unknown id.
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def _update(self, job_id, status, error=None):
+        with self._lock:
+            job = self._jobs[job_id]
+            job['status'] = status
+            job['error'] = error
+            if status in (STATUS_SUCCEEDED, STATUS_FAILED):
+                key = (job['job_type'], job['target'])
+                self._pending.pop(key, None)
+                self._last_finished[key] = time.monotonic()
+                self._finished.append(job_id)
+                if status == STATUS_SUCCEEDED:
+                    self._generations[job['job_type']] += 1
+                while len(self._finished) > self.job_history:
+                    self._jobs.pop(self._finished.popleft(), None)
+
+        self._record_status(job_id, job, status, error)
+
+    def _record_status(self, job_id, job, status, error=None, session=None):
+        try:
+            with nullcontext(session) if session is not None else self.session_pool.session() as session:
+                self._write_status(session, job_id, job, status, error)
+        except Exception:
+            # The status table is informational; a failed write must not stop ingestion.
+            traceback.print_exc()
+
+    def _write_status(self, session, job_id, job, status, error):
+        if status == STATUS_QUEUED:
+            session.sql(f'''
+                INSERT INTO {self.jobs_table} ("job_id", "job_type", "target", "status", "submitted_at", "updated_at")
+                VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP(), CURRENT_TIMESTAMP())
+            ''', params=[job_id, job['job_type'], job['target'], status]).collect()
+        else:
+            session.sql(f'''
+                UPDATE {self.jobs_table} SET "status" = ?, "error" = ?, "updated_at" = CURRENT_TIMESTAMP()
+                WHERE "job_id" = ?
+            ''', params=[status, error, job_id]).collect()
+
+    @staticmethod
+    def _conflicts(job, other):
+        """
+        Returns True if two jobs write the same rows: any two jobs on the same tables unless both target
+        different single documents.
+        """
+        lanes = {JOB_RAG_SYNC: 'rag'}
+        if lanes.get(job[0], 'summary') != lanes.get(other[0], 'summary'):
+            return False
+        if job[0] in (JOB_SUMMARY_LOAD, JOB_SUMMARY_PREPARE) and other[0] in (JOB_SUMMARY_LOAD, JOB_SUMMARY_PREPARE):
+            return job[1] == other[1]
+        return True
+
+    def _run(self):
+        while True:
+            job_id = self._queue.get()
+            job = self.status(job_id)
+            key = (job['job_type'], job['target'])
+            with self._slots:
+                self._slots.wait_for(lambda: not any(self._conflicts(key, other) for other in self._running))
+                self._running.append(key)
+
+            self._update(job_id, STATUS_RUNNING)
+            try:
+                with tracer.trace(job['job_type'], kind='job', target=job['target']), \
+                        self.session_pool.session() as session:
+                    self.run_job(session, job['job_type'], job['target'])
+            except Exception as e:
+                traceback.print_exc()
+                self._update(job_id, STATUS_FAILED, str(e))
+            else:
+                self._update(job_id, STATUS_SUCCEEDED)
+            finally:
+                with self._slots:
+                    self._running.remove(key)
+                    self._slots.notify_all()
+                self._queue.task_done()
+
+    def rag_ingestor(self, session):
+        """
+        Returns a RAGIngestor on the given session that keeps the attached indexes and answer cache up to date.
+        """
+        db_schema = self.config['db_schema']
+        rag_app_config = self.config['rag_app']
+        cache_config = rag_app_config.get('answer_cache', {})
+        return RAGIngestor(
+            session,
+            stage_path=rag_app_config['stage_path'],
+            database_name=self.database_name,
+            schema_name=self.schema_name,
+            chunk_table_name=rag_app_config['chunk_table_name'],
+            vector_store_table=rag_app_config['vector_store_table'],
+            embed_model_name=rag_app_config['embed_model_name'],
+            manifest_table=db_schema.get('manifest_table', 'STAGE_MANIFEST'),
+            vector_index=self.vector_index,
+            download_workers=rag_app_config.get('ingest_download_workers', 4),
+            parse_workers=rag_app_config.get('ingest_parse_workers'),
+            write_batch_size=rag_app_config.get('ingest_write_batch_size', 20),
+            bulk_flush_rows=rag_app_config.get('ingest_bulk_flush_rows', 50000),
+            answer_cache=self.answer_cache,
+            answer_cache_table=cache_config.get('table', 'ANSWER_CACHE') if cache_config.get('persist') else None,
+            chunk_size=rag_app_config.get('chunk_size', 10000),
+            chunk_overlap=rag_app_config.get('chunk_overlap', 500),
+            chunk_unit=rag_app_config.get('chunk_unit', 'chars'),
+            lexical_index=self.lexical_index,
+            tags_table=rag_app_config.get('tags_table', 'DOCUMENT_TAGS'),
+            pages_table=db_schema.get('pages_table', 'PDF_PAGES')
+        )
+
+    def run_job(self, session, job_type, target=None):
+        """
+        Runs a job synchronously on the given session.
+        """
+        db_schema = self.config['db_schema']
+        manifest_table = db_schema.get('manifest_table', 'STAGE_MANIFEST')
+        pages_table = db_schema.get('pages_table', 'PDF_PAGES')
+
+        if job_type == JOB_RAG_SYNC:
+            ingestor = self.rag_ingestor(session)
+            with self._lock:
+                known = self._rag_manifest
+            if known is not None:
+                known = ingestor.refresh_indexes(known)
+            synced = ingestor.sync()
+            if known is not None:
+                # The indexes reflect the files this sync changed as recorded now; any other file recorded
+                # differently was synced outside and is applied by the next sync.
+                recorded = ingestor.manifest.load()
+                for file_name in synced:
+                    if file_name in recorded:
+                        known[file_name] = recorded[file_name]
+                    else:
+                        known.pop(file_name, None)
+                with self._lock:
+                    self._rag_manifest = known
+        elif job_type in (JOB_SUMMARY_LOAD, JOB_SUMMARY_SYNC, JOB_SUMMARY_PREPARE):
+            summary_app_config = self.config['summary_app']
+            ingestor = SummaryIngestor(
+                session,
+                stage_path=summary_app_config['stage_path'],
+                database_name=self.database_name,
+                schema_name=self.schema_name,
+                chunked_table=summary_app_config['chunked_table'],
+                summary_table=summary_app_config['summary_table'],
+                manifest_table=manifest_table,
+                levels_table=summary_app_config.get('levels_table', 'SUMMARY_LEVELS'),
+                pages_table=pages_table,
+                chunk_size=summary_app_config.get('chunk_size', 30000),
+                chunk_overlap=summary_app_config.get('chunk_overlap', 1000),
+                chunk_unit=summary_app_config.get('chunk_unit', 'chars'),
+                bulk_flush_rows=summary_app_config.get('bulk_flush_rows', 50000)
+            )
+            if job_type == JOB_SUMMARY_LOAD:
+                ingestor.process_load(target)
+            elif job_type == JOB_SUMMARY_PREPARE:
+                ingestor.process_load(target)
+                DocumentSummarizer(
+                    session,
+                    database_name=self.database_name,
+                    schema_name=self.schema_name,
+                    chunked_table=summary_app_config['chunked_table'],
+                    summary_table=summary_app_config['summary_table']
+                ).summarize(target)
+            else:
+                ingestor.sync()
+        else:
+            raise ValueError(f"Unknown ingestion job type: {job_type}")
+
+
+@st.cache_resource(show_spinner=False)
+def get_ingestion_worker():
+    """
+    Returns the ingestion worker shared by every page and user of this Streamlit server.
+    """
+    return IngestionWorker(get_session_pool(), load_config()).start()
+
+
+def wait_for_jobs(worker, job_type, targets, message="Preparing documents...", versions=None, session=None):
+    """
+    Submits one job per target, once per browser session and version, and checks on them without blocking on
+    ingestion. versions maps targets to their staged md5; a target whose md5 changed since its job was submitted
+    is submitted again, so a re-uploaded document is reloaded. session is the page's, used to queue the jobs.
+    Returns True once every job has succeeded; otherwise shows their progress and returns False.
+    Pending jobs are polled by rerun_while_pending, once the page has returned its session to the pool.
+    """
+    jobs = []
+    for target in targets:
+        key = f"ingestion_job:{job_type}:{target}"
+        version = versions.get(target) if versions else None
+        job_id, submitted_version = st.session_state.get(key, (None, None))
+        job = worker.status(job_id) if job_id is not None else None
+        if job is None or submitted_version != version:
+            job_id = worker.submit(job_type, target, session=session)
+            st.session_state[key] = (job_id, version)
+            job = worker.status(job_id)
+        if job['status'] == STATUS_FAILED:
+            del st.session_state[key]
+            st.error(f"Ingestion of {target} failed: {job['error']}")
+            return False
+        jobs.append(job)
+
+    if all(job['status'] == STATUS_SUCCEEDED for job in jobs):
+        return True
+
+    st.info(message)
+    st.session_state[PENDING_JOBS_KEY] = True
+    return False
+
+
+def rerun_while_pending(worker):
+    """
+    Waits one poll interval and reruns the page if wait_for_jobs left jobs pending during this run.
+    Pages call it after releasing their pooled session, so the wait does not hold a session the worker needs.
+    """
+    if not st.session_state.pop(PENDING_JOBS_KEY, False):
+        return
+    time.sleep(worker.config.get('ingestion_worker', {}).get('poll_interval_seconds', 2))
+    st.rerun()
+
+
+def main():
+    """
+    Runs the ingestion worker headless, syncing the RAG and summary tables with the stage on an interval.
+    The Search page's worker applies the files this daemon synced to its in-process indexes and answer cache
+    at the start of its next RAG sync, at most sync_interval_seconds after a page render.
+    """
+    config = load_config()
+    job_tracer = get_tracer()
+    # One session runs the job, the other writes the status rows of jobs submitted meanwhile.
+    session_pool = create_session_pool(max_size=2, tracer=job_tracer if job_tracer.enabled else None)
+    worker = IngestionWorker(session_pool, config, min_sync_interval=0, max_workers=1).start()
+    interval = config.get('ingestion_worker', {}).get('sync_interval_seconds', 60)
+
+    while True:
+        worker.submit(JOB_RAG_SYNC)
+        worker.submit(JOB_SUMMARY_SYNC)
+        worker.join()
+        time.sleep(interval)
+
+
+if __name__ == "__main__":
+    main()
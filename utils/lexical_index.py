@@ -0,0 +1,128 @@
+import math
+import re
+import threading
+from collections import Counter, defaultdict
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[.\-/][a-z0-9]+)*")
+STOPWORDS = frozenset("""
+a an and are as at be by can do does for from has have how in is it its of on or that the their there these
+this to was what when where which who why will with about under into than
+""".split())
+
+
+def tokenize(text):
+    """
+    Lowercases text and splits it into terms, keeping identifiers such as "h.r.-1234" or "2023/2772" whole.
+    """
+    return [term for term in TOKEN_PATTERN.findall(text.casefold()) if term not in STOPWORDS]
+
+
+class BM25Index:
+    def __init__(self, k1=1.5, b=0.75, max_df_ratio=0.2):
+        """
+        Initializes an in-process inverted index over chunks keyed by (file_name, chunk_index), scored with BM25.
+        Terms occurring in more than max_df_ratio of the chunks are too common to select candidates on their own.
+        """
+        self.k1 = k1
+        self.b = b
+        self.max_df_ratio = max_df_ratio
+
+        self._lock = threading.RLock()
+        self._postings = defaultdict(dict)
+        self._docs = {}
+        self._files = defaultdict(list)
+        self._unkeyed = Counter()
+        self._next_id = 0
+        self._total_length = 0
+
+    def __len__(self):
+        return len(self._docs)
+
+    @property
+    def unkeyed(self):
+        """
+        Number of chunks left out because they have no chunk_index, e.g. rows written before chunks were numbered.
+        """
+        return sum(self._unkeyed.values())
+
+    @classmethod
+    def load_from_table(cls, session, table_name, **kwargs):
+        """
+        Builds the index from every row of the given chunk table.
+        """
+        index = cls(**kwargs)
+        rows = session.sql(f'SELECT "file_name", "chunk_index", "chunks" FROM {table_name}').collect()
+        index.add(
+            [row["file_name"] for row in rows],
+            [row["chunk_index"] for row in rows],
+            [row["chunks"] for row in rows],
+        )
+        return index
+
+    def add(self, file_names, chunk_indexes, texts):
+        """
+        Indexes the given chunks. Chunks without a chunk_index cannot be keyed and are only counted in unkeyed.
+        """
+        with self._lock:
+            for file_name, chunk_index, text in zip(file_names, chunk_indexes, texts):
+                if chunk_index is None:
+                    self._unkeyed[file_name] += 1
+                    continue
+                terms = Counter(tokenize(text))
+                length = sum(terms.values())
+                doc_id = self._next_id
+                self._next_id += 1
+
+                self._docs[doc_id] = ((file_name, chunk_index), length, tuple(terms))
+                self._files[file_name].append(doc_id)
+                self._total_length += length
+                for term, tf in terms.items():
+                    self._postings[term][doc_id] = tf
+
+    def remove_file(self, file_name):
+        """
+        Drops every chunk belonging to file_name.
+        """
+        with self._lock:
+            self._unkeyed.pop(file_name, None)
+            for doc_id in self._files.pop(file_name, []):
+                _, length, terms = self._docs.pop(doc_id)
+                self._total_length -= length
+                for term in terms:
+                    postings = self._postings[term]
+                    postings.pop(doc_id, None)
+                    if not postings:
+                        del self._postings[term]
+
+    def search(self, query, k=100):
+        """
+        Returns up to k (score, file_name, chunk_index) tuples ordered by BM25 score.
+        Returns an empty list when no query term is selective, i.e. when the keyword signal is too weak.
+        """
+        terms = set(tokenize(query))
+        with self._lock:
+            n_docs = len(self._docs)
+            if not n_docs:
+                return []
+
+            matched = {term: self._postings[term] for term in terms if term in self._postings}
+            selective = [term for term, postings in matched.items() if len(postings) <= self.max_df_ratio * n_docs]
+            if not selective:
+                return []
+
+            candidates = set()
+            for term in selective:
+                candidates.update(matched[term])
+
+            avg_length = self._total_length / n_docs or 1
+            scores = {}
+            for term, postings in matched.items():
+                idf = math.log(1 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+                for doc_id in candidates.intersection(postings):
+                    tf = postings[doc_id]
+                    length = self._docs[doc_id][1]
+                    norm = tf + self.k1 * (1 - self.b + self.b * length / avg_length)
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / norm
+
+            top = sorted(scores, key=scores.get, reverse=True)[:k]
+            return [(scores[doc_id], *self._docs[doc_id][0]) for doc_id in top]
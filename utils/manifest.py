@@ -0,0 +1,115 @@
+def placeholders(values):
+    """
+    Returns a comma separated list of bind placeholders, one per value.
+    """
+    return ", ".join("?" for _ in values)
+
+
+class StageManifest:
+    def __init__(self, session, stage_path_url, stage_path, manifest_table, consumer):
+        """
+        Tracks which staged files a consumer table (e.g. a chunk table) has ingested, one row per file
+        holding the md5, size and last_modified that `list @stage` reports.
+        """
+        self.session = session
+        self.stage_path_url = stage_path_url
+        self.stage_path = stage_path
+        self.manifest_table = manifest_table
+        self.consumer = consumer
+
+    def split_text(self, text):
+        """
+        Splits the staged path to get the PDF name.
+        """
+        return text.split(f"{self.stage_path}/")[1]
+
+    def list_stage(self):
+        """
+        Returns {file_name: (md5, size, last_modified)} for every file on the stage.
+        """
+        rows = self.session.sql(f"list {self.stage_path_url}").collect()
+        return {self.split_text(row['name']): (row['md5'], int(row['size']), str(row['last_modified']))
+                for row in rows}
+
+    def load(self):
+        """
+        Returns {file_name: (md5, size, last_modified)} as last recorded for this consumer.
+        """
+        rows = self.session.sql(f'''
+            SELECT "file_name", "md5", "size", "last_modified"
+            FROM {self.manifest_table} WHERE "consumer" = ?
+        ''', params=[self.consumer]).collect()
+        return {row['file_name']: (row['md5'], int(row['size']), row['last_modified']) for row in rows}
+
+    def diff(self):
+        """
+        Compares the stage with the manifest and returns a dict of 'add', 'update' and 'delete'
+        file name sets plus the 'staged' listing used to record them.
+        """
+        staged = self.list_stage()
+        recorded = self.load()
+        if not recorded:
+            recorded = self.adopt_existing(staged)
+
+        staged_names = set(staged)
+        recorded_names = set(recorded)
+        common = staged_names & recorded_names
+        return {
+            'add': staged_names - recorded_names,
+            'update': {name for name in common if staged[name] != recorded[name]},
+            'delete': recorded_names - staged_names,
+            'staged': staged,
+        }
+
+    def adopt_existing(self, staged):
+        """
+        Records staged files that the consumer table already holds, so tables populated before the
+        manifest existed are not ingested a second time.
+        """
+        existing = self.session.sql(f'SELECT DISTINCT "file_name" FROM {self.consumer}').collect()
+        existing = {row['file_name'] + '.pdf' for row in existing}
+        adopted = {name: staged[name] for name in staged if name in existing}
+        self.record(adopted, staged)
+        return adopted
+
+    def record(self, file_names, staged):
+        """
+        Stores the staged fingerprint of the given files as ingested.
+        """
+        file_names = list(file_names)
+        if not file_names:
+            return
+        self.forget(file_names)
+
+        params = []
+        for name in file_names:
+            md5, size, last_modified = staged[name]
+            params.extend([self.consumer, name, md5, size, last_modified])
+        values = ", ".join("(?, ?, ?, ?, ?)" for _ in file_names)
+        self.session.sql(f'''
+            INSERT INTO {self.manifest_table} ("consumer", "file_name", "md5", "size", "last_modified")
+            VALUES {values}
+        ''', params=params).collect()
+
+    def forget(self, file_names):
+        """
+        Removes the given files from the manifest.
+        """
+        file_names = list(file_names)
+        if not file_names:
+            return
+        self.session.sql(f'''
+            DELETE FROM {self.manifest_table}
+            WHERE "consumer" = ? AND "file_name" IN ({placeholders(file_names)})
+        ''', params=[self.consumer] + file_names).collect()
+
+    def delete_rows(self, table_name, file_names):
+        """
+        Deletes the rows of the given PDFs from a table keyed on "file_name" (stored without .pdf).
+        """
+        file_names = [name.replace('.pdf', '') for name in file_names]
+        if not file_names:
+            return
+        self.session.sql(f'''
+            DELETE FROM {table_name} WHERE "file_name" IN ({placeholders(file_names)})
+        ''', params=file_names).collect()
@@ -0,0 +1,59 @@
+import io
+import logging
+from collections import namedtuple
+
+logger = logging.getLogger(__name__)
+
+PageText = namedtuple('PageText', ['page_number', 'text', 'start'])
+
+
+def iter_pdf_pages(stream):
+    """
+    Yields a PageText per page of the PDF in stream, with its 1-based page number and the offset at
+    which the page starts in the assembled document text.
+    A page that fails to extract yields empty text instead of discarding the rest of the document.
+    """
+    # Imported on first use, so pages that never parse a PDF do not pay for it.
+    import PyPDF2
+
+    if not stream.seekable():
+        stream = io.BytesIO(stream.read())
+
+    reader = PyPDF2.PdfReader(stream)
+    offset = 0
+    for page_number, page in enumerate(reader.pages, start=1):
+        try:
+            text = (page.extract_text() or '').replace('\n', ' ').replace('\0', ' ')
+        except Exception:
+            logger.warning("Unable to extract page %s", page_number, exc_info=True)
+            text = ''
+        yield PageText(page_number, text, offset)
+        offset += len(text)
+
+
+def read_pdf_pages(session, file_url):
+    """
+    Streams the pages of a staged PDF without copying the download into a second buffer.
+    """
+    with session.file.get_stream(file_url) as file:
+        yield from iter_pdf_pages(file)
+
+
+def assemble_text(pages):
+    """
+    Joins page texts in linear time and returns (text, page start offsets).
+    """
+    texts = []
+    offsets = []
+    for page in pages:
+        texts.append(page.text)
+        offsets.append(page.start)
+    return "".join(texts), offsets
+
+
+def read_pdf(session, file_url):
+    """
+    Reads a staged PDF and returns its extracted text.
+    """
+    text, _ = assemble_text(read_pdf_pages(session, file_url))
+    return text
@@ -0,0 +1,61 @@
+from collections import namedtuple
+
+import numpy as np
+
+Passage = namedtuple('Passage', ['score', 'file_name', 'text', 'vector'])
+SearchFilter = namedtuple('SearchFilter', ['file_names', 'date_from', 'date_to', 'tags'],
+                          defaults=(None, None, None, None))
+
+
+def _normalize_rows(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return matrix / norms
+
+
+def mmr(query_vector, passages, k, diversity=0.3):
+    """
+    Selects k passages by maximal marginal relevance, trading similarity to the query against similarity to
+    the passages already selected. diversity=0 keeps the plain similarity ranking.
+    """
+    if len(passages) <= 1 or diversity <= 0:
+        return list(passages[:k])
+
+    vectors = _normalize_rows(np.vstack([passage.vector for passage in passages]))
+    query = np.asarray(query_vector, dtype=np.float32).reshape(-1)
+    query = query / (np.linalg.norm(query) or 1)
+    relevance = vectors @ query
+
+    selected = []
+    remaining = list(range(len(passages)))
+    while remaining and len(selected) < k:
+        if selected:
+            redundancy = (vectors[remaining] @ vectors[selected].T).max(axis=1)
+        else:
+            redundancy = np.zeros(len(remaining))
+        scores = (1 - diversity) * relevance[remaining] - diversity * redundancy
+        selected.append(remaining.pop(int(np.argmax(scores))))
+
+    return [passages[i] for i in selected]
+
+
+def pack_context(passages, token_budget=None, chars_per_token=4, separator="\n\n"):
+    """
+    Keeps passages in rank order while they fit into token_budget tokens (estimated as chars_per_token
+    characters per token). The first passage is truncated rather than dropped, so the context is never empty.
+    """
+    if token_budget is None:
+        return list(passages)
+
+    budget_chars = token_budget * chars_per_token
+    packed = []
+    used = 0
+    for passage in passages:
+        cost = len(passage.text) + (len(separator) if packed else 0)
+        if used + cost <= budget_chars:
+            packed.append(passage)
+            used += cost
+        elif not packed:
+            packed.append(passage._replace(text=passage.text[:budget_chars]))
+            break
+    return packed
@@ -0,0 +1,145 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict, namedtuple
+from contextlib import nullcontext
+
+import numpy as np
+
+from utils.embedding import vector_literal
+from utils.lexical_index import tokenize
+from utils.vector_index import to_vector
+
+CacheEntry = namedtuple('CacheEntry', ['vector', 'question', 'answer', 'file_name', 'created_at'])
+
+
+def identifiers(text):
+    """
+    Returns the terms of text that contain a digit, such as bill, section or year numbers.
+    """
+    return frozenset(term for term in tokenize(text) if any(ch.isdigit() for ch in term))
+
+
+class SemanticCache:
+    def __init__(self, similarity_threshold=0.95, ttl_seconds=86400, max_entries=1000,
+                 session_pool=None, table_name=None, dim=768):
+        """
+        Initializes an answer cache keyed on question embeddings. A lookup hits when a live entry's cosine
+        similarity reaches similarity_threshold and, since embeddings barely tell "H.R. 1234" from "H.R. 1243",
+        both questions cite the same numbers and identifiers. Entries expire after ttl_seconds, and the least recently
+        used entry is evicted beyond max_entries.
+        When session_pool and table_name are given, entries are persisted to and loaded from that table,
+        on the caller's session when one is passed and on a session borrowed from session_pool otherwise.
+        """
+        self.similarity_threshold = similarity_threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.session_pool = session_pool
+        self.table_name = table_name
+        self.dim = dim
+
+        self._lock = threading.RLock()
+        self._entries = OrderedDict()
+        self._matrix = None
+        self._keys = []
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _normalize(self, vector):
+        vector = to_vector(vector, self.dim)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _expired(self, entry, now):
+        return now - entry.created_at > self.ttl_seconds
+
+    def _put(self, key, entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        self._matrix = None
+
+    def _session(self, session):
+        return nullcontext(session) if session is not None else self.session_pool.session()
+
+    def load(self, session=None):
+        """
+        Loads unexpired entries from the persistence table.
+        """
+        if self.table_name is None:
+            return self
+        with self._session(session) as session:
+            rows = session.sql(f'''
+                SELECT "cache_key", "question", "embedding", "answer", "file_name", "created_at"
+                FROM {self.table_name} WHERE "created_at" >= ? ORDER BY "created_at"
+            ''', params=[time.time() - self.ttl_seconds]).collect()
+        with self._lock:
+            for row in rows:
+                entry = CacheEntry(self._normalize(row['embedding']), row['question'], row['answer'],
+                                   row['file_name'], float(row['created_at']))
+                self._put(row['cache_key'], entry)
+        return self
+
+    def lookup(self, query_vector, question=None):
+        """
+        Returns (answer, file_name) of the most similar live entry above the threshold, or None.
+        When question is given, only entries citing exactly its identifiers can match.
+        """
+        query = self._normalize(query_vector)
+        now = time.time()
+        with self._lock:
+            expired = [key for key, entry in self._entries.items() if self._expired(entry, now)]
+            for key in expired:
+                del self._entries[key]
+            if expired:
+                self._matrix = None
+            if not self._entries:
+                return None
+
+            if self._matrix is None:
+                self._keys = list(self._entries)
+                self._matrix = np.vstack([self._entries[key].vector for key in self._keys])
+
+            scores = self._matrix @ query
+            above = np.flatnonzero(scores >= self.similarity_threshold)
+            wanted = identifiers(question) if question is not None else None
+            for i in above[np.argsort(-scores[above])]:
+                key = self._keys[i]
+                entry = self._entries[key]
+                if wanted is not None and identifiers(entry.question) != wanted:
+                    continue
+                self._entries.move_to_end(key)
+                return entry.answer, entry.file_name
+            return None
+
+    def store(self, question, query_vector, answer, file_name, session=None):
+        """
+        Caches an answer and its reference file under the question embedding.
+        A caller already holding a pooled session passes it, so the pool is not borrowed from twice.
+        """
+        key = uuid.uuid4().hex
+        entry = CacheEntry(self._normalize(query_vector), question, answer, file_name, time.time())
+        with self._lock:
+            self._put(key, entry)
+
+        if self.table_name is not None:
+            with self._session(session) as session:
+                session.sql(f'''
+                    INSERT INTO {self.table_name} ("cache_key", "question", "embedding", "answer", "file_name", "created_at")
+                    SELECT ?, ?, PARSE_JSON(?)::ARRAY::VECTOR(FLOAT, {self.dim}), ?, ?, ?
+                ''', params=[key, question, vector_literal(entry.vector), answer, file_name,
+                             entry.created_at]).collect()
+
+    def invalidate_file(self, file_name):
+        """
+        Drops every cached answer that cites file_name among its reference documents.
+        """
+        with self._lock:
+            stale = [key for key, entry in self._entries.items()
+                     if entry.file_name and file_name in entry.file_name.split(', ')]
+            for key in stale:
+                del self._entries[key]
+            if stale:
+                self._matrix = None
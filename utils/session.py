@@ -0,0 +1,230 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import streamlit as st
+from dotenv import load_dotenv
+from snowflake.snowpark import Session
+from snowflake.snowpark.context import get_active_session
+
+from utils.config import load_config
+from utils.tracing import TracedSession, get_tracer
+
+
+def get_connection_parameters():
+    """
+    Reads the Snowflake connection parameters from the .env file, or from Streamlit secrets when there is none.
+    """
+    # Define the path to the .env file
+    env_path = os.path.join(os.path.dirname(__file__), '..', '.env')
+
+    if os.path.exists(env_path):
+        # Load the .env file
+        load_dotenv(dotenv_path=env_path)
+
+        return {
+            "user": os.getenv("user"),
+            "password": os.getenv("password"),
+            "account": os.getenv("account"),
+            "role": os.getenv("role"),
+            "warehouse": os.getenv("warehouse"),
+            "database": os.getenv("database"),
+            "schema": os.getenv("schema"),
+        }
+
+    return {
+        "user": st.secrets.db_credentials.SNOWFLAKE_USER,
+        "password": st.secrets.db_credentials.SNOWFLAKE_PASSWORD,
+        "account": st.secrets.db_credentials.SNOWFLAKE_ACCOUNT,
+        "role": st.secrets.db_credentials.SNOWFLAKE_ROLE,
+        "warehouse": st.secrets.db_credentials.SNOWFLAKE_WAREHOUSE,
+        "database": st.secrets.db_credentials.SNOWFLAKE_DATABASE,
+        "schema": st.secrets.db_credentials.SNOWFLAKE_SCHEMA,
+    }
+
+
+def has_connection_parameters():
+    """
+    Returns True when connection parameters are configured, i.e. the app does not run inside Snowflake.
+    """
+    try:
+        get_connection_parameters()
+    except (FileNotFoundError, AttributeError, KeyError):
+        return False
+    return True
+
+
+def create_session():
+    """
+    Creates a new Snowpark session from the connection parameters.
+    """
+    return Session.builder.configs(get_connection_parameters()).create()
+
+
+class SessionPool:
+    def __init__(self, factory=create_session, max_size=4, health_check_interval=300, acquire_timeout=30,
+                 tracer=None):
+        """
+        Initializes a bounded pool of authenticated Snowpark sessions shared across reruns, pages and users.
+        Idle sessions older than health_check_interval seconds are pinged before reuse and replaced if dead.
+        When a tracer is given, sessions are wrapped so every statement and stage transfer is traced.
+        """
+        self.factory = factory
+        self.tracer = tracer
+        self.max_size = max_size
+        self.health_check_interval = health_check_interval
+        self.acquire_timeout = acquire_timeout
+
+        self._idle = []
+        self._size = 0
+        self._condition = threading.Condition()
+
+    def _is_healthy(self, session):
+        try:
+            session.sql("select 1").collect()
+            return True
+        except Exception:
+            return False
+
+    def _discard(self, session):
+        try:
+            session.close()
+        except Exception:
+            pass
+
+    def acquire(self):
+        """
+        Returns a healthy session, creating one if the pool is not full, or waiting for one to be released.
+        """
+        deadline = time.monotonic() + self.acquire_timeout
+        with self._condition:
+            while not self._idle and self._size >= self.max_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self._condition.wait(remaining):
+                    raise TimeoutError(f"No Snowflake session became available within {self.acquire_timeout}s")
+            if self._idle:
+                session, released_at = self._idle.pop()
+            else:
+                session, released_at = None, None
+                self._size += 1
+
+        try:
+            if session is not None and time.monotonic() - released_at > self.health_check_interval:
+                if not self._is_healthy(session):
+                    self._discard(session)
+                    session = None
+            if session is None:
+                session = self.factory()
+                if self.tracer is not None:
+                    session = TracedSession(session, self.tracer)
+        except:
+            with self._condition:
+                self._size -= 1
+                self._condition.notify()
+            raise
+
+        return session
+
+    def release(self, session, healthy=True):
+        """
+        Returns a session to the pool; unhealthy sessions are closed and their slot freed.
+        """
+        with self._condition:
+            if healthy:
+                self._idle.append((session, time.monotonic()))
+            else:
+                self._size -= 1
+            self._condition.notify()
+        if not healthy:
+            self._discard(session)
+
+    @contextmanager
+    def session(self):
+        """
+        Context manager that acquires a session and always returns it to the pool.
+        """
+        session = self.acquire()
+        healthy = True
+        try:
+            yield session
+        except Exception:
+            healthy = self._is_healthy(session)
+            raise
+        finally:
+            self.release(session, healthy)
+
+    def close_all(self):
+        """
+        Closes every idle session.
+        """
+        with self._condition:
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+        for session, _ in idle:
+            self._discard(session)
+
+
+class SharedSessionPool:
+    def __init__(self, factory=get_active_session, tracer=None):
+        """
+        Lends one process-wide session, the active session inside Snowflake, to every borrower at once, so a
+        long ingestion job never makes page renders wait. The pool does not own the session and never closes it.
+        """
+        self.factory = factory
+        self.tracer = tracer
+        self._session = None
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Returns the shared session, looking it up on first use.
+        """
+        with self._lock:
+            if self._session is None:
+                session = self.factory()
+                self._session = TracedSession(session, self.tracer) if self.tracer is not None else session
+            return self._session
+
+    def release(self, session, healthy=True):
+        """
+        Does nothing: the shared session stays lent to every borrower.
+        """
+
+    @contextmanager
+    def session(self):
+        """
+        Context manager that lends the shared session.
+        """
+        yield self.acquire()
+
+    def close_all(self):
+        """
+        Does nothing: the shared session belongs to its environment.
+        """
+
+
+def create_session_pool(max_size=4, health_check_interval=300, acquire_timeout=30, tracer=None):
+    """
+    Returns a SessionPool of up to max_size new sessions or, inside Snowflake where there are no connection
+    parameters, a SharedSessionPool over the active session.
+    """
+    if has_connection_parameters():
+        return SessionPool(max_size=max_size, health_check_interval=health_check_interval,
+                           acquire_timeout=acquire_timeout, tracer=tracer)
+    return SharedSessionPool(factory=get_active_session, tracer=tracer)
+
+
+@st.cache_resource(show_spinner=False)
+def get_session_pool():
+    """
+    Returns the session pool shared by every page and user of this Streamlit server.
+    """
+    pool_config = load_config().get('session_pool', {})
+    tracer = get_tracer()
+    return create_session_pool(
+        max_size=pool_config.get('max_size', 4),
+        health_check_interval=pool_config.get('health_check_interval_seconds', 300),
+        acquire_timeout=pool_config.get('acquire_timeout_seconds', 30),
+        tracer=tracer if tracer.enabled else None
+    )
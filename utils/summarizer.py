@@ -0,0 +1,217 @@
+import time
+from collections import deque
+
+from utils.tracing import tracer
+
+
+class DocumentSummarizer:
+    def __init__(self, session, database_name='BAMBOO', schema_name='BILLS',
+                 chunked_table='CHUNKED_PDF_SUM', summary_table='SUMMARIZED_CONTENT',
+                 max_concurrency=8, max_retries=2, poll_interval=0.5,
+                 levels_table='SUMMARY_LEVELS', token_budget=4000, chars_per_token=4, max_levels=10):
+        """
+        Summarizes chunked PDFs with Cortex SUMMARIZE, caching chunk summaries in the summary table.
+        max_concurrency, max_retries and poll_interval tune summarize_concurrently.
+        levels_table stores the intermediate levels of summarize_hierarchically, whose groups are sized to
+        token_budget tokens (estimated as chars_per_token characters per token).
+        """
+        self.session = session
+        self.chunked_table = f"{database_name}.{schema_name}.{chunked_table}"
+        self.summary_table = f"{database_name}.{schema_name}.{summary_table}"
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.poll_interval = poll_interval
+        self.levels_table = f"{database_name}.{schema_name}.{levels_table}"
+        self.token_budget = token_budget
+        self.chars_per_token = chars_per_token
+        self.max_levels = max_levels
+
+    def _missing_chunks_query(self, select):
+        # EQUAL_NULL lets chunks ingested before "chunk_index" existed match their summaries.
+        return f"""
+            SELECT {select}
+            FROM {self.chunked_table} c
+            WHERE c."file_name" = ?
+            AND NOT EXISTS (
+                SELECT 1 FROM {self.summary_table} s
+                WHERE s."file_name" = c."file_name" AND EQUAL_NULL(s."chunk_index", c."chunk_index")
+            )
+        """
+
+    def is_summarized(self, file_selected):
+        """
+        Returns True if every chunk of the file already has a stored summary.
+        """
+        rows = self.session.sql(self._missing_chunks_query("COUNT(*) AS missing"),
+                                params=[file_selected]).collect()
+        return rows[0]['MISSING'] == 0
+
+    @tracer.traced()
+    def summarize_chunks(self, file_selected):
+        """
+        Summarizes every unsummarized chunk of the file inside Snowflake, without moving chunks or summaries
+        through the client.
+        """
+        self.session.sql(f"""
+            INSERT INTO {self.summary_table} ("file_name", SUMMARIZED_CHUNK, "chunks", "chunk_index")
+            {self._missing_chunks_query('c."file_name", SNOWFLAKE.CORTEX.SUMMARIZE(c."chunks"), c."chunks", c."chunk_index"')}
+        """, params=[file_selected]).collect()
+
+    def summarize_chunk_async(self, file_selected, chunk_index):
+        """
+        Submits the summary of a single chunk as an async query and returns its AsyncJob.
+        """
+        return self.session.sql(f"""
+            INSERT INTO {self.summary_table} ("file_name", SUMMARIZED_CHUNK, "chunks", "chunk_index")
+            SELECT "file_name", SNOWFLAKE.CORTEX.SUMMARIZE("chunks"), "chunks", "chunk_index"
+            FROM {self.chunked_table}
+            WHERE "file_name" = ? AND "chunk_index" = ?
+        """, params=[file_selected, chunk_index]).collect_nowait()
+
+    def get_chunk_summary(self, file_selected, chunk_index):
+        """
+        Returns the stored summary of a single chunk.
+        """
+        rows = self.session.sql(f"""
+            SELECT SUMMARIZED_CHUNK FROM {self.summary_table}
+            WHERE "file_name" = ? AND "chunk_index" = ?
+        """, params=[file_selected, chunk_index]).collect()
+        return rows[0]['SUMMARIZED_CHUNK']
+
+    def summarize_concurrently(self, file_name):
+        """
+        Summarizes the file's missing chunks as up to max_concurrency async queries, retrying failed chunks
+        individually, and yields (chunk_index, summary) as each one lands.
+        """
+        file_selected = file_name.replace('.pdf', '')
+        rows = self.session.sql(self._missing_chunks_query('c."chunk_index"') + ' ORDER BY 1',
+                                params=[file_selected]).collect()
+        missing = [row['chunk_index'] for row in rows]
+        if None in missing:
+            # Chunks without an index cannot be addressed one by one.
+            self.summarize_chunks(file_selected)
+            return
+
+        pending = deque(missing)
+        attempts = {chunk_index: 0 for chunk_index in missing}
+        running = {}
+        while pending or running:
+            while pending and len(running) < self.max_concurrency:
+                chunk_index = pending.popleft()
+                attempts[chunk_index] += 1
+                running[chunk_index] = self.summarize_chunk_async(file_selected, chunk_index)
+
+            finished = [chunk_index for chunk_index, job in running.items() if job.is_done()]
+            if not finished:
+                time.sleep(self.poll_interval)
+                continue
+
+            for chunk_index in finished:
+                job = running.pop(chunk_index)
+                try:
+                    job.result()
+                except Exception:
+                    if attempts[chunk_index] > self.max_retries:
+                        raise
+                    pending.append(chunk_index)
+                else:
+                    yield chunk_index, self.get_chunk_summary(file_selected, chunk_index)
+
+    def get_summary(self, file_selected):
+        """
+        Returns a DataFrame with the file's chunk summaries joined by '|' in the SUMMARY column.
+        """
+        return self.session.sql(f"""
+            SELECT "file_name", LISTAGG(summarized_chunk, '|') WITHIN GROUP (ORDER BY "chunk_index") as summary
+            FROM {self.summary_table}
+            WHERE "file_name" = ?
+            GROUP BY "file_name"
+        """, params=[file_selected]).to_pandas()
+
+    @tracer.traced()
+    def summarize(self, file_name):
+        """
+        Summarizes the chunks of the specified PDF file, reusing stored chunk summaries.
+        """
+        file_selected = file_name.replace('.pdf', '')
+        if not self.is_summarized(file_selected):
+            self.summarize_chunks(file_selected)
+        return self.get_summary(file_selected)
+
+    def get_chunk_summaries(self, file_selected):
+        """
+        Returns the file's chunk summaries in document order, without aggregating them into one string.
+        """
+        rows = self.session.sql(f"""
+            SELECT SUMMARIZED_CHUNK FROM {self.summary_table}
+            WHERE "file_name" = ?
+            ORDER BY "chunk_index"
+        """, params=[file_selected]).collect()
+        return [row['SUMMARIZED_CHUNK'] for row in rows]
+
+    def _level_source(self, level):
+        """
+        Returns a query over (idx, summary) rows of the given level; level 0 is the chunk summaries.
+        """
+        if level == 0:
+            return f"""
+                SELECT "chunk_index" AS idx, SUMMARIZED_CHUNK AS summary
+                FROM {self.summary_table} WHERE "file_name" = ?
+            """
+        return f"""
+            SELECT "group_index" AS idx, "summary" AS summary
+            FROM {self.levels_table} WHERE "file_name" = ? AND "level" = {int(level)}
+        """
+
+    def _level_size(self, file_selected, level):
+        rows = self.session.sql(f"SELECT COUNT(*) AS n FROM ({self._level_source(level)})",
+                                params=[file_selected]).collect()
+        return rows[0]['N']
+
+    @tracer.traced()
+    def build_level(self, file_selected, level):
+        """
+        Merges the summaries of level - 1 into groups of about token_budget tokens and stores one summary per
+        group as the given level, entirely inside Snowflake. Returns the number of groups written.
+        """
+        budget_chars = self.token_budget * self.chars_per_token
+        # A summary joins the group its starting character offset falls in.
+        self.session.sql(f"""
+            INSERT INTO {self.levels_table} ("file_name", "level", "group_index", "summary")
+            SELECT ?, {int(level)}, group_index, SNOWFLAKE.CORTEX.SUMMARIZE(merged)
+            FROM (
+                SELECT group_index, LISTAGG(summary, ' ') WITHIN GROUP (ORDER BY idx) AS merged
+                FROM (
+                    SELECT idx, summary,
+                        FLOOR((SUM(LENGTH(summary)) OVER (ORDER BY idx ROWS UNBOUNDED PRECEDING) - LENGTH(summary))
+                              / {int(budget_chars)}) AS group_index
+                    FROM ({self._level_source(level - 1)})
+                )
+                GROUP BY group_index
+            )
+        """, params=[file_selected, file_selected]).collect()
+        return self._level_size(file_selected, level)
+
+    @tracer.traced()
+    def summarize_hierarchically(self, file_name):
+        """
+        Summarizes a document of any size by recursively merging chunk summaries until a single summary remains.
+        Stored levels are reused, so only missing levels are computed.
+        """
+        file_selected = file_name.replace('.pdf', '')
+        if not self.is_summarized(file_selected):
+            self.summarize_chunks(file_selected)
+
+        rows = self.session.sql(f"""
+            SELECT "level", COUNT(*) AS n FROM {self.levels_table}
+            WHERE "file_name" = ? GROUP BY "level" ORDER BY "level"
+        """, params=[file_selected]).collect()
+        sizes = {row['level']: row['N'] for row in rows}
+
+        level, size = 0, self._level_size(file_selected, 0)
+        while size > 1 and level < self.max_levels:
+            level += 1
+            size = sizes[level] if level in sizes else self.build_level(file_selected, level)
+
+        rows = self.session.sql(self._level_source(level) + " ORDER BY idx", params=[file_selected]).collect()
+        return ' '.join(row['SUMMARY'] for row in rows)
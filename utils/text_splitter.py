@@ -0,0 +1,110 @@
+from bisect import bisect_right
+from collections import namedtuple
+
+from utils.pdf_extract import PageText
+
+Chunk = namedtuple('Chunk', ['text', 'start', 'end', 'first_page', 'last_page'])
+
+# Chunk boundaries, tried from paragraph breaks down to single spaces.
+SEPARATORS = ("\n\n", "\n", ". ", " ")
+CHUNK_UNITS = ('chars', 'tokens')
+
+
+def estimate_tokens(text, chars_per_token=4):
+    """
+    Estimates the number of model tokens in text as one per chars_per_token characters, rounded up.
+    """
+    return -(-len(text) // chars_per_token)
+
+
+class TextSplitter:
+    def __init__(self, chunk_size, chunk_overlap=0, unit='chars', chars_per_token=4, separators=SEPARATORS):
+        """
+        Splits a stream of page texts into chunks of at most chunk_size units that overlap by about
+        chunk_overlap units. unit is 'chars' or 'tokens'; tokens are estimated as chars_per_token characters.
+        Chunks end at the first of separators found in the second half of their window, or are cut hard.
+        """
+        if unit not in CHUNK_UNITS:
+            raise ValueError(f"Unknown chunk unit {unit!r}, expected one of {', '.join(CHUNK_UNITS)}")
+        if chunk_size <= 0 or not 0 <= chunk_overlap < chunk_size:
+            raise ValueError(f"Invalid chunk size {chunk_size} with overlap {chunk_overlap}")
+        scale = chars_per_token if unit == 'tokens' else 1
+        self.chunk_chars = chunk_size * scale
+        self.overlap_chars = chunk_overlap * scale
+        self.separators = separators
+
+    def _cut(self, buffer, start):
+        """
+        Returns the end of the chunk starting at start, just past the best separator within its window.
+        """
+        limit = start + self.chunk_chars
+        if limit >= len(buffer):
+            return len(buffer)
+        floor = start + self.chunk_chars // 2
+        for separator in self.separators:
+            index = buffer.rfind(separator, floor, limit)
+            if index != -1:
+                return index + len(separator)
+        return limit
+
+    def _next_start(self, buffer, start, end):
+        """
+        Returns where the chunk after buffer[start:end] starts, chunk_overlap back from end at a word boundary.
+        """
+        if not self.overlap_chars:
+            return end
+        next_start = max(end - self.overlap_chars, start + 1)
+        space = buffer.find(" ", next_start, end)
+        return space + 1 if space != -1 else next_start
+
+    def split_pages(self, pages):
+        """
+        Yields a Chunk per chunk of a stream of PageText, with its start and end offsets in the assembled
+        document text and the pages it spans. Only about one chunk and one page of text are held in memory.
+        """
+        buffer = ""
+        base = 0
+        page_starts = []
+        page_numbers = []
+
+        def chunk_at(start, end):
+            raw = buffer[start:end]
+            text = raw.strip()
+            if not text:
+                return None
+            first = base + start + len(raw) - len(raw.lstrip())
+            last = first + len(text)
+            return Chunk(text, first, last, page_numbers[bisect_right(page_starts, first) - 1],
+                         page_numbers[bisect_right(page_starts, last - 1) - 1])
+
+        for page in pages:
+            page_starts.append(base + len(buffer))
+            page_numbers.append(page.page_number)
+            buffer += page.text
+
+            start = 0
+            # A chunk is only cut once text follows it, so its end can move to a better separator.
+            while len(buffer) - start > self.chunk_chars:
+                end = self._cut(buffer, start)
+                chunk = chunk_at(start, end)
+                if chunk is not None:
+                    yield chunk
+                start = self._next_start(buffer, start, end)
+            buffer = buffer[start:]
+            base += start
+
+        start = 0
+        while start < len(buffer):
+            end = self._cut(buffer, start)
+            chunk = chunk_at(start, end)
+            if chunk is not None:
+                yield chunk
+            if end == len(buffer):
+                break
+            start = self._next_start(buffer, start, end)
+
+    def split_text(self, text):
+        """
+        Returns the chunk texts of a single string.
+        """
+        return [chunk.text for chunk in self.split_pages([PageText(1, text, 0)])]
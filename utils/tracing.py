@@ -0,0 +1,492 @@
+import contextvars
+import functools
+import json
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import streamlit as st
+
+from utils.config import load_config
+
+logger = logging.getLogger(__name__)
+
+CORTEX_PATTERN = re.compile(r'SNOWFLAKE\.CORTEX\.(\w+)', re.I)
+TABLE_PATTERN = re.compile(r'\b(?:FROM|INTO|UPDATE|TABLE)\s+(?!TABLE\s*\()(?:"?[\w$]+"?\.){0,2}"?([\w$%@]+)', re.I)
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+class Span:
+    def __init__(self, name, kind, parent=None, **attributes):
+        """
+        A timed operation: a page run, an app step, a SQL statement, a Cortex call or a stage transfer.
+        """
+        self.name = name
+        self.kind = kind
+        self.parent = parent
+        self.trace_id = parent.trace_id if parent is not None else uuid.uuid4().hex
+        self.span_id = uuid.uuid4().hex[:16]
+        self.attributes = attributes
+        self.children = []
+        self.rows = None
+        self.bytes = None
+        self.query_id = None
+        self.error = None
+        self.started_at = time.time()
+        self.duration = None
+        self._start = time.perf_counter()
+
+    def finish(self):
+        self.duration = time.perf_counter() - self._start
+
+    def walk(self, depth=0):
+        """
+        Yields (depth, span) for this span and its descendants, depth first.
+        """
+        yield depth, self
+        for child in list(self.children):
+            yield from child.walk(depth + 1)
+
+    def to_dict(self):
+        return {
+            'trace_id': self.trace_id,
+            'span_id': self.span_id,
+            'parent_id': self.parent.span_id if self.parent is not None else None,
+            'name': self.name,
+            'kind': self.kind,
+            'started_at': self.started_at,
+            'duration_ms': None if self.duration is None else round(self.duration * 1000, 3),
+            'rows': self.rows,
+            'bytes': self.bytes,
+            'query_id': self.query_id,
+            'error': self.error,
+            **self.attributes,
+        }
+
+
+class Tracer:
+    def __init__(self, enabled=True, max_traces=100):
+        """
+        Records spans nested under the span active in the calling context. Root spans opened with trace() are
+        kept as the last max_traces traces; every finished span is aggregated into Prometheus metrics and passed
+        to the exporters.
+        """
+        self.enabled = enabled
+        self.traces = deque(maxlen=max_traces)
+        self.exporters = []
+
+        self._current = contextvars.ContextVar('current_span', default=None)
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    def current_span(self):
+        return self._current.get()
+
+    def start_span(self, name, kind='app', **attributes):
+        """
+        Starts a span under the active span without making it active, e.g. for work finished in a generator.
+        """
+        parent = self._current.get()
+        span = Span(name, kind, parent, **attributes)
+        if parent is not None:
+            with self._lock:
+                parent.children.append(span)
+        return span
+
+    def end_span(self, span, error=None):
+        """
+        Finishes a span started with start_span and records it.
+        """
+        span.finish()
+        if error is not None:
+            span.error = type(error).__name__
+        self._record(span)
+
+    @contextmanager
+    def span(self, name, kind='app', **attributes):
+        """
+        Context manager that times the block as a span and makes it the active span.
+        """
+        if not self.enabled:
+            yield None
+            return
+        span = self.start_span(name, kind, **attributes)
+        token = self._current.set(span)
+        error = None
+        try:
+            yield span
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            self._current.reset(token)
+            self.end_span(span, error)
+
+    @contextmanager
+    def trace(self, name, kind='page', **attributes):
+        """
+        Context manager that times the block as a new trace, e.g. one run of a page or one ingestion job.
+        """
+        if not self.enabled:
+            yield None
+            return
+        token = self._current.set(None)
+        try:
+            with self.span(name, kind, **attributes) as span:
+                yield span
+        finally:
+            self._current.reset(token)
+            self.traces.append(span)
+
+    def traced(self, name=None, kind='app'):
+        """
+        Decorator that runs the function inside a span named after it.
+        """
+        def decorator(function):
+            span_name = name or function.__qualname__
+
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                with self.span(span_name, kind):
+                    return function(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def _record(self, span):
+        key = (span.kind, span.name)
+        with self._lock:
+            metric = self._metrics.setdefault(key, {'count': 0, 'seconds': 0.0, 'rows': 0, 'bytes': 0,
+                                                    'errors': 0, 'buckets': [0] * len(DURATION_BUCKETS)})
+            metric['count'] += 1
+            metric['seconds'] += span.duration
+            metric['rows'] += span.rows or 0
+            metric['bytes'] += span.bytes or 0
+            metric['errors'] += span.error is not None
+            for i, bound in enumerate(DURATION_BUCKETS):
+                if span.duration <= bound:
+                    metric['buckets'][i] += 1
+        for exporter in self.exporters:
+            try:
+                exporter(span)
+            except Exception:
+                logger.warning("Span exporter failed", exc_info=True)
+
+    def prometheus_text(self):
+        """
+        Returns the aggregated span metrics in the Prometheus text exposition format.
+        """
+        with self._lock:
+            metrics = {key: dict(value, buckets=list(value['buckets'])) for key, value in self._metrics.items()}
+
+        lines = ["# HELP bamboo_span_duration_seconds Duration of traced operations.",
+                 "# TYPE bamboo_span_duration_seconds histogram"]
+        for (kind, name), metric in sorted(metrics.items()):
+            labels = f'kind="{_label(kind)}",name="{_label(name)}"'
+            for bound, count in zip(DURATION_BUCKETS, metric['buckets']):
+                lines.append(f'bamboo_span_duration_seconds_bucket{{{labels},le="{bound}"}} {count}')
+            lines.append(f'bamboo_span_duration_seconds_bucket{{{labels},le="+Inf"}} {metric["count"]}')
+            lines.append(f'bamboo_span_duration_seconds_sum{{{labels}}} {metric["seconds"]:.6f}')
+            lines.append(f'bamboo_span_duration_seconds_count{{{labels}}} {metric["count"]}')
+        for metric_name, field, help_text in (('bamboo_span_rows_total', 'rows', 'Rows returned by traced operations.'),
+                                              ('bamboo_span_bytes_total', 'bytes', 'Bytes moved by traced operations.'),
+                                              ('bamboo_span_errors_total', 'errors', 'Traced operations that failed.')):
+            lines.extend([f"# HELP {metric_name} {help_text}", f"# TYPE {metric_name} counter"])
+            for (kind, name), metric in sorted(metrics.items()):
+                lines.append(f'{metric_name}{{kind="{_label(kind)}",name="{_label(name)}"}} {metric[field]}')
+        return "\n".join(lines) + "\n"
+
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", " ")
+
+
+def statement_span(query):
+    """
+    Returns the (name, kind) of the span of a SQL statement: the Cortex function it calls, or its verb and
+    first table.
+    """
+    cortex = CORTEX_PATTERN.search(query)
+    if cortex:
+        return f"cortex.{cortex.group(1).upper()}", 'cortex'
+    verb = query.split(None, 1)[0].upper() if query.strip() else 'SQL'
+    table = TABLE_PATTERN.search(query)
+    return (f"{verb} {table.group(1)}" if table else verb), 'sql'
+
+
+def estimate_bytes(rows, sample=20):
+    """
+    Estimates the size of a result from the text length of its first sample rows.
+    """
+    if not rows:
+        return 0
+    sampled = rows[:sample]
+    size = sum(len(str(value)) for row in sampled for value in row)
+    return size * len(rows) // len(sampled)
+
+
+def json_log_exporter(span):
+    """
+    Logs every span of a finished trace, and every span recorded outside a trace, as one JSON line each.
+    """
+    if span.parent is None:
+        for depth, child in span.walk():
+            logger.info(json.dumps(dict(child.to_dict(), depth=depth), default=str))
+
+
+class TracedAsyncJob:
+    def __init__(self, tracer, span, job):
+        """
+        Wraps an AsyncJob so its span ends when its result is first collected.
+        """
+        self._tracer = tracer
+        self._span = span
+        self._job = job
+        self._span.query_id = getattr(job, 'query_id', None)
+
+    def __getattr__(self, name):
+        return getattr(self._job, name)
+
+    def result(self, *args, **kwargs):
+        try:
+            rows = self._job.result(*args, **kwargs)
+        except Exception as e:
+            if self._span.duration is None:
+                self._tracer.end_span(self._span, e)
+            raise
+        if self._span.duration is None:
+            if isinstance(rows, list):
+                self._span.rows, self._span.bytes = len(rows), estimate_bytes(rows)
+            self._tracer.end_span(self._span)
+        return rows
+
+
+class TracedQuery:
+    def __init__(self, session, dataframe, query):
+        self._session = session
+        self._dataframe = dataframe
+        self._query = query
+
+    def __getattr__(self, name):
+        return getattr(self._dataframe, name)
+
+    def _span(self):
+        name, kind = statement_span(self._query)
+        return self._session.tracer.span(name, kind, statement=" ".join(self._query.split())[:300])
+
+    def collect(self, *args, **kwargs):
+        with self._span() as span, self._session.query_ids() as history:
+            rows = self._dataframe.collect(*args, **kwargs)
+            if span is not None:
+                span.rows, span.bytes, span.query_id = len(rows), estimate_bytes(rows), history.query_id()
+        return rows
+
+    def to_pandas(self, *args, **kwargs):
+        with self._span() as span, self._session.query_ids() as history:
+            df = self._dataframe.to_pandas(*args, **kwargs)
+            if span is not None:
+                span.rows = len(df)
+                span.bytes = int(df.memory_usage(deep=False).sum())
+                span.query_id = history.query_id()
+        return df
+
+    def to_local_iterator(self, *args, **kwargs):
+        tracer = self._session.tracer
+        if not tracer.enabled:
+            yield from self._dataframe.to_local_iterator(*args, **kwargs)
+            return
+        # The span is not made active, since the caller runs other statements while it iterates.
+        name, kind = statement_span(self._query)
+        span = tracer.start_span(name, kind, statement=" ".join(self._query.split())[:300])
+        rows = 0
+        error = None
+        try:
+            for row in self._dataframe.to_local_iterator(*args, **kwargs):
+                rows += 1
+                yield row
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            span.rows = rows
+            tracer.end_span(span, error)
+
+    def collect_nowait(self, *args, **kwargs):
+        tracer = self._session.tracer
+        job = self._dataframe.collect_nowait(*args, **kwargs)
+        if not tracer.enabled:
+            return job
+        name, kind = statement_span(self._query)
+        span = tracer.start_span(name, kind, statement=" ".join(self._query.split())[:300])
+        return TracedAsyncJob(tracer, span, job)
+
+
+class _QueryIds:
+    def __init__(self, session):
+        """
+        Captures the ID of the last query this thread ran, from the session's query history when it has one.
+        """
+        self._history = None
+        if hasattr(session, 'query_history'):
+            try:
+                self._history = session.query_history(include_thread_id=True)
+            except Exception:
+                self._history = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        if self._history is not None:
+            self._history.__exit__(*exc_info)
+
+    def query_id(self):
+        if self._history is None:
+            return None
+        thread_id = threading.get_ident()
+        for record in reversed(self._history.queries):
+            if getattr(record, 'thread_id', thread_id) == thread_id:
+                return record.query_id
+        return None
+
+
+class TracedFileOperation:
+    def __init__(self, session, file_operation):
+        self._session = session
+        self._file = file_operation
+
+    def __getattr__(self, name):
+        return getattr(self._file, name)
+
+    def get_stream(self, stage_location, *args, **kwargs):
+        with self._session.tracer.span("stage.get_stream", 'stage', location=stage_location) as span:
+            stream = self._file.get_stream(stage_location, *args, **kwargs)
+            if span is not None and hasattr(stream, 'getbuffer'):
+                span.bytes = stream.getbuffer().nbytes
+        return stream
+
+    def put(self, local_file_name, stage_location, *args, **kwargs):
+        with self._session.tracer.span("stage.put", 'stage', location=stage_location) as span:
+            result = self._file.put(local_file_name, stage_location, *args, **kwargs)
+            if span is not None:
+                try:
+                    span.bytes = os.path.getsize(local_file_name)
+                except OSError:
+                    pass
+        return result
+
+
+class TracedSession:
+    def __init__(self, session, tracer):
+        """
+        Wraps a Snowpark session so every SQL statement, Cortex call and stage transfer is recorded as a span.
+        Everything else is delegated to the wrapped session.
+        """
+        self.session = session
+        self.tracer = tracer
+        self.file = TracedFileOperation(self, session.file)
+
+    def __getattr__(self, name):
+        return getattr(self.session, name)
+
+    def sql(self, query, *args, **kwargs):
+        return TracedQuery(self, self.session.sql(query, *args, **kwargs), query)
+
+    def query_ids(self):
+        return _QueryIds(self.session)
+
+
+def unwrap_session(session):
+    """
+    Returns the Snowpark session behind a TracedSession, for APIs that need the session object itself.
+    """
+    return session.session if isinstance(session, TracedSession) else session
+
+
+tracer = Tracer()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = tracer.prometheus_text().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(port, host="0.0.0.0"):
+    """
+    Serves the span metrics at http://host:port/metrics from a daemon thread.
+    """
+    try:
+        server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    except OSError:
+        logger.warning("Unable to serve metrics on port %s", port, exc_info=True)
+        return None
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
+
+
+@st.cache_resource(show_spinner=False)
+def get_tracer():
+    """
+    Configures the process-wide tracer from the tracing section of the config, once per server.
+    """
+    tracing_config = load_config().get('tracing', {})
+    tracer.enabled = tracing_config.get('enabled', True)
+    tracer.traces = deque(maxlen=tracing_config.get('max_traces', 100))
+    if tracing_config.get('log_json', False):
+        tracer.exporters.append(json_log_exporter)
+    if tracing_config.get('prometheus_port'):
+        start_metrics_server(tracing_config['prometheus_port'])
+    return tracer
+
+
+def render_trace_panel(trace):
+    """
+    Shows the spans of a trace in the sidebar, with the time spent per kind of operation.
+    """
+    if trace is None:
+        return
+    totals = {}
+    rows = []
+    for depth, span in trace.walk():
+        if not span.children and span.duration is not None:
+            totals[span.kind] = totals.get(span.kind, 0.0) + span.duration
+        rows.append({
+            'span': "\u2003" * depth + span.name,
+            'kind': span.kind,
+            'ms': None if span.duration is None else round(span.duration * 1000, 1),
+            'rows': span.rows,
+            'bytes': span.bytes,
+            'query id': span.query_id,
+        })
+
+    with st.sidebar.expander(f"Timings: {trace.duration * 1000:.0f} ms"):
+        st.caption(" · ".join(f"{kind} {seconds * 1000:.0f} ms" for kind, seconds in sorted(totals.items())))
+        st.dataframe(rows, hide_index=True)
+
+
+@contextmanager
+def traced_request(name):
+    """
+    Traces one run of a page, and shows its timings in the sidebar when tracing.sidebar_panel is set.
+    """
+    active_tracer = get_tracer()
+    with active_tracer.trace(name) as trace:
+        yield trace
+    if load_config().get('tracing', {}).get('sidebar_panel', False):
+        render_trace_panel(trace)
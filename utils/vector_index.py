@@ -0,0 +1,212 @@
+import json
+import threading
+
+import numpy as np
+
+
+def to_vector(value, dim=768):
+    """
+    Converts an embedding returned by Snowpark (VARIANT JSON string or VECTOR list) into a float32 array.
+    """
+    if isinstance(value, str):
+        value = json.loads(value)
+    vector = np.asarray(value, dtype=np.float32).reshape(-1)
+    if vector.shape[0] != dim:
+        raise ValueError(f"Expected an embedding of size {dim}, got {vector.shape[0]}")
+    return vector
+
+
+class VectorIndex:
+    def __init__(self, dim=768, n_probe=8, min_train_size=2048, retrain_growth=2.0, seed=42):
+        """
+        Initializes an in-process IVF (inverted file) index over normalized embeddings.
+
+        Below min_train_size vectors the index answers with an exact NumPy scan, which is already
+        a few milliseconds at that size. Above it, vectors are clustered with k-means and only the
+        n_probe closest clusters are scored per query.
+        """
+        self.dim = dim
+        self.n_probe = n_probe
+        self.min_train_size = min_train_size
+        self.retrain_growth = retrain_growth
+        self.seed = seed
+
+        self._lock = threading.RLock()
+        self._vectors = np.empty((0, dim), dtype=np.float32)
+        self._file_names = []
+        self._chunks = []
+        self._keys = []
+        self._rows = {}
+        self._file_rows = {}
+        self._centroids = None
+        self._lists = []
+        self._trained_size = 0
+
+    def __len__(self):
+        return len(self._file_names)
+
+    @staticmethod
+    def _normalize(vectors):
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+    @classmethod
+    def load_from_table(cls, session, table_name, **kwargs):
+        """
+        Builds the index from every row of the given vector store table.
+        """
+        index = cls(**kwargs)
+        rows = session.sql(f'SELECT "file_name", "chunks", VECTOR_EMBEDINGS, "chunk_index" FROM {table_name}').collect()
+        index.add(
+            [row["file_name"] for row in rows],
+            [row["chunks"] for row in rows],
+            [row["VECTOR_EMBEDINGS"] for row in rows],
+            [row["chunk_index"] for row in rows],
+        )
+        return index
+
+    def add(self, file_names, chunks, embeddings, chunk_indexes=None):
+        """
+        Adds rows to the index. Embeddings may be arrays, lists or JSON strings.
+        chunk_indexes key the rows by (file_name, chunk_index) for restricted searches.
+        """
+        file_names = list(file_names)
+        chunks = list(chunks)
+        if not file_names:
+            return
+        chunk_indexes = list(chunk_indexes) if chunk_indexes is not None else [None] * len(file_names)
+        vectors = np.vstack([to_vector(value, self.dim) for value in embeddings])
+        vectors = self._normalize(vectors)
+
+        with self._lock:
+            start = len(self._file_names)
+            self._vectors = np.vstack([self._vectors, vectors])
+            self._file_names.extend(file_names)
+            self._chunks.extend(chunks)
+            self._keys.extend(zip(file_names, chunk_indexes))
+            self._index_keys(start)
+
+            if self._needs_training():
+                self._train()
+            elif self._centroids is not None:
+                self._assign(np.arange(start, len(self._file_names)))
+
+    def remove_file(self, file_name):
+        """
+        Drops every row belonging to file_name.
+        """
+        self.remove_files([file_name])
+
+    def remove_files(self, file_names):
+        """
+        Drops every row belonging to any of file_names in a single pass. Rows are taken out of their clusters,
+        which are only retrained once the index has shrunk by retrain_growth since it was last trained.
+        """
+        file_names = set(file_names)
+        with self._lock:
+            keep = [i for i, name in enumerate(self._file_names) if name not in file_names]
+            if len(keep) == len(self._file_names):
+                return
+            new_ids = np.full(len(self._file_names), -1, dtype=np.int64)
+            new_ids[keep] = np.arange(len(keep))
+
+            self._vectors = self._vectors[keep]
+            self._file_names = [self._file_names[i] for i in keep]
+            self._chunks = [self._chunks[i] for i in keep]
+            self._keys = [self._keys[i] for i in keep]
+            self._rows = {}
+            self._file_rows = {}
+            self._index_keys(0)
+
+            size = len(self._file_names)
+            if self._centroids is not None and size < self.min_train_size:
+                self._centroids = None
+                self._lists = []
+                self._trained_size = 0
+            elif self._centroids is not None and size * self.retrain_growth <= self._trained_size:
+                self._train()
+            elif self._centroids is not None:
+                self._lists = [[int(new_ids[row_id]) for row_id in rows if new_ids[row_id] >= 0]
+                               for rows in self._lists]
+            elif self._needs_training():
+                self._train()
+
+    def _index_keys(self, start):
+        for row_id in range(start, len(self._keys)):
+            self._file_rows.setdefault(self._keys[row_id][0], []).append(row_id)
+            if self._keys[row_id][1] is not None:
+                self._rows[self._keys[row_id]] = row_id
+
+    def _needs_training(self):
+        size = len(self._file_names)
+        if size < self.min_train_size:
+            return False
+        return self._centroids is None or size >= self._trained_size * self.retrain_growth
+
+    def _train(self, iterations=10):
+        """
+        Clusters the current vectors with spherical k-means (about sqrt(n) clusters).
+        """
+        size = len(self._file_names)
+        n_lists = max(1, int(np.sqrt(size)))
+        rng = np.random.default_rng(self.seed)
+        centroids = self._vectors[rng.choice(size, n_lists, replace=False)]
+
+        for _ in range(iterations):
+            assignment = np.argmax(self._vectors @ centroids.T, axis=1)
+            for c in range(n_lists):
+                members = self._vectors[assignment == c]
+                if len(members):
+                    centroids[c] = members.mean(axis=0)
+            centroids = self._normalize(centroids)
+
+        self._centroids = centroids
+        self._lists = [[] for _ in range(n_lists)]
+        self._assign(np.arange(size))
+        self._trained_size = size
+
+    def _assign(self, row_ids):
+        assignment = np.argmax(self._vectors[row_ids] @ self._centroids.T, axis=1)
+        for row_id, c in zip(row_ids, assignment):
+            self._lists[c].append(int(row_id))
+
+    def search(self, query, k=1, return_vectors=False, restrict_to=None, file_names=None):
+        """
+        Returns up to k (similarity, file_name, chunks) tuples ordered by cosine similarity.
+        With return_vectors=True each tuple also carries the normalized embedding of the chunk.
+        restrict_to limits scoring to the given (file_name, chunk_index) keys, e.g. lexical prefilter candidates,
+        and file_names to the rows of the given files.
+        """
+        query = self._normalize(to_vector(query, self.dim).reshape(1, -1))[0]
+
+        with self._lock:
+            if not self._file_names:
+                return []
+
+            if restrict_to is not None:
+                candidates = np.fromiter(
+                    (self._rows[key] for key in restrict_to if key in self._rows), dtype=np.int64)
+            elif file_names is not None:
+                candidates = np.fromiter(
+                    (row_id for name in file_names for row_id in self._file_rows.get(name, ())), dtype=np.int64)
+            elif self._centroids is None:
+                candidates = np.arange(len(self._file_names))
+            else:
+                probes = np.argsort(-(self._centroids @ query))[:self.n_probe]
+                candidates = np.fromiter(
+                    (row_id for c in probes for row_id in self._lists[c]), dtype=np.int64)
+
+            if not len(candidates):
+                return []
+
+            scores = self._vectors[candidates] @ query
+            k = min(k, len(candidates))
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+
+            if return_vectors:
+                return [(float(scores[i]), self._file_names[candidates[i]], self._chunks[candidates[i]],
+                         self._vectors[candidates[i]]) for i in top]
+            return [(float(scores[i]), self._file_names[candidates[i]], self._chunks[candidates[i]])
+                    for i in top]